@@ -11,10 +11,17 @@ import '../models/mail_item.dart';
 /// Firebase Structure:
 /// - mailbox/global/mails/{mailId} - Thu gui cho tat ca user
 /// - mailbox/users/{mssv}/mails/{mailId} - Thu gui cho user cu the
+/// - mailbox/audience/mails/{docId} - Thu theo nhom, luu 1 lan cho ca nhom.
+///   Field `audience` chua 'mssv:<MSSV>' hoac 'prefix:<tien to MSSV>',
+///   1 thu co the chia nhieu document cung `mail_id`
+/// - mail_bodies/{hash} - Tieu de + noi dung dung chung. Thu rieng co
+///   `body_ref` chi luu hash, app tai noi dung 1 lan va cache local theo hash
 class MailboxService extends GetxService {
   static const String _storageKey = 'mailbox_data';
   static const String _claimedKey = 'claimed_mail_ids';
   static const String _deletedKey = 'deleted_mail_ids';
+  static const String _bodiesKey = 'mail_bodies';
+  static const int _maxCachedBodies = 50;
   
   final StorageService _storage = Get.find<StorageService>();
   final GameService _gameService = Get.find<GameService>();
@@ -398,6 +405,20 @@ class MailboxService extends GetxService {
         newMails.add(mail.copyWith(isClaimed: isClaimed));
       }
 
+      // 3. Lay thu theo nhom co chua user nay (1 query)
+      debugPrint('[Mailbox] Fetching audience mails...');
+      final audienceMails = await _fetchAudienceMails(_mssv);
+      debugPrint('[Mailbox] Got ${audienceMails.length} audience mails');
+
+      for (var mail in audienceMails) {
+        if (deletedIds.contains(mail.id)) continue;
+        if (mails.any((m) => m.id == mail.id)) continue;
+        if (newMails.any((m) => m.id == mail.id)) continue;
+
+        final isClaimed = claimedIds.contains(mail.id);
+        newMails.add(mail.copyWith(isClaimed: isClaimed));
+      }
+
       // Them thu moi vao danh sach
       if (newMails.isNotEmpty) {
         for (var mail in newMails) {
@@ -454,8 +475,21 @@ class MailboxService extends GetxService {
       
       debugPrint('Fetched ${snapshot.docs.length} user mails from Firebase');
 
+      final bodies = await _resolveMailBodies(
+        snapshot.docs.map((doc) => doc.data()['body_ref']).whereType<String>().toSet(),
+      );
+
       return snapshot.docs
-          .map((doc) => _parseFirebaseMail(doc.id, doc.data()))
+          .map((doc) {
+            final data = doc.data();
+            final bodyRef = data['body_ref'];
+            if (bodyRef is! String) return _parseFirebaseMail(doc.id, data);
+            // Chua tai duoc noi dung => bo qua, lan sync sau thu lai
+            final body = bodies[bodyRef];
+            if (body == null) return null;
+            // Field rieng cua thu (vd: title ca nhan hoa) uu tien hon noi dung chung
+            return _parseFirebaseMail(doc.id, {...body, ...data});
+          })
           .where((m) => m != null && !m.isExpired)
           .cast<MailItem>()
           .toList();
@@ -465,6 +499,93 @@ class MailboxService extends GetxService {
     }
   }
 
+  /// Lay noi dung thu dung chung (mail_bodies/{hash}), uu tien cache local
+  ///
+  /// Noi dung dinh danh theo hash nen khong bao gio doi => cache khong can
+  /// kiem tra lai, chi giu [_maxCachedBodies] hash moi nhat
+  Future<Map<String, Map<String, dynamic>>> _resolveMailBodies(Set<String> hashes) async {
+    if (hashes.isEmpty) return {};
+
+    final data = _storage.getData(StorageKey.notifications) ?? {};
+    final cached = Map<String, dynamic>.from(data[_bodiesKey] as Map? ?? {});
+    final result = <String, Map<String, dynamic>>{};
+    final missing = <String>[];
+    for (var hash in hashes) {
+      final body = cached[hash];
+      if (body is Map) {
+        result[hash] = Map<String, dynamic>.from(body);
+      } else {
+        missing.add(hash);
+      }
+    }
+    if (missing.isEmpty) return result;
+
+    try {
+      // whereIn toi da 30 gia tri moi query
+      for (var i = 0; i < missing.length; i += 30) {
+        final snapshot = await _firestore
+            .collection('mail_bodies')
+            .where(FieldPath.documentId, whereIn: missing.skip(i).take(30).toList())
+            .get();
+        for (var doc in snapshot.docs) {
+          final body = {
+            'title': doc.data()['title']?.toString() ?? '',
+            'content': doc.data()['content']?.toString() ?? '',
+          };
+          result[doc.id] = body;
+          cached.remove(doc.id);
+          cached[doc.id] = body;
+        }
+      }
+    } catch (e) {
+      debugPrint('Error fetching mail bodies: $e');
+    }
+
+    while (cached.length > _maxCachedBodies) {
+      cached.remove(cached.keys.first);
+    }
+    data[_bodiesKey] = cached;
+    await _storage.saveData(StorageKey.notifications, data);
+    return result;
+  }
+
+  /// Khoa audience ma user thuoc ve: 'mssv:<mssv>' va moi tien to cua MSSV
+  /// (MSSV toi da 20 ky tu => <= 21 khoa, duoi gioi han 30 cua arrayContainsAny)
+  static List<String> _audienceKeys(String mssv) {
+    return [
+      'mssv:$mssv',
+      for (var i = 1; i <= mssv.length; i++) 'prefix:${mssv.substring(0, i)}',
+    ];
+  }
+
+  /// Lay thu theo nhom (mailbox/audience/mails) co chua user nay
+  /// Sap xep sent_at giam dan de limit(50) luon lay 50 thu moi nhat
+  /// (can composite index: audience array-contains + sent_at desc)
+  Future<List<MailItem>> _fetchAudienceMails(String mssv) async {
+    try {
+      final snapshot = await _firestore
+          .collection('mailbox')
+          .doc('audience')
+          .collection('mails')
+          .where('audience', arrayContainsAny: _audienceKeys(mssv))
+          .orderBy('sent_at', descending: true)
+          .limit(50)
+          .get();
+
+      debugPrint('Fetched ${snapshot.docs.length} audience mails from Firebase');
+
+      return snapshot.docs
+          // Cac document cua cung 1 thu dung chung mail_id
+          .map((doc) => _parseFirebaseMail(doc.data()['mail_id']?.toString() ?? doc.id, doc.data()))
+          .where((m) => m != null && !m.isExpired)
+          .cast<MailItem>()
+          .toList();
+    } catch (e) {
+      debugPrint('Error fetching audience mails: $e');
+      return [];
+    }
+  }
+
   /// Parse mail tu Firebase document
   MailItem? _parseFirebaseMail(String docId, Map<String, dynamic> data) {
     try {
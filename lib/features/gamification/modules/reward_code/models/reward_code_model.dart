@@ -9,6 +9,7 @@ class RewardCode {
   final RewardCodeReward reward;
   final int maxClaims; // 0 = unlimited
   final int currentClaims;
+  final int shardCount; // 0 = không chia shard (xem RewardCodeService)
   final bool isActive;
 
   const RewardCode({
@@ -20,6 +21,7 @@ class RewardCode {
     required this.reward,
     this.maxClaims = 0,
     this.currentClaims = 0,
+    this.shardCount = 0,
     this.isActive = true,
   });
 
@@ -51,6 +53,7 @@ class RewardCode {
           : const RewardCodeReward(),
       maxClaims: _parseInt(json['max_claims']),
       currentClaims: _parseInt(json['current_claims']),
+      shardCount: _parseInt(json['shard_count']),
       isActive: json['is_active'] != false,
     );
   }
@@ -64,6 +67,7 @@ class RewardCode {
     'reward': reward.toJson(),
     'max_claims': maxClaims,
     'current_claims': currentClaims,
+    'shard_count': shardCount,
     'is_active': isActive,
   };
 
@@ -3,6 +3,7 @@ library;
 
 export 'models/reward_code_model.dart';
 export 'services/reward_code_service.dart';
+export 'utils/reward_code_format.dart';
 export 'controllers/reward_code_controller.dart';
 export 'bindings/reward_code_binding.dart';
 export 'views/reward_code_view.dart';
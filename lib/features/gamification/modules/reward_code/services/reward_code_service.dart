@@ -1,3 +1,5 @@
+import 'dart:math';
+
 import 'package:cloud_firestore/cloud_firestore.dart';
 import 'package:flutter/foundation.dart';
 import 'package:get/get.dart';
@@ -5,15 +7,20 @@ import '../../../../../infrastructure/storage/storage_service.dart';
 import '../../../../../features/gamification/core/game_service.dart';
 import '../../../../../features/auth/data/auth_service.dart';
 import '../models/reward_code_model.dart';
+import '../utils/reward_code_format.dart';
 
 /// Service quản lý mã thưởng
 /// 
 /// Firebase Structure:
 /// - reward_codes/{code} - Thông tin mã thưởng
+/// - reward_codes/{code}/claim_shards/{i} - Bộ đếm lượt nhận của mã chia shard
 /// - reward_codes_claimed/{mssv}/codes/{code} - Mã đã nhận của user
 class RewardCodeService extends GetxService {
   static const String _storageKey = 'reward_code_data';
   static const String _claimedKey = 'claimed_codes';
+  static const String _shardCollection = 'claim_shards';
+  
+  final Random _random = Random();
   
   final StorageService _storage = Get.find<StorageService>();
   final GameService _gameService = Get.find<GameService>();
@@ -65,12 +72,19 @@ class RewardCodeService extends GetxService {
       return (false, 'Vui lòng đăng nhập để nhập mã', null);
     }
 
-    final normalizedCode = code.trim().toUpperCase();
+    final input = code.replaceAll(RegExp(r'\s'), '').toUpperCase();
     
-    if (normalizedCode.isEmpty) {
+    if (input.isEmpty) {
       return (false, 'Vui lòng nhập mã thưởng', null);
     }
 
+    // Mã có ký tự kiểm tra bị gõ sai => từ chối ngay, không tốn lượt đọc
+    final formatted = RewardCodeFormat.normalize(input);
+    if (formatted == null) {
+      return (false, 'Mã không hợp lệ, vui lòng kiểm tra lại', null);
+    }
+    var normalizedCode = formatted;
+
     // Kiểm tra đã nhận chưa (local)
     if (isCodeClaimed(normalizedCode)) {
       return (false, 'Bạn đã nhận mã này rồi', null);
@@ -80,11 +94,23 @@ class RewardCodeService extends GetxService {
     
     try {
       // 1. Kiểm tra mã trên Firebase
-      final codeDoc = await _firestore
+      var codeDoc = await _firestore
           .collection('reward_codes')
           .doc(normalizedCode)
           .get();
 
+      // Mã kiểu cũ vô tình có dạng hợp lệ khi bỏ gạch => thử đúng mã đã nhập
+      if (!codeDoc.exists && normalizedCode != input) {
+        normalizedCode = input;
+        if (isCodeClaimed(normalizedCode)) {
+          return (false, 'Bạn đã nhận mã này rồi', null);
+        }
+        codeDoc = await _firestore
+            .collection('reward_codes')
+            .doc(normalizedCode)
+            .get();
+      }
+
       if (!codeDoc.exists) {
         return (false, 'Mã không tồn tại', null);
       }
@@ -127,25 +153,12 @@ class RewardCodeService extends GetxService {
       }
 
       // 4. Thực hiện nhận mã (transaction)
-      await _firestore.runTransaction((transaction) async {
-        // Đánh dấu user đã nhận
-        final claimedRef = _firestore
-            .collection('reward_codes_claimed')
-            .doc(_mssv)
-            .collection('codes')
-            .doc(normalizedCode);
-        
-        transaction.set(claimedRef, {
-          'claimed_at': FieldValue.serverTimestamp(),
-          'reward': rewardCode.reward.toJson(),
-        });
-
-        // Tăng số lượt đã nhận
-        final codeRef = _firestore.collection('reward_codes').doc(normalizedCode);
-        transaction.update(codeRef, {
-          'current_claims': FieldValue.increment(1),
-        });
-      });
+      final claimed = rewardCode.shardCount > 0
+          ? await _claimOnShard(normalizedCode, rewardCode)
+          : await _claimOnCode(normalizedCode, rewardCode);
+      if (!claimed) {
+        return (false, 'Mã đã hết lượt sử dụng', null);
+      }
 
       // 5. Cộng phần thưởng vào game
       final reward = rewardCode.reward;
@@ -172,6 +185,72 @@ class RewardCodeService extends GetxService {
     }
   }
 
+  /// Document đánh dấu user đã nhận mã
+  DocumentReference<Map<String, dynamic>> _claimedRef(String code) {
+    return _firestore
+        .collection('reward_codes_claimed')
+        .doc(_mssv)
+        .collection('codes')
+        .doc(code);
+  }
+
+  Map<String, dynamic> _claimedData(String code, RewardCode rewardCode) => {
+    // Lưu mã để admin đếm lượt nhận theo từng mã (collection group query)
+    'code': code,
+    'claimed_at': FieldValue.serverTimestamp(),
+    'reward': rewardCode.reward.toJson(),
+  };
+
+  /// Nhận mã thường: tăng current_claims của document mã
+  Future<bool> _claimOnCode(String code, RewardCode rewardCode) async {
+    await _firestore.runTransaction((transaction) async {
+      // Đánh dấu user đã nhận
+      transaction.set(_claimedRef(code), _claimedData(code, rewardCode));
+
+      // Tăng số lượt đã nhận
+      final codeRef = _firestore.collection('reward_codes').doc(code);
+      transaction.update(codeRef, {
+        'current_claims': FieldValue.increment(1),
+        'updated_at': FieldValue.serverTimestamp(),
+      });
+    });
+    return true;
+  }
+
+  /// Nhận mã chia shard: tăng `count` của 1 shard ngẫu nhiên thay vì
+  /// current_claims của document mã, để mã "hot" không bị tranh chấp ghi.
+  /// Shard đã đủ `limit` thì thử shard khác.
+  /// Cố ý không ghi `updated_at` của document mã (sẽ tranh chấp ghi trở lại):
+  /// cache của script quản trị không thấy lượt nhận trên shard, tổng lượt
+  /// nhận phải tính bằng claim_totals (cộng shard).
+  /// Returns: false nếu mọi shard đã hết lượt
+  Future<bool> _claimOnShard(String code, RewardCode rewardCode) async {
+    final shards = _firestore
+        .collection('reward_codes')
+        .doc(code)
+        .collection(_shardCollection);
+    final order = List.generate(rewardCode.shardCount, (i) => i)..shuffle(_random);
+
+    for (final index in order) {
+      final shardRef = shards.doc('$index');
+      final claimed = await _firestore.runTransaction<bool>((transaction) async {
+        final shard = await transaction.get(shardRef);
+        if (!shard.exists) return false;
+
+        final data = shard.data()!;
+        final count = (data['count'] as num?)?.toInt() ?? 0;
+        final limit = (data['limit'] as num?)?.toInt(); // null = không giới hạn
+        if (limit != null && count >= limit) return false;
+
+        transaction.set(_claimedRef(code), _claimedData(code, rewardCode));
+        transaction.update(shardRef, {'count': FieldValue.increment(1)});
+        return true;
+      });
+      if (claimed) return true;
+    }
+    return false;
+  }
+
   /// Parse reward code từ Firebase document
   RewardCode _parseRewardCode(String code, Map<String, dynamic> data) {
     // Parse created_at
@@ -214,6 +293,7 @@ class RewardCodeService extends GetxService {
       reward: reward,
       maxClaims: (data['max_claims'] as num?)?.toInt() ?? 0,
       currentClaims: (data['current_claims'] as num?)?.toInt() ?? 0,
+      shardCount: (data['shard_count'] as num?)?.toInt() ?? 0,
       isActive: data['is_active'] != false,
     );
   }
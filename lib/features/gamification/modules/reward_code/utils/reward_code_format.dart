@@ -0,0 +1,80 @@
+/// Định dạng mã thưởng có ký tự kiểm tra: [TIỀN TỐ-]XXXXX-XXXXX
+///
+/// Cùng thuật toán với scripts/reward_code_format.py (script tạo mã):
+/// - Bảng chữ Crockford Base32 (bỏ I, L, O, U), khi nhập O = 0, I/L = 1
+/// - 9 ký tự ngẫu nhiên + 1 ký tự kiểm tra Luhn mod 32
+/// - Tiền tố tùy chọn (A-Z, 0-9, tối đa 10 ký tự), không nằm trong phần kiểm tra
+///
+/// Mã gõ sai bị từ chối ngay trên máy, không tốn lượt đọc Firestore.
+/// Mã kiểu cũ (A-Z0-9, không gạch) vẫn dùng được bình thường.
+class RewardCodeFormat {
+  static const String alphabet = '0123456789ABCDEFGHJKMNPQRSTVWXYZ';
+  static const int bodyLength = 10;
+  static const int groupLength = 5;
+
+  static final RegExp _prefixPattern = RegExp(r'^[A-Z0-9]{1,10}$');
+  static const Map<String, String> _aliases = {'O': '0', 'I': '1', 'L': '1'};
+
+  /// Chuẩn hóa mã người dùng nhập
+  /// - Dạng [TIỀN TỐ-]XXXXX-XXXXX: sai ký tự kiểm tra => null
+  /// - Không gạch nhưng 10 ký tự cuối là thân mã hợp lệ => dạng chuẩn có gạch
+  /// - Còn lại: mã kiểu cũ, chỉ viết hoa
+  static String? normalize(String input) {
+    final code = input.replaceAll(RegExp(r'\s'), '').toUpperCase();
+    if (code.isEmpty) return null;
+
+    final parts = code.split('-');
+    if ((parts.length == 2 || parts.length == 3) &&
+        parts[parts.length - 2].length == groupLength &&
+        parts.last.length == groupLength) {
+      final prefix = parts.length == 3 ? parts.first : null;
+      final body = _unalias(parts[parts.length - 2] + parts.last);
+      if (prefix != null && !_prefixPattern.hasMatch(prefix)) return null;
+      return isValidBody(body) ? format(body, prefix) : null;
+    }
+
+    if (!code.contains('-') && code.length >= bodyLength) {
+      final prefix = code.substring(0, code.length - bodyLength);
+      final body = _unalias(code.substring(code.length - bodyLength));
+      if ((prefix.isEmpty || _prefixPattern.hasMatch(prefix)) && isValidBody(body)) {
+        return format(body, prefix.isEmpty ? null : prefix);
+      }
+    }
+    return code;
+  }
+
+  /// Thân mã (10 ký tự, không gạch) có ký tự kiểm tra đúng không
+  static bool isValidBody(String body) {
+    if (body.length != bodyLength) return false;
+    final values = body.split('').map(alphabet.indexOf).toList();
+    if (values.contains(-1)) return false;
+    return _luhnSum(values, doubleFirst: false) % alphabet.length == 0;
+  }
+
+  /// Dạng chuẩn: [TIỀN TỐ-]XXXXX-XXXXX
+  static String format(String body, [String? prefix]) {
+    final groups = <String>[
+      if (prefix != null) prefix,
+      for (var i = 0; i < body.length; i += groupLength)
+        body.substring(i, i + groupLength),
+    ];
+    return groups.join('-');
+  }
+
+  static String _unalias(String body) {
+    return body.split('').map((ch) => _aliases[ch] ?? ch).join();
+  }
+
+  /// Tổng Luhn mod 32, duyệt từ phải sang trái
+  static int _luhnSum(List<int> values, {required bool doubleFirst}) {
+    final n = alphabet.length;
+    var total = 0;
+    var doubled = doubleFirst;
+    for (final value in values.reversed) {
+      final addend = doubled ? value * 2 : value;
+      total += addend ~/ n + addend % n;
+      doubled = !doubled;
+    }
+    return total;
+  }
+}
@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+Chế độ service: giữ 1 Firestore client "nóng", nhận lệnh qua HTTP cục bộ
+
+Mỗi lần chạy send_mail.py / create_reward_code.py phải import firebase_admin,
+đọc service account và mở kênh gRPC trước khi ghi được gì. Service làm việc
+đó 1 lần rồi phục vụ các lệnh nhỏ (bot hỗ trợ, cron) qua HTTP trên
+127.0.0.1 hoặc Unix socket:
+
+    GET  /health                  Trạng thái + số thư đang chờ gộp
+    GET  /metrics                 Tóm tắt đo đạc Firestore (instrumentation.py)
+    POST /mail/user               {mssv, title, content, coins, shared_body?, ...} - được gộp batch
+    POST /mail/users              {mssv_list, title, shared_body?, ...} - gửi hàng loạt
+    POST /mail/global             {title, content, idempotent?, ...}
+    POST /codes                   {code?, title, coins, max_claims, shards, idempotent?, ...}
+    POST /codes/bulk              {count, title, coins, prefix, ...}
+    POST /codes/deactivate        {code}
+    POST /codes/delete            {code}
+
+Thư gửi 1 user được đưa vào hàng đợi; SendCoalescer gom các thư đến trong
+vòng COALESCE_WAIT giây (tối đa COALESCE_MAX thư) thành 1 batch commit, mỗi
+request vẫn nhận kết quả riêng. Batch gộp lỗi thì từng thư được commit lại
+riêng, chỉ thư thật sự lỗi mới trả lỗi. Hàng đợi đầy => 503.
+
+Sử dụng: python admin_service.py [--port 8787 | --unix /tmp/tvu_admin.sock]
+         FIRESTORE_EMULATOR_HOST=localhost:8080 python admin_service.py  (chạy với emulator)
+         curl -X POST localhost:8787/mail/user -d '{"mssv": "110122001", "title": "Xin chào"}'
+"""
+
+import argparse
+import json
+import os
+import queue
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import create_reward_code
+import send_mail
+from fanout import fan_out
+from instrumentation import METRICS, instrument
+from mail_compaction import add_to_index, index_update
+from recipients import is_valid_mssv
+from retry import with_retry
+
+# ============ CẤU HÌNH ============
+HOST = "127.0.0.1"  # Chỉ nghe trên máy cục bộ
+PORT = 8787
+COALESCE_MAX = 250  # Số thư tối đa gộp vào 1 batch (mỗi thư 2 thao tác: thư + index, giới hạn 500)
+COALESCE_WAIT = 0.05  # Số giây chờ thêm thư trước khi commit batch
+FALLBACK_IN_FLIGHT = 8  # Số thư commit lẻ song song khi batch gộp bị lỗi
+QUEUE_LIMIT = 5000  # Số thư chờ tối đa, vượt => 503
+REQUEST_TIMEOUT = 30  # Số giây tối đa 1 request chờ batch của nó commit
+MAX_BODY = 10 * 1024 * 1024  # Kích thước body tối đa (byte)
+LISTEN_BACKLOG = 128  # Số kết nối chờ accept (mặc định của socketserver chỉ là 5)
+EMULATOR_PROJECT = "demo-tvuapp"  # Project id khi chạy với emulator
+# ==================================
+
+MAIL_TYPE_VALUES = {value for value, _ in send_mail.MAIL_TYPES.values()}
+
+
+class ServiceError(Exception):
+    """Lỗi trả về cho client kèm HTTP status"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def connect():
+    """Firestore client (emulator nếu có FIRESTORE_EMULATOR_HOST), có đo đạc"""
+    if os.environ.get('FIRESTORE_EMULATOR_HOST'):
+        from google.cloud import firestore as gcloud_firestore
+        return instrument(gcloud_firestore.Client(project=os.environ.get('GCLOUD_PROJECT', EMULATOR_PROJECT)))
+    return send_mail.init_firebase()
+
+
+class SendCoalescer:
+    """Gom các thư gửi 1 user thành batch, mỗi thư có Future riêng"""
+
+    def __init__(self, db, max_batch: int = COALESCE_MAX, max_wait: float = COALESCE_WAIT,
+                 limit: int = QUEUE_LIMIT):
+        self.db = db
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.mails = 0
+        self._queue = queue.Queue(maxsize=limit)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="send-coalescer", daemon=True)
+        self._thread.start()
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, mssv: str, mail_id: str, data: dict) -> Future:
+        if self._closed:
+            raise ServiceError(503, "Service đang dừng")
+        future = Future()
+        try:
+            self._queue.put_nowait((mssv, mail_id, data, future))
+        except queue.Full:
+            raise ServiceError(503, "Hàng đợi gửi thư đầy, thử lại sau")
+        return future
+
+    def _collect(self):
+        """Lấy 1 thư (chờ), rồi gom thêm trong max_wait giây; None = đã đóng"""
+        item = self._queue.get()
+        if item is None:
+            return None
+        items = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # Để vòng sau thoát
+                break
+            items.append(item)
+        return items
+
+    def _commit(self, items):
+        batch = self.db.batch()
+        earliest = {}
+        for mssv, mail_id, data, _ in items:
+            batch.set(send_mail._user_mail_ref(self.db, mssv, mail_id), data)
+            earliest[mssv] = min(data['expires_at'], earliest.get(mssv, data['expires_at']))
+        # Nhiều thư cùng 1 user => chỉ 1 lần cập nhật index
+        for mssv, expires_at in earliest.items():
+            add_to_index(batch, self.db, mssv, index_update(expires_at))
+        with_retry(batch.commit)
+
+    def _commit_each(self, items):
+        """Batch gộp lỗi: commit lại từng thư để 1 thư lỗi không kéo cả batch lỗi theo"""
+        def report(_, item, error):
+            future = item[0][3]
+            if error is not None:
+                future.set_exception(error)
+                return
+            self.mails += 1
+            future.set_result(item[0][1])
+
+        fan_out(((index, [item]) for index, item in enumerate(items)), self._commit,
+                max_in_flight=FALLBACK_IN_FLIGHT, max_error_rate=1.0, on_done=report)
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            if items is None:
+                return
+            try:
+                self._commit(items)
+            except Exception as e:
+                if len(items) > 1:
+                    self._commit_each(items)
+                else:
+                    items[0][3].set_exception(e)
+                continue
+            self.batches += 1
+            self.mails += len(items)
+            for _, mail_id, _, future in items:
+                future.set_result(mail_id)
+
+    def close(self):
+        """Ngừng nhận thư mới, commit nốt các thư đang chờ"""
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+
+def _int(body, key, default=0):
+    value = body.get(key, default)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ServiceError(400, f"'{key}' phải là số nguyên không âm")
+    return value
+
+
+def _mail_args(body):
+    mail_type = body.get('mail_type', 'system')
+    if mail_type not in MAIL_TYPE_VALUES:
+        raise ServiceError(400, f"'mail_type' phải là một trong {sorted(MAIL_TYPE_VALUES)}")
+    return {
+        'title': str(body.get('title', "Thông báo")),
+        'content': str(body.get('content', "")),
+        'mail_type': mail_type,
+        'coins': _int(body, 'coins'),
+        'diamonds': _int(body, 'diamonds'),
+        'xp': _int(body, 'xp'),
+        'expires_days': _int(body, 'expires_days', 30),
+    }
+
+
+def _code_args(body):
+    return {
+        'title': str(body.get('title', "Mã thưởng")),
+        'description': str(body.get('description', "Nhập mã để nhận quà")),
+        'coins': _int(body, 'coins'),
+        'diamonds': _int(body, 'diamonds'),
+        'xp': _int(body, 'xp'),
+        'expires_days': _int(body, 'expires_days', None),
+    }
+
+
+class AdminService:
+    """Các thao tác quản trị dùng chung 1 client"""
+
+    def __init__(self, db, coalescer: SendCoalescer = None):
+        self.db = db
+        self.coalescer = coalescer or SendCoalescer(db)
+        self.started = time.time()
+        self._bodies = {}  # (title, content) => hash trong mail_bodies đã lưu
+        self._bodies_lock = threading.Lock()  # Handler chạy trên nhiều thread của HTTP server
+        self.routes = {
+            ('GET', '/health'): self.health,
+            ('GET', '/metrics'): self.metrics,
+            ('POST', '/mail/user'): self.mail_user,
+            ('POST', '/mail/users'): self.mail_users,
+            ('POST', '/mail/global'): self.mail_global,
+            ('POST', '/codes'): self.codes_create,
+            ('POST', '/codes/bulk'): self.codes_bulk,
+            ('POST', '/codes/deactivate'): self.codes_deactivate,
+            ('POST', '/codes/delete'): self.codes_delete,
+        }
+
+    def handle(self, method: str, path: str, body: dict):
+        handler = self.routes.get((method, path.rstrip('/') or '/'))
+        if handler is None:
+            raise ServiceError(404, f"Không có {method} {path}")
+        return handler(body)
+
+    def close(self):
+        self.coalescer.close()
+
+    # ----- handlers -----
+
+    def health(self, body):
+        return {
+            'ok': True,
+            'uptime': round(time.time() - self.started, 1),
+            'queued_mails': self.coalescer.pending(),
+            'coalesced_batches': self.coalescer.batches,
+            'coalesced_mails': self.coalescer.mails,
+        }
+
+    def metrics(self, body):
+        return METRICS.summary()
+
+    def mail_user(self, body):
+        mssv = str(body.get('mssv', '')).strip()
+        if not is_valid_mssv(mssv):
+            raise ServiceError(400, "'mssv' không hợp lệ")
+        args = _mail_args(body)
+        body_ref = None
+        if body.get('shared_body'):
+            key = (args['title'], args['content'])
+            with self._bodies_lock:
+                if key not in self._bodies:
+                    self._bodies[key] = send_mail.store_mail_body(self.db, *key)
+                body_ref = self._bodies[key]
+        data = send_mail._build_mail_data(
+            args['title'], args['content'], args['mail_type'],
+            args['coins'], args['diamonds'], args['xp'], args['expires_days'], body_ref,
+        )
+        mail_id = body.get('mail_id') or send_mail.generate_mail_id()
+        future = self.coalescer.submit(mssv, mail_id, data)
+        try:
+            return {'mail_id': future.result(timeout=REQUEST_TIMEOUT), 'mssv': mssv}
+        except FutureTimeout:
+            raise ServiceError(504, "Quá thời gian chờ commit, thư có thể vẫn được gửi")
+
+    def mail_users(self, body):
+        mssv_list = body.get('mssv_list')
+        if not isinstance(mssv_list, list) or not mssv_list:
+            raise ServiceError(400, "'mssv_list' phải là list MSSV")
+        from recipients import clean_recipients
+        success = send_mail.send_mail_to_multiple_users(
+            self.db, list(clean_recipients(map(str, mssv_list))),
+            campaign_id=body.get('campaign_id'), shared_body=bool(body.get('shared_body')), **_mail_args(body),
+        )
+        return {'sent': success}
+
+    def mail_global(self, body):
+        mail_id = send_mail.send_global_mail(
+            self.db, body.get('mail_id'), **_mail_args(body), idempotent=bool(body.get('idempotent')),
+        )
+        if mail_id is None:
+            raise ServiceError(409, "Mail ID đã tồn tại")
+        return {'mail_id': mail_id}
+
+    def codes_create(self, body):
+        code = create_reward_code.create_reward_code(
+            self.db, body.get('code'), **_code_args(body),
+            max_claims=_int(body, 'max_claims'), shards=_int(body, 'shards'),
+            idempotent=bool(body.get('idempotent')) and bool(body.get('code')),
+        )
+        if code is None:
+            raise ServiceError(409, "Mã đã tồn tại hoặc sai định dạng")
+        return {'code': code}
+
+    def codes_bulk(self, body):
+        count = _int(body, 'count')
+        if not count:
+            raise ServiceError(400, "'count' phải lớn hơn 0")
+        try:
+            codes = create_reward_code.create_reward_codes_bulk(
+                self.db, count, **_code_args(body),
+                max_claims=_int(body, 'max_claims', 1), prefix=body.get('prefix'),
+                output_path=os.devnull,
+            )
+        except ValueError as e:
+            raise ServiceError(400, str(e))
+        return {'codes': codes}
+
+    def _retire(self, body, retire):
+        code = str(body.get('code', '')).strip()
+        if not code:
+            raise ServiceError(400, "Thiếu 'code'")
+        if not retire(self.db, code):
+            raise ServiceError(404, f"Mã '{code}' không tồn tại")
+        return {'code': code}
+
+    def codes_deactivate(self, body):
+        return self._retire(body, create_reward_code.deactivate_code)
+
+    def codes_delete(self, body):
+        return self._retire(body, create_reward_code.delete_code)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "TVUAdmin/1.0"
+
+    def _reply(self, status: int, payload: dict):
+        data = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self):
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            if length > MAX_BODY:
+                raise ServiceError(413, "Body quá lớn")
+            raw = self.rfile.read(length) if length else b''
+            try:
+                body = json.loads(raw) if raw else {}
+            except ValueError:
+                raise ServiceError(400, "Body phải là JSON")
+            if not isinstance(body, dict):
+                raise ServiceError(400, "Body phải là JSON object")
+            self._reply(200, self.server.service.handle(self.command, self.path.split('?', 1)[0], body))
+        except ServiceError as e:
+            self._reply(e.status, {'error': str(e)})
+        except Exception as e:
+            self._reply(500, {'error': f"{type(e).__name__}: {e}"})
+
+    do_GET = _dispatch
+    do_POST = _dispatch
+
+    def log_message(self, format, *args):
+        print(f"🌐 {self.command} {self.path} {args[1] if len(args) > 1 else ''}", flush=True)
+
+
+class _TCPHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ('unix', 0)
+
+
+def make_server(service: AdminService, host: str = HOST, port: int = PORT, unix_path: str = None):
+    """HTTP server (TCP hoặc Unix socket) phục vụ `service`"""
+    if unix_path:
+        if os.path.exists(unix_path):
+            os.remove(unix_path)
+        server = _UnixHTTPServer(unix_path, _Handler)
+    else:
+        server = _TCPHTTPServer((host, port), _Handler)
+    server.service = service
+    return server
+
+
+def serve(host: str = HOST, port: int = PORT, unix_path: str = None):
+    """Khởi tạo client 1 lần rồi phục vụ tới khi Ctrl+C"""
+    started = time.perf_counter()
+    db = connect()
+    service = AdminService(db)
+    server = make_server(service, host, port, unix_path)
+    where = unix_path or f"http://{host}:{server.server_address[1]}"
+    print(f"🚀 TVU admin service: {where} (khởi tạo {time.perf_counter() - started:.2f}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n⏹ Đang dừng, commit nốt thư đang chờ...")
+    finally:
+        server.server_close()
+        service.close()
+        if unix_path and os.path.exists(unix_path):
+            os.remove(unix_path)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Service quản trị TVU (Firestore client nóng)")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--unix', metavar='PATH', help="Nghe trên Unix socket thay vì TCP")
+    args = parser.parse_args(argv)
+    return serve(args.host, args.port, args.unix)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
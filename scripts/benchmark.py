@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Benchmark các đường gửi thư / tạo mã mà không đụng tới production
+
+Chạy các hàm thật của send_mail.py và create_reward_code.py trên:
+- Firestore giả lập trong bộ nhớ (fake_firestore.py) với độ trễ giả mỗi RPC
+  => đo được số RPC, số đọc/ghi và p50/p99 thời gian RPC
+- Hoặc Firestore Emulator (--emulator, cần FIRESTORE_EMULATOR_HOST)
+  => chỉ đo thời gian, không đếm được RPC
+
+Sử dụng: python benchmark.py
+         python benchmark.py --sizes 1000 10000 --latency 20 --json bench.json
+         FIRESTORE_EMULATOR_HOST=localhost:8080 python benchmark.py --emulator --sizes 1000
+
+Yêu cầu:
+- pip install firebase-admin
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+import campaign_journal
+import local_cache
+
+# ============ CẤU HÌNH ============
+DEFAULT_SIZES = [1000, 10000, 100000]  # Số người nhận / số mã mỗi lần chạy
+DEFAULT_LATENCY_MS = 20  # Độ trễ giả mỗi RPC (ms)
+SINGLE_OP_CAP = 1000  # Số thao tác tối đa cho kịch bản gọi từng cái một
+EMULATOR_PROJECT = "demo-tvuapp"  # Project id khi chạy với emulator
+# ==================================
+
+
+def percentile(values, pct):
+    """Percentile (nearest-rank) của list số, None nếu rỗng"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def _make_db(args):
+    if args.emulator:
+        if not os.environ.get('FIRESTORE_EMULATOR_HOST'):
+            raise SystemExit("❌ Chưa đặt FIRESTORE_EMULATOR_HOST (vd: localhost:8080)")
+        from google.cloud import firestore as gcloud_firestore
+        return gcloud_firestore.Client(project=os.environ.get('GCLOUD_PROJECT', EMULATOR_PROJECT))
+    from fake_firestore import FakeFirestore
+    return FakeFirestore(latency=args.latency / 1000)
+
+
+def _measure(db, name, size, items, fn):
+    """Chạy 1 kịch bản, ẩn output của script, trả về dict kết quả"""
+    if hasattr(db, 'reset_counts'):
+        db.reset_counts()
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+
+    result = {
+        'scenario': name,
+        'size': size,
+        'items': items,
+        'seconds': round(elapsed, 3),
+        'throughput': round(items / elapsed, 1) if elapsed else None,
+        'rpc_p50_ms': None,
+        'rpc_p99_ms': None,
+        'rpc': None,
+    }
+    if hasattr(db, 'rpc_latencies'):
+        latencies = [v for values in db.rpc_latencies.values() for v in values]
+        if latencies:
+            result['rpc_p50_ms'] = round(percentile(latencies, 50) * 1000, 2)
+            result['rpc_p99_ms'] = round(percentile(latencies, 99) * 1000, 2)
+        result['rpc'] = dict(sorted(db.rpc_counts.items()))
+    return result
+
+
+def run_size(args, size, workdir):
+    """Chạy toàn bộ kịch bản cho 1 kích thước, trên 1 database mới"""
+    import create_reward_code
+    import send_mail
+
+    db = _make_db(args)
+    results = []
+    tag = f"bench{size}_{int(time.time())}"
+
+    # 1. Gửi thư hàng loạt (batch + fan-out + journal)
+    mssvs = [f"BM{i:08d}" for i in range(size)]
+    results.append(_measure(db, 'send_mail_to_multiple_users', size, size, lambda: send_mail.send_mail_to_multiple_users(
+        db, mssvs, title="Benchmark", content="...", coins=10, campaign_id=tag,
+    )))
+
+    # 2. Tạo mã hàng loạt (get_all kiểm tra trùng + batch.create)
+    codes_path = os.path.join(workdir, f"codes_{size}.txt")
+    results.append(_measure(db, 'create_reward_codes_bulk', size, size, lambda: create_reward_code.create_reward_codes_bulk(
+        db, size, title="Benchmark", coins=10, output_path=codes_path,
+    )))
+
+    # 3. Tạo từng mã một (đường menu tương tác)
+    single = min(size, SINGLE_OP_CAP)
+
+    def create_single():
+        for i in range(single):
+            create_reward_code.create_reward_code(db, code=f"SINGLE{size}X{i:06d}", coins=1)
+    results.append(_measure(db, 'create_reward_code', size, single, create_single))
+
+    # 4. Liệt kê toàn bộ mã theo trang
+    total_codes = size + single
+    results.append(_measure(db, 'list_codes', size, total_codes, lambda: create_reward_code.list_codes(
+        db, show_inactive=True, interactive=False,
+    )))
+
+    # 5. Xóa từng thư global (chuẩn bị dữ liệu ngoài phần đo)
+    mails = db.collection('mailbox').document('global').collection('mails')
+    mail_ids = [f"{tag}_g{i:06d}" for i in range(single)]
+    for start in range(0, single, send_mail.BATCH_SIZE):
+        batch = db.batch()
+        for mail_id in mail_ids[start:start + send_mail.BATCH_SIZE]:
+            batch.set(mails.document(mail_id), {'title': "Benchmark", 'reward': {'coins': 1}})
+        batch.commit()
+
+    def delete_single():
+        for mail_id in mail_ids:
+            send_mail.delete_global_mail(db, mail_id)
+    results.append(_measure(db, 'delete_global_mail', size, single, delete_single))
+
+    return results
+
+
+def print_table(results):
+    header = f"{'Kịch bản':<30} {'N':>8} {'Mục':>8} {'Giây':>9} {'Mục/s':>10} {'p50 ms':>8} {'p99 ms':>8}  RPC"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        rpc = ', '.join(f"{k}={v}" for k, v in (r['rpc'] or {}).items() if k.startswith('rpc_'))
+        p50 = f"{r['rpc_p50_ms']:.2f}" if r['rpc_p50_ms'] is not None else '-'
+        p99 = f"{r['rpc_p99_ms']:.2f}" if r['rpc_p99_ms'] is not None else '-'
+        print(f"{r['scenario']:<30} {r['size']:>8,} {r['items']:>8,} {r['seconds']:>9.2f} "
+              f"{r['throughput'] or 0:>10,.0f} {p50:>8} {p99:>8}  {rpc or '-'}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark gửi thư / tạo mã thưởng (offline)")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="Số người nhận / số mã (mặc định: 1000 10000 100000)")
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY_MS,
+                        help="Độ trễ giả mỗi RPC, ms (chỉ với Firestore giả lập)")
+    parser.add_argument('--emulator', action='store_true',
+                        help="Chạy trên Firestore Emulator (FIRESTORE_EMULATOR_HOST)")
+    parser.add_argument('--json', metavar='PATH', help="Ghi kết quả ra file JSON")
+    args = parser.parse_args(argv)
+
+    target = "Firestore Emulator" if args.emulator else f"Firestore giả lập, {args.latency:g} ms/RPC"
+    print(f"⏱  Benchmark ({target})\n")
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="tvu_bench_") as workdir:
+        # Cache / journal ghi ra file tạm, không đụng dữ liệu thật trên máy
+        local_cache.CACHE_PATH = os.path.join(workdir, "cache.db")
+        campaign_journal.JOURNAL_PATH = os.path.join(workdir, "campaigns.db")
+        for size in args.sizes:
+            print(f"▶ N = {size:,}...", flush=True)
+            results.extend(run_size(args, size, workdir))
+
+    print()
+    print_table(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'target': 'emulator' if args.emulator else 'fake',
+                'latency_ms': None if args.emulator else args.latency,
+                'results': results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Đã ghi {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Ghi hàng loạt không nguyên khối bằng RPC BatchWrite
+
+Khác WriteBatch (commit nguyên khối: 1 thao tác lỗi => cả batch lỗi),
+BulkWriteBatch áp dụng từng thao tác độc lập và trả về trạng thái riêng
+cho mỗi thao tác. Nhờ vậy có thể ghi kèm điều kiện (exists=True) cho cả
+500 document trong 1 round trip, rồi đọc kết quả để biết document nào
+không tồn tại - không cần get() trước.
+
+Lưu ý: 1 BulkWriteBatch không được ghi 2 lần vào cùng 1 document.
+"""
+
+# Mã trạng thái gRPC (google.rpc.Code)
+OK = 0
+NOT_FOUND = 5
+ALREADY_EXISTS = 6
+FAILED_PRECONDITION = 9
+
+MAX_BULK_WRITES = 500  # Số thao tác tối đa mỗi lần BatchWrite
+
+
+def bulk_batch(db):
+    """Tạo BulkWriteBatch (client giả lập / proxy đo đạc tự cung cấp bulk_batch)"""
+    if hasattr(type(db), 'bulk_batch'):
+        return db.bulk_batch()
+    from google.cloud.firestore_v1.bulk_batch import BulkWriteBatch
+    return BulkWriteBatch(db)
+
+
+def split_results(keys, response):
+    """
+    Tách kết quả BatchWrite theo từng thao tác
+
+    Args:
+        keys: Khóa của từng thao tác, đúng thứ tự đã thêm vào batch
+        response: BatchWriteResponse trả về từ commit()
+
+    Returns:
+        tuple: (ok, missing, failed) - missing là thao tác không thỏa điều
+            kiện tồn tại (update/delete: không có document, create: đã có),
+            failed là list (key, thông báo lỗi)
+    """
+    ok, missing, failed = [], [], []
+    for key, status in zip(keys, response.status):
+        if status.code == OK:
+            ok.append(key)
+        elif status.code in (NOT_FOUND, ALREADY_EXISTS, FAILED_PRECONDITION):
+            missing.append(key)
+        else:
+            failed.append((key, status.message or f"code {status.code}"))
+    return ok, missing, failed
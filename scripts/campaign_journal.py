@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Nhật ký chiến dịch gửi thư (SQLite, lưu trên máy)
+
+Mỗi chiến dịch có 1 campaign_id cố định, lưu lại mail_id_prefix, tham số gửi
+và danh sách MSSV đã commit thành công. Chạy lại cùng campaign_id sẽ:
+- Dùng lại mail_id_prefix cũ => mail ID không đổi, ghi lại cũng không nhân đôi quà
+- Bỏ qua các MSSV đã gửi, chỉ gửi phần còn lại
+
+Chiến dịch gửi theo lịch lưu thêm lịch + trạng thái ramp (campaign_scheduler.py).
+"""
+
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+# ============ CẤU HÌNH ============
+JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "campaigns.db")
+LOOKUP_CHUNK = 500  # Số MSSV kiểm tra mỗi lần truy vấn journal
+# ==================================
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaigns (
+    campaign_id TEXT PRIMARY KEY,
+    mail_id_prefix TEXT NOT NULL,
+    params TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    finished_at TEXT
+);
+CREATE TABLE IF NOT EXISTS recipients (
+    campaign_id TEXT NOT NULL,
+    mssv TEXT NOT NULL,
+    PRIMARY KEY (campaign_id, mssv)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS schedules (
+    campaign_id TEXT PRIMARY KEY,
+    schedule TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+"""
+
+
+class CampaignJournal:
+    """Journal các chiến dịch gửi thư hàng loạt"""
+
+    def __init__(self, path: str = None):
+        # Đọc JOURNAL_PATH lúc khởi tạo để benchmark/thử nghiệm có thể đổi sang file tạm
+        self.path = path or JOURNAL_PATH
+        self._conn = sqlite3.connect(self.path)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, campaign_id: str):
+        """Thông tin chiến dịch (dict) hoặc None nếu chưa có"""
+        row = self._conn.execute(
+            "SELECT mail_id_prefix, params, created_at, finished_at FROM campaigns WHERE campaign_id = ?",
+            (campaign_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'campaign_id': campaign_id,
+            'mail_id_prefix': row[0],
+            'params': json.loads(row[1]),
+            'created_at': row[2],
+            'finished_at': row[3],
+            'sent': self.sent_count(campaign_id),
+        }
+
+    def start(self, campaign_id: str, mail_id_prefix: str, params: dict = None):
+        """
+        Bắt đầu (hoặc tiếp tục) chiến dịch
+
+        Returns:
+            str: mail_id_prefix cần dùng (của lần chạy đầu tiên nếu đã có)
+        """
+        existing = self.get(campaign_id)
+        if existing is not None:
+            return existing['mail_id_prefix']
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO campaigns (campaign_id, mail_id_prefix, params, created_at) VALUES (?, ?, ?, ?)",
+                (campaign_id, mail_id_prefix, json.dumps(params or {}, ensure_ascii=False),
+                 datetime.now().isoformat(timespec='seconds')),
+            )
+        return mail_id_prefix
+
+    def setdefault_param(self, campaign_id: str, name: str, value):
+        """
+        Tham số `name` đã lưu của chiến dịch; chưa có thì lưu `value`
+
+        Dùng cho giá trị phải cố định từ lần chạy đầu (vd: hạn thư tuyệt đối).
+        """
+        with self._conn:
+            row = self._conn.execute(
+                "SELECT params FROM campaigns WHERE campaign_id = ?", (campaign_id,)
+            ).fetchone()
+            params = json.loads(row[0])
+            if params.get(name) is not None:
+                return params[name]
+            params[name] = value
+            self._conn.execute(
+                "UPDATE campaigns SET params = ? WHERE campaign_id = ?",
+                (json.dumps(params, ensure_ascii=False), campaign_id),
+            )
+        return value
+
+    def filter_pending(self, campaign_id: str, mssvs, key=None):
+        """
+        Trả về các phần tử trong `mssvs` chưa được gửi
+
+        key: Hàm lấy MSSV từ phần tử (vd: phần tử là (mssv, dữ liệu riêng))
+        """
+        items = list(mssvs)
+        if not items:
+            return []
+        keys = [key(item) for item in items] if key else items
+        placeholders = ','.join('?' * len(keys))
+        done = {row[0] for row in self._conn.execute(
+            f"SELECT mssv FROM recipients WHERE campaign_id = ? AND mssv IN ({placeholders})",
+            (campaign_id, *keys),
+        )}
+        return [item for item, mssv in zip(items, keys) if mssv not in done]
+
+    def iter_pending(self, campaign_id: str, mssvs, stats: dict = None, key=None):
+        """Generator: lọc bỏ MSSV đã gửi, kiểm tra theo cụm LOOKUP_CHUNK"""
+        chunk = []
+        for mssv in mssvs:
+            chunk.append(mssv)
+            if len(chunk) >= LOOKUP_CHUNK:
+                yield from self._pending_chunk(campaign_id, chunk, stats, key)
+                chunk = []
+        if chunk:
+            yield from self._pending_chunk(campaign_id, chunk, stats, key)
+
+    def _pending_chunk(self, campaign_id, chunk, stats, key=None):
+        pending = self.filter_pending(campaign_id, chunk, key)
+        if stats is not None:
+            stats['skipped'] = stats.get('skipped', 0) + len(chunk) - len(pending)
+        return pending
+
+    def mark_sent(self, campaign_id: str, mssvs):
+        """Ghi nhận các MSSV đã commit thành công"""
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO recipients (campaign_id, mssv) VALUES (?, ?)",
+                ((campaign_id, mssv) for mssv in mssvs),
+            )
+
+    def finish(self, campaign_id: str):
+        """Đánh dấu chiến dịch đã hoàn tất"""
+        with self._conn:
+            self._conn.execute(
+                "UPDATE campaigns SET finished_at = ? WHERE campaign_id = ?",
+                (datetime.now().isoformat(timespec='seconds'), campaign_id),
+            )
+
+    def sent_count(self, campaign_id: str) -> int:
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM recipients WHERE campaign_id = ?", (campaign_id,)
+        ).fetchone()[0]
+
+    def save_schedule(self, campaign_id: str, schedule: dict):
+        """Lưu (ghi đè) lịch gửi của chiến dịch"""
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO schedules (campaign_id, schedule, updated_at) VALUES (?, ?, ?)",
+                (campaign_id, json.dumps(schedule, ensure_ascii=False),
+                 datetime.now().isoformat(timespec='seconds')),
+            )
+
+    def get_schedule(self, campaign_id: str):
+        """Lịch gửi (dict) hoặc None nếu chiến dịch không gửi theo lịch"""
+        row = self._conn.execute(
+            "SELECT schedule FROM schedules WHERE campaign_id = ?", (campaign_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list_campaigns(self):
+        """Danh sách chiến dịch, mới nhất trước"""
+        rows = self._conn.execute(
+            "SELECT campaign_id FROM campaigns ORDER BY created_at DESC"
+        ).fetchall()
+        return [self.get(row[0]) for row in rows]
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Giãn tốc độ gửi chiến dịch theo khung giờ / tốc độ mục tiêu
+
+Ghi dồn vào hàng chục nghìn collection mailbox/users/{mssv} mới cùng lúc
+vượt khuyến nghị tăng tải của Firestore (quy tắc "500/50/5": bắt đầu tối đa
+500 thao tác/giây, mỗi 5 phút tăng thêm tối đa 50%) và làm mọi app cùng
+nhận thư, cùng đồng bộ 1 lúc. CampaignPacer:
+
+- Cấp "token" cho từng batch bằng token bucket (1 token = 1 người nhận),
+  tốc độ = min(đường ramp 500/50/5 chia cho số thao tác mỗi người nhận,
+  tốc độ mục tiêu, max_rate)
+- Tốc độ mục tiêu = `rate` cố định, hoặc số thư còn lại / thời gian còn lại
+  tới `deadline` (rải đều trong khung giờ)
+- Lưu trạng thái ramp vào journal (campaign_journal.py), nên chạy lại bằng
+  cron (`tvu_admin.py mail schedule-run`) sẽ tiếp tục đúng chỗ; nghỉ lâu hơn
+  RAMP_RESET_SECONDS thì ramp lại từ đầu
+- `run_for`: chỉ gửi trong N giây mỗi lần chạy rồi dừng (phần còn lại để
+  lần chạy sau)
+"""
+
+from datetime import datetime
+import math
+import time
+
+# ============ CẤU HÌNH ============
+RAMP_START_RATE = 500  # Thao tác/giây lúc bắt đầu
+RAMP_GROWTH = 0.5  # Tăng tối đa 50%...
+RAMP_STEP_SECONDS = 300  # ...mỗi 5 phút
+RAMP_RESET_SECONDS = 300  # Nghỉ lâu hơn mức này => ramp lại từ đầu
+OPS_PER_RECIPIENT = 2  # Số thao tác ghi cho mỗi người nhận (thư + index người nhận)
+SAVE_INTERVAL = 10  # Số giây giữa 2 lần lưu trạng thái vào journal
+# ==================================
+
+
+def ramp_rate(elapsed: float, start_rate: float = RAMP_START_RATE) -> float:
+    """Tốc độ tối đa (thao tác/giây) sau `elapsed` giây gửi liên tục"""
+    return start_rate * (1 + RAMP_GROWTH) ** int(elapsed // RAMP_STEP_SECONDS)
+
+
+def parse_time(value):
+    """datetime | chuỗi ISO ('2025-01-20 08:00') | None => datetime | None"""
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+class TokenBucket:
+    """Token bucket có thể đổi tốc độ; dung lượng = max(1 giây token, lượt xin)"""
+
+    def __init__(self, rate: float, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = 0.0
+        self._last = clock()
+
+    def _refill(self, capacity):
+        now = self._clock()
+        self._tokens = min(capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, n: int = 1, deadline: float = None) -> bool:
+        """
+        Chờ đến khi đủ `n` token rồi lấy ra
+
+        Returns:
+            bool: False (không lấy token) nếu phải chờ quá `deadline` (theo clock)
+        """
+        while True:
+            capacity = max(self.rate, n)
+            self._refill(capacity)
+            if self._tokens >= n:
+                self._tokens -= n
+                return True
+            wait = (n - self._tokens) / self.rate
+            if deadline is not None and self._last + wait > deadline:
+                return False
+            self._sleep(wait)
+
+
+class CampaignPacer:
+    """
+    Điều tốc 1 chiến dịch theo lịch lưu trong journal
+
+    schedule (dict, lưu bằng CampaignJournal.save_schedule):
+        not_before, deadline: Khung giờ gửi (chuỗi ISO hoặc None)
+        rate: Tốc độ mục tiêu (thư/giây) nếu không có deadline
+        max_rate: Trần tốc độ (thư/giây)
+        total: Tổng số người nhận (để tính tốc độ theo deadline)
+        ramp_elapsed, last_active_at: Trạng thái ramp giữa các lần chạy
+
+    Mọi tốc độ của pacer tính theo người nhận (thư/giây); ramp tính theo thao
+    tác nên được chia cho `ops_per_recipient`.
+    """
+
+    def __init__(self, journal, campaign_id: str, schedule: dict, run_for: float = None,
+                 clock=time.monotonic, sleep=time.sleep, ops_per_recipient: int = OPS_PER_RECIPIENT):
+        self.journal = journal
+        self.ops_per_recipient = ops_per_recipient
+        self.campaign_id = campaign_id
+        self.schedule = dict(schedule)
+        self.paused = False
+        self._clock = clock
+        self._started = clock()
+        self._stop_at = self._started + run_for if run_for else None
+
+        last_active = parse_time(self.schedule.get('last_active_at'))
+        if last_active is None or (datetime.now() - last_active).total_seconds() > RAMP_RESET_SECONDS:
+            self.schedule['ramp_elapsed'] = 0.0
+        self._ramp_base = float(self.schedule.get('ramp_elapsed') or 0.0)
+        self._sent = journal.sent_count(campaign_id)
+        self._last_save = self._started
+        self.bucket = TokenBucket(self.current_rate(), clock=clock, sleep=sleep)
+
+    def ramp_elapsed(self) -> float:
+        return self._ramp_base + (self._clock() - self._started)
+
+    def target_rate(self):
+        """Tốc độ mục tiêu theo lịch (None = chỉ theo ramp)"""
+        deadline = parse_time(self.schedule.get('deadline'))
+        total = self.schedule.get('total')
+        if deadline is not None and total is not None:
+            seconds_left = (deadline - datetime.now()).total_seconds()
+            if seconds_left > 0:
+                return max(total - self._sent, 1) / seconds_left
+            return None  # Quá hạn: gửi nốt theo ramp
+        return self.schedule.get('rate')
+
+    def current_rate(self) -> float:
+        """Tốc độ hiện tại (người nhận/giây)"""
+        ramp = ramp_rate(self.ramp_elapsed()) / self.ops_per_recipient
+        limits = [ramp, self.target_rate(), self.schedule.get('max_rate')]
+        return min(limit for limit in limits if limit)
+
+    def batch_size(self, default: int) -> int:
+        """Batch nhỏ lại khi tốc độ thấp để thư rải đều thay vì dồn cục"""
+        return max(1, min(default, math.ceil(self.current_rate())))
+
+    def not_started(self) -> bool:
+        not_before = parse_time(self.schedule.get('not_before'))
+        return not_before is not None and datetime.now() < not_before
+
+    def save(self):
+        self.schedule['ramp_elapsed'] = round(self.ramp_elapsed(), 1)
+        self.schedule['last_active_at'] = datetime.now().isoformat(timespec='seconds')
+        self.journal.save_schedule(self.campaign_id, self.schedule)
+        self._last_save = self._clock()
+
+    def pace(self, tasks):
+        """
+        Bọc iterable (key, chunk): chờ đủ token cho mỗi chunk rồi mới nhả ra
+
+        Hết `run_for` thì dừng và đặt paused = True.
+        """
+        try:
+            for key, chunk in tasks:
+                self.bucket.rate = self.current_rate()
+                if not self.bucket.acquire(len(chunk), self._stop_at):
+                    self.paused = True
+                    break
+                self._sent += len(chunk)
+                if self._clock() - self._last_save >= SAVE_INTERVAL:
+                    self.save()
+                yield key, chunk
+        finally:
+            self.save()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Bộ đếm lượt nhận chia shard cho mã "hot"
+
+Mỗi document Firestore chỉ chịu được khoảng 1 lần ghi/giây liên tục. Mã
+được công bố trên fanpage có hàng nghìn lượt nhận trong 1 phút, nếu mọi
+transaction đều tăng current_claims của reward_codes/{code} thì sẽ tranh
+chấp và lỗi. Mã chia shard có N document đếm:
+
+    reward_codes/{code}/claim_shards/{i}  {count, limit}   (i = 0..N-1)
+
+App chọn ngẫu nhiên 1 shard, tăng `count` của shard đó trong transaction
+(không ghi vào document mã) => chịu được ~N lần ghi/giây.
+
+- Tổng lượt nhận = current_claims (lượt nhận trước khi chia shard / từ
+  app cũ) + tổng `count` của các shard.
+- max_claims được chia thành `limit` của từng shard (None = không giới hạn).
+  Shard đầy thì app thử shard khác, mọi shard đầy => mã hết lượt.
+- Document mã có field `shard_count` (0 / không có = không chia shard).
+- Nhận mã trên shard không ghi `updated_at` của document mã, nên cache cục
+  bộ (sync theo updated_at) chỉ có current_claims; dùng claim_totals để
+  có tổng lượt nhận thật.
+"""
+
+from fanout import fan_out
+from recipients import chunked
+from reward_code_format import code_candidates
+
+# ============ CẤU HÌNH ============
+SHARD_COLLECTION = "claim_shards"  # Tên subcollection chứa shard đếm
+MAX_SHARDS = 100  # Số shard tối đa mỗi mã
+MAX_IN_FLIGHT = 8  # Số aggregation query chạy song song khi cộng shard
+BATCH_SIZE = 500  # Số thao tác tối đa trong 1 batch Firestore (giới hạn 500)
+# ==================================
+
+
+def shard_limits(remaining: int, shard_count: int):
+    """Chia `remaining` lượt còn lại đều cho các shard (lệch nhau tối đa 1)"""
+    base, extra = divmod(max(remaining, 0), shard_count)
+    return [base + (1 if i < extra else 0) for i in range(shard_count)]
+
+
+def shard_documents(code_ref, shard_count: int, max_claims: int = 0, claimed: int = 0):
+    """
+    Các shard mới cho 1 mã: list (reference, data)
+
+    Args:
+        claimed: Số lượt đã nhận (đã tính trong current_claims)
+    """
+    if not 1 <= shard_count <= MAX_SHARDS:
+        raise ValueError(f"Số shard phải từ 1 đến {MAX_SHARDS}")
+    if max_claims > 0:
+        limits = shard_limits(max_claims - claimed, shard_count)
+    else:
+        limits = [None] * shard_count
+    shards = code_ref.collection(SHARD_COLLECTION)
+    return [(shards.document(str(i)), {'count': 0, 'limit': limit}) for i, limit in enumerate(limits)]
+
+
+def _sum_count(query) -> int:
+    result = query.sum('count', alias='count').get()
+    return int(result[0][0].value or 0)
+
+
+def shard_claims(code_ref) -> int:
+    """Tổng `count` của các shard 1 mã (1 aggregation query)"""
+    return _sum_count(code_ref.collection(SHARD_COLLECTION))
+
+
+def all_shard_claims(db) -> int:
+    """Tổng `count` của mọi shard trên toàn hệ thống (collection group, 1 RPC)"""
+    return _sum_count(db.collection_group(SHARD_COLLECTION))
+
+
+def claim_totals(db, codes):
+    """
+    Tổng lượt nhận thật của các mã
+
+    Args:
+        codes: Iterable (mã, data) - data cần current_claims và shard_count
+
+    Returns:
+        dict: {mã: tổng lượt nhận}. Mã không chia shard không cần RPC.
+    """
+    collection = db.collection('reward_codes')
+    totals = {}
+    sharded = []
+    for code, data in codes:
+        totals[code] = int(data.get('current_claims') or 0)
+        if data.get('shard_count'):
+            sharded.append(code)
+
+    def add_shards(code):
+        totals[code] += shard_claims(collection.document(code))
+
+    result = fan_out(((code, code) for code in sharded), add_shards, max_in_flight=MAX_IN_FLIGHT)
+    if result.failed:
+        raise result.failed[0][1]
+    return totals
+
+
+def set_claim_shards(db, code: str, shard_count: int):
+    """
+    Chia shard (hoặc tăng số shard) cho mã đã có
+
+    Shard cũ giữ nguyên `count`, chỉ đổi `limit`; phần lượt còn lại của
+    max_claims được chia lại cho toàn bộ shard. Lượt nhận xảy ra trong lúc
+    chia lại chỉ làm tổng limit nhỏ đi, không bao giờ vượt max_claims.
+    Không hỗ trợ giảm số shard (count của shard bị bỏ sẽ mất).
+
+    Returns:
+        bool: True nếu thành công
+    """
+    candidates = code_candidates(code) or [code]
+    for code in candidates:
+        code_ref = db.collection('reward_codes').document(code)
+        snapshot = code_ref.get()
+        if snapshot.exists:
+            break
+    else:
+        print(f"❌ Không tìm thấy mã '{candidates[0]}'!")
+        return False
+    data = snapshot.to_dict()
+    current = int(data.get('shard_count') or 0)
+    if shard_count < current:
+        print(f"❌ Mã '{code}' đang có {current} shard, không thể giảm xuống {shard_count}")
+        return False
+
+    counts = {}
+    if current:
+        for shard in code_ref.collection(SHARD_COLLECTION).stream():
+            counts[shard.id] = int(shard.to_dict().get('count') or 0)
+    claimed = int(data.get('current_claims') or 0) + sum(counts.values())
+    max_claims = int(data.get('max_claims') or 0)
+
+    batch = db.batch()
+    new_shards = shard_documents(code_ref, shard_count, max_claims, claimed)
+    for ref, shard in new_shards:
+        if ref.id in counts:
+            # Shard cũ: giữ count, limit = count + phần được chia
+            limit = shard['limit'] if shard['limit'] is None else shard['limit'] + counts[ref.id]
+            batch.update(ref, {'limit': limit})
+        else:
+            batch.set(ref, shard)
+    batch.update(code_ref, {'shard_count': shard_count})
+    batch.commit()
+
+    print(f"✅ Mã '{code}': {shard_count} shard, đã nhận {claimed:,}/{max_claims or '∞'} lượt")
+    return True
+
+
+def shard_refs(code_ref, shard_count: int):
+    """Reference các shard 0..N-1 của 1 mã (không cần đọc)"""
+    shards = code_ref.collection(SHARD_COLLECTION)
+    return [shards.document(str(i)) for i in range(int(shard_count or 0))]
+
+
+def shard_refs_by_code(db, codes) -> dict:
+    """
+    Reference shard của các mã trong `codes` (gọi trước khi xóa mã)
+
+    Chỉ đọc field shard_count của document mã bằng get_all (1 RPC / 500 mã)
+    rồi dựng reference bằng shard_refs, không quét collection group
+    claim_shards. Mã không tồn tại / không chia shard bị bỏ qua.
+
+    Returns:
+        dict: {mã: [reference shard]} (chỉ các mã có shard)
+    """
+    collection = db.collection('reward_codes')
+    result = {}
+    for chunk in chunked(codes, BATCH_SIZE):
+        refs = [collection.document(code) for code in chunk]
+        for snapshot in db.get_all(refs, field_paths=['shard_count']):
+            shard_count = (snapshot.to_dict() or {}).get('shard_count') if snapshot.exists else None
+            if shard_count:
+                result[snapshot.id] = shard_refs(snapshot.reference, shard_count)
+    return result
+
+
+def delete_shard_refs(db, refs) -> int:
+    """Xóa các shard theo batch 500"""
+    count = 0
+    for chunk in chunked(refs, BATCH_SIZE):
+        batch = db.batch()
+        for ref in chunk:
+            batch.delete(ref)
+        batch.commit()
+        count += len(chunk)
+    return count
+
+
+def delete_claim_shards(db, code_ref) -> int:
+    """Xóa các shard của 1 mã (Firestore không tự xóa subcollection)"""
+    return delete_shard_refs(db, list(code_ref.collection(SHARD_COLLECTION).list_documents()))
@@ -1,21 +1,47 @@
 #!/usr/bin/env python3
 """
 Script tạo mã thưởng trên Firebase Firestore
-Sử dụng: python create_reward_code.py
+Sử dụng: python create_reward_code.py  (menu tương tác)
+         python tvu_admin.py --help  (dòng lệnh, dùng cho cron / shell)
 
 Yêu cầu:
 - pip install firebase-admin
 - File service account JSON từ Firebase Console
 """
 
-import firebase_admin
-from firebase_admin import credentials, firestore
 from datetime import datetime, timedelta
 import random
+import secrets
 import string
+import sys
+
+from bulk_write import MAX_BULK_WRITES, bulk_batch, split_results
+from claim_shards import (
+    claim_totals, delete_claim_shards, delete_shard_refs, set_claim_shards, shard_documents, shard_refs,
+    shard_refs_by_code,
+)
+from expiry_sweeper import sweep_expired
+from fanout import fan_out
+from idempotency import commit_create_only, content_hash, create_only
+from instrumentation import instrument, run_metrics
+from lazy_import import lazy_module
+from local_cache import LocalCache
+from paging import PAGE_SIZE, iter_pages
+from recipients import ProgressLine
+from redemption_report import backfill_claim_codes, redemption_report
+import reward_code_format
+
+# firebase_admin chỉ được import khi thực sự cần (xem lazy_import.py)
+firebase_admin = lazy_module('firebase_admin')
+credentials = lazy_module('firebase_admin.credentials')
+firestore = lazy_module('firebase_admin.firestore')
+exceptions = lazy_module('google.api_core.exceptions')
 
 # ============ CẤU HÌNH ============
 SERVICE_ACCOUNT_PATH = "serviceAccountKey.json"  # Đường dẫn file service account
+BATCH_SIZE = 500  # Số thao tác tối đa trong 1 batch Firestore (giới hạn 500)
+GET_ALL_CHUNK = 300  # Số document mỗi lần kiểm tra tồn tại bằng db.get_all
+MAX_IN_FLIGHT = 8  # Số batch được commit song song
 # ==================================
 
 def init_firebase():
@@ -23,13 +49,52 @@ def init_firebase():
     if not firebase_admin._apps:
         cred = credentials.Certificate(SERVICE_ACCOUNT_PATH)
         firebase_admin.initialize_app(cred)
-    return firestore.client()
+    # Mọi lời gọi Firestore đi qua lớp đo đạc (xem instrumentation.py)
+    return instrument(firestore.client())
 
 def generate_code(length=8):
-    """Tạo mã ngẫu nhiên"""
+    """Tạo mã ngẫu nhiên kiểu cũ (A-Z0-9, không có ký tự kiểm tra)"""
     chars = string.ascii_uppercase + string.digits
     return ''.join(random.choice(chars) for _ in range(length))
 
+def generate_unique_codes(count: int, length: int = None, exclude=None, prefix: str = None):
+    """
+    Tạo `count` mã khác nhau bằng RNG mật mã (secrets)
+    
+    Mặc định dùng định dạng có ký tự kiểm tra (reward_code_format.py, kèm
+    `prefix` nếu có); truyền `length` để tạo mã kiểu cũ A-Z0-9.
+    """
+    chars = string.ascii_uppercase + string.digits
+    exclude = exclude or set()
+    codes = set()
+    while len(codes) < count:
+        if length:
+            code = ''.join(secrets.choice(chars) for _ in range(length))
+        else:
+            code = reward_code_format.generate_code(prefix)
+        if code not in exclude:
+            codes.add(code)
+    return codes
+
+def _find_existing_codes(db, codes):
+    """Trả về các mã đã có trên Firebase (kiểm tra song song theo cụm bằng get_all)"""
+    collection = db.collection('reward_codes')
+    codes = list(codes)
+    existing = set()
+    
+    def check_chunk(chunk):
+        refs = [collection.document(code) for code in chunk]
+        found = {snapshot.id for snapshot in db.get_all(refs, field_paths=[]) if snapshot.exists}
+        existing.update(found)
+    
+    chunks = (
+        (i, codes[i:i + GET_ALL_CHUNK]) for i in range(0, len(codes), GET_ALL_CHUNK)
+    )
+    result = fan_out(chunks, check_chunk, max_in_flight=MAX_IN_FLIGHT)
+    if result.failed:
+        raise result.failed[0][1]
+    return existing
+
 def create_reward_code(
     db,
     code: str = None,
@@ -40,13 +105,18 @@ def create_reward_code(
     xp: int = 0,
     expires_days: int = None,  # None = không hết hạn
     max_claims: int = 0,  # 0 = unlimited
+    shards: int = 0,  # 0 = không chia shard
+    idempotent: bool = False,
 ):
     """
     Tạo mã thưởng mới trên Firebase
     
+    Ghi bằng create (1 RPC, server từ chối nếu mã đã có) nên 2 người tạo
+    cùng mã không ghi đè lên nhau.
+    
     Args:
         db: Firestore client
-        code: Mã thưởng (tự động tạo nếu None)
+        code: Mã thưởng (tự động tạo dạng có ký tự kiểm tra nếu None)
         title: Tiêu đề mã
         description: Mô tả
         coins: Số coins thưởng
@@ -54,19 +124,20 @@ def create_reward_code(
         xp: Số XP thưởng
         expires_days: Số ngày hết hạn (None = vĩnh viễn)
         max_claims: Giới hạn lượt nhận (0 = không giới hạn)
+        shards: Số shard đếm lượt nhận cho mã "hot" (xem claim_shards.py)
+        idempotent: Mã đã tồn tại với đúng nội dung này => coi như thành công
+            (an toàn khi chạy lại sau timeout; cần truyền `code`)
     
     Returns:
         str: Mã đã tạo
     """
     if code is None:
-        code = generate_code()
+        code = reward_code_format.generate_code()
     
-    code = code.upper().strip()
-    
-    # Kiểm tra mã đã tồn tại chưa
-    doc_ref = db.collection('reward_codes').document(code)
-    if doc_ref.get().exists:
-        print(f"❌ Mã '{code}' đã tồn tại!")
+    # Mã dạng XXXXX-XXXXX sai ký tự kiểm tra sẽ bị app từ chối => không tạo
+    code = reward_code_format.normalize_code(code)
+    if code is None:
+        print("❌ Mã sai định dạng (sai ký tự kiểm tra)!")
         return None
     
     # Tạo data
@@ -79,19 +150,41 @@ def create_reward_code(
             'xp': xp,
         },
         'created_at': firestore.SERVER_TIMESTAMP,
+        'updated_at': firestore.SERVER_TIMESTAMP,
         'expires_at': None,
         'max_claims': max_claims,
         'current_claims': 0,
         'is_active': True,
     }
+    if shards:
+        data['shard_count'] = shards
+    data['content_hash'] = content_hash({
+        'code': code, 'title': title, 'description': description, 'reward': data['reward'],
+        'expires_days': expires_days, 'max_claims': max_claims, 'shards': shards,
+    })
     
     # Thêm ngày hết hạn nếu có
     if expires_days is not None:
         expires_at = datetime.now() + timedelta(days=expires_days)
         data['expires_at'] = expires_at
     
-    # Lưu lên Firebase
-    doc_ref.set(data)
+    # Lưu lên Firebase bằng create (mã + các shard trong cùng 1 batch).
+    # Không dựa vào cache cục bộ để từ chối: cache có thể cũ (mã đã bị xóa),
+    # chỉ server mới biết chắc mã đã tồn tại hay chưa.
+    doc_ref = db.collection('reward_codes').document(code)
+    if shards:
+        batch = db.batch()
+        batch.create(doc_ref, data)
+        for shard_ref, shard in shard_documents(doc_ref, shards, max_claims):
+            batch.set(shard_ref, shard)
+        created = commit_create_only(batch)
+    else:
+        created = create_only(doc_ref, data)
+    if not created:
+        existing = doc_ref.get().to_dict() if idempotent else None
+        return _existing_code(code, existing or {}, data['content_hash'], idempotent)
+    with LocalCache() as cache:
+        cache.put('reward_codes', code, data)
     
     print(f"\n✅ Đã tạo mã thưởng thành công!")
     print(f"{'='*40}")
@@ -109,66 +202,444 @@ def create_reward_code(
         print(f"👥 Giới hạn: {max_claims} lượt")
     else:
         print(f"👥 Giới hạn: Không giới hạn")
+    if shards:
+        print(f"⚡ Shard: {shards} (chịu ~{shards} lượt nhận/giây)")
     print(f"{'='*40}\n")
     
     return code
 
-def list_codes(db, show_inactive=False):
-    """Liệt kê tất cả mã thưởng"""
+def _existing_code(code: str, existing: dict, expected_hash: str, idempotent: bool):
+    """Mã đã tồn tại: cùng nội dung + idempotent => trả về mã, ngược lại báo lỗi"""
+    if idempotent and existing.get('content_hash') == expected_hash:
+        print(f"♻️ Mã '{code}' đã được tạo trước đó với cùng nội dung - bỏ qua")
+        return code
+    print(f"❌ Mã '{code}' đã tồn tại!")
+    return None
+
+def create_reward_codes_bulk(
+    db,
+    count: int,
+    title: str = "Mã thưởng",
+    description: str = "Nhập mã để nhận quà",
+    coins: int = 0,
+    diamonds: int = 0,
+    xp: int = 0,
+    expires_days: int = None,
+    max_claims: int = 1,  # Mặc định mỗi mã dùng 1 lần
+    length: int = None,  # None = định dạng có ký tự kiểm tra
+    output_path: str = None,
+    prefix: str = None,
+):
+    """
+    Tạo hàng loạt mã thưởng
+    
+    1. Sinh `count` mã khác nhau trong bộ nhớ (secrets)
+    2. Kiểm tra mã đã tồn tại theo cụm bằng db.get_all, sinh lại mã bị trùng
+    3. Ghi bằng BatchWrite (create), commit song song; mã bị tạo trước trong
+       lúc ghi (ALREADY_EXISTS) được sinh lại và ghi tiếp, các mã khác trong
+       lô vẫn được tạo
+    
+    Args:
+        count: Số mã cần tạo
+        length: Tạo mã kiểu cũ A-Z0-9 dài `length` (mặc định: [TIỀN TỐ-]XXXXX-XXXXX)
+        output_path: File lưu danh sách mã (mặc định codes_<thời gian>.txt)
+        prefix: Tiền tố đợt / chiến dịch cho mã có ký tự kiểm tra
+        Các tham số còn lại giống create_reward_code
+    
+    Returns:
+        list: Các mã đã tạo thành công
+    """
+    print(f"\n🎁 Tạo {count:,} mã thưởng...")
+    
+    codes = generate_unique_codes(count, length, prefix=prefix)
+    rejected = set()
+    
+    # Sinh lại cho đến khi không còn mã trùng với Firebase
+    while True:
+        existing = _find_existing_codes(db, codes)
+        if not existing:
+            break
+        print(f"   ♻ {len(existing)} mã bị trùng, sinh lại...")
+        rejected |= existing
+        codes -= existing
+        codes |= generate_unique_codes(len(existing), length, exclude=codes | rejected, prefix=prefix)
+    
+    data = {
+        'title': title,
+        'description': description,
+        'reward': {
+            'coins': coins,
+            'diamonds': diamonds,
+            'xp': xp,
+        },
+        'created_at': firestore.SERVER_TIMESTAMP,
+        'updated_at': firestore.SERVER_TIMESTAMP,
+        'expires_at': None,
+        'max_claims': max_claims,
+        'current_claims': 0,
+        'is_active': True,
+    }
+    if expires_days is not None:
+        data['expires_at'] = datetime.now() + timedelta(days=expires_days)
+    
+    collection = db.collection('reward_codes')
+    
+    def commit_chunk(task):
+        batch = bulk_batch(db)
+        for code in task['codes']:
+            batch.create(collection.document(code), data)
+        task['results'] = split_results(task['codes'], batch.commit())
+    
+    created = []
+    pending = sorted(codes)
+    while pending:
+        chunks = [pending[i:i + MAX_BULK_WRITES] for i in range(0, len(pending), MAX_BULK_WRITES)]
+        conflicts = []
+        
+        def report(index, task, error):
+            if error is not None:
+                print(f"   ✗ Batch {index}/{len(chunks)}: {error}")
+                return
+            ok, exists, failed = task['results']
+            created.extend(ok)
+            conflicts.extend(exists)
+            for code, message in failed[:3]:
+                print(f"   ✗ {code}: {message}")
+        
+        fan_out(
+            ((index, {'codes': chunk}) for index, chunk in enumerate(chunks, start=1)),
+            commit_chunk,
+            max_in_flight=MAX_IN_FLIGHT,
+            on_done=report,
+        )
+        if not conflicts:
+            break
+        # Mã vừa bị tạo trước (chạy song song) => chỉ sinh lại đúng các mã đó
+        print(f"   ♻ {len(conflicts)} mã đã tồn tại khi ghi, sinh lại...")
+        rejected.update(conflicts)
+        pending = sorted(generate_unique_codes(
+            len(conflicts), length, exclude=rejected | set(created), prefix=prefix))
+    
+    with LocalCache() as cache:
+        cache.put_many('reward_codes', created, data)
+    
+    if output_path is None:
+        output_path = f"codes_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(created) + '\n')
+    
+    print(f"\n✅ Đã tạo {len(created):,}/{count:,} mã")
+    print(f"💰 {coins:,} | 💎 {diamonds:,} | ⭐ {xp:,} | 👥 {max_claims or '∞'} lượt/mã")
+    print(f"💾 Danh sách mã: {output_path}")
+    
+    return created
+
+# Các field cần để hiển thị danh sách mã (select => chỉ tải đúng các field này)
+CODE_LIST_FIELDS = ['title', 'reward', 'is_active', 'expires_at', 'current_claims', 'max_claims', 'shard_count']
+
+def query_codes(db, show_inactive=False, expires_after=None, expires_before=None):
+    """
+    Query danh sách mã, có sắp xếp để phân trang bằng cursor
+    
+    Lọc theo expires_at thì sắp xếp theo expires_at (cần composite index
+    is_active + expires_at khi chỉ lấy mã đang hoạt động), không thì theo mã.
+    """
     query = db.collection('reward_codes')
     if not show_inactive:
-        query = query.where('is_active', '==', True)
+        query = query.where(filter=firestore.FieldFilter('is_active', '==', True))
+    if expires_after is not None:
+        query = query.where(filter=firestore.FieldFilter('expires_at', '>=', expires_after))
+    if expires_before is not None:
+        query = query.where(filter=firestore.FieldFilter('expires_at', '<', expires_before))
+    if expires_after is not None or expires_before is not None:
+        query = query.order_by('expires_at')
+    return query.order_by('__name__').select(CODE_LIST_FIELDS)
+
+def list_codes(
+    db,
+    show_inactive=False,
+    page_size: int = PAGE_SIZE,
+    expires_after=None,
+    expires_before=None,
+    interactive: bool = True,
+):
+    """
+    Liệt kê mã thưởng theo trang
     
-    docs = query.stream()
+    Args:
+        show_inactive: Hiện cả mã đã vô hiệu
+        page_size: Số mã mỗi trang
+        expires_after, expires_before: Lọc theo khoảng expires_at (datetime)
+        interactive: Hỏi trước khi tải trang tiếp theo
+    """
+    query = query_codes(db, show_inactive, expires_after, expires_before)
     
     print(f"\n{'='*60}")
     print("📋 DANH SÁCH MÃ THƯỞNG")
     print(f"{'='*60}")
     
     count = 0
-    for doc in docs:
-        count += 1
-        data = doc.to_dict()
-        reward = data.get('reward', {})
-        
-        status = "✅" if data.get('is_active') else "❌"
-        expires = data.get('expires_at')
-        expires_str = expires.strftime('%d/%m/%Y') if expires else "Không"
+    for page_number, page in enumerate(iter_pages(query, page_size), start=1):
+        # Mã chia shard: cộng các shard (song song, chỉ mã có shard mới tốn RPC)
+        totals = claim_totals(db, ((doc.id, doc.to_dict()) for doc in page))
+        for doc in page:
+            count += 1
+            data = doc.to_dict()
+            reward = data.get('reward', {})
+            
+            status = "✅" if data.get('is_active') else "❌"
+            expires = data.get('expires_at')
+            expires_str = expires.strftime('%d/%m/%Y') if expires else "Không"
+            
+            print(f"\n{status} {doc.id}")
+            print(f"   📌 {data.get('title', 'N/A')}")
+            print(f"   💰 {reward.get('coins', 0):,} | 💎 {reward.get('diamonds', 0):,} | ⭐ {reward.get('xp', 0):,}")
+            shards = f" | ⚡ {data['shard_count']} shard" if data.get('shard_count') else ""
+            print(f"   👥 {totals[doc.id]}/{data.get('max_claims', 0) or '∞'} | ⏰ {expires_str}{shards}")
         
-        print(f"\n{status} {doc.id}")
-        print(f"   📌 {data.get('title', 'N/A')}")
-        print(f"   💰 {reward.get('coins', 0):,} | 💎 {reward.get('diamonds', 0):,} | ⭐ {reward.get('xp', 0):,}")
-        print(f"   👥 {data.get('current_claims', 0)}/{data.get('max_claims', 0) or '∞'} | ⏰ {expires_str}")
+        if len(page) < page_size:
+            break
+        print(f"\n--- Trang {page_number} | Mã cuối: {page[-1].id} ---")
+        if interactive and input("Enter = trang tiếp, q = dừng: ").strip().lower() == 'q':
+            break
     
     print(f"\n{'='*60}")
     print(f"Tổng: {count} mã")
     print(f"{'='*60}\n")
 
 def deactivate_code(db, code: str):
-    """Vô hiệu hóa mã thưởng"""
-    code = code.upper().strip()
-    doc_ref = db.collection('reward_codes').document(code)
+    """Vô hiệu hóa mã thưởng (update tự kèm điều kiện tồn tại => 1 round trip mỗi ID thử)"""
+    candidates = reward_code_format.code_candidates(code) or [code]
+    for code in candidates:
+        doc_ref = db.collection('reward_codes').document(code)
+        try:
+            doc_ref.update({'is_active': False, 'updated_at': firestore.SERVER_TIMESTAMP})
+        except exceptions.NotFound:
+            with LocalCache() as cache:
+                cache.delete('reward_codes', code)
+            continue
+        with LocalCache() as cache:
+            cache.update('reward_codes', code, {'is_active': False})
+        print(f"✅ Đã vô hiệu hóa mã '{code}'")
+        return True
+    print(f"❌ Mã '{candidates[0]}' không tồn tại!")
+    return False
+
+def delete_code(db, code: str):
+    """Xóa mã thưởng (xóa kèm điều kiện exists=True => 1 round trip mỗi ID thử) và shard đếm nếu có"""
+    candidates = reward_code_format.code_candidates(code) or [code]
+    for code in candidates:
+        doc_ref = db.collection('reward_codes').document(code)
+        try:
+            doc_ref.delete(option=db.write_option(exists=True))
+        except (exceptions.NotFound, exceptions.FailedPrecondition):
+            continue
+        finally:
+            with LocalCache() as cache:
+                cache.delete('reward_codes', code)
+        delete_claim_shards(db, doc_ref)
+        print(f"✅ Đã xóa mã '{code}'")
+        return True
+    print(f"❌ Mã '{candidates[0]}' không tồn tại!")
+    return False
+
+def read_code_file(path: str):
+    """Generator đọc mã từ file (mỗi dòng 1 mã, bỏ dòng trống / '#'; '-' = stdin)"""
+    f = sys.stdin if path == '-' else open(path, encoding='utf-8-sig')
+    try:
+        for line in f:
+            code = line.split(',')[0].strip()
+            if code and not code.startswith('#'):
+                yield code
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def iter_codes_by_title_prefix(db, prefix: str):
+    """Generator mã có tiêu đề bắt đầu bằng `prefix` (query khoảng, chỉ lấy ID)"""
+    query = (db.collection('reward_codes')
+             .where(filter=firestore.FieldFilter('title', '>=', prefix))
+             .where(filter=firestore.FieldFilter('title', '<', prefix + '\uf8ff'))
+             .order_by('title')
+             .select(['title']))
+    for page in iter_pages(query, MAX_BULK_WRITES):
+        for doc in page:
+            yield doc.id
+
+def _write_codes_bulk(db, codes, purge: bool, dry_run: bool = False, missing_path: str = None):
+    """
+    Vô hiệu hóa / xóa hàng loạt mã bằng BatchWrite kèm điều kiện tồn tại
+    
+    Mỗi lô ≤ 500 mã là 1 RPC, các lô commit song song. Mã không tồn tại được
+    nhận ra từ trạng thái trả về của từng thao tác, không cần get() trước.
+    
+    Returns:
+        dict: done / missing / failed (list mã)
+    """
+    verb = 'xóa' if purge else 'vô hiệu hóa'
+    # Chuẩn hóa như app + bỏ trùng (1 BatchWrite không được ghi 2 lần cùng document)
+    unique, fallback = [], {}
+    for code in codes:
+        candidates = reward_code_format.code_candidates(code)
+        if candidates:
+            unique.append(candidates[0])
+            if len(candidates) > 1:
+                fallback[candidates[0]] = candidates[1]  # ID nguyên văn, thử nếu dạng chuẩn không tồn tại
+    unique = list(dict.fromkeys(unique))
+    print(f"\n🗂 {verb.capitalize()} {len(unique):,} mã...")
+    result = {'done': [], 'missing': [], 'failed': []}
+    if dry_run:
+        print(f"   🧪 Dry run: không ghi gì. Ví dụ: {', '.join(unique[:5])}")
+        return result
+    
+    collection = db.collection('reward_codes')
+    exists = db.write_option(exists=True)
+    
+    shards = {}
+    
+    def commit_chunk(task):
+        if purge:
+            # Đọc shard_count trước khi xóa (sau khi xóa không còn biết mã có shard)
+            task['shards'] = shard_refs_by_code(db, task['codes'])
+        batch = bulk_batch(db)
+        for code in task['codes']:
+            if purge:
+                batch.delete(collection.document(code), option=exists)
+            else:
+                batch.update(collection.document(code), {
+                    'is_active': False,
+                    'updated_at': firestore.SERVER_TIMESTAMP,
+                })
+        task['results'] = split_results(task['codes'], batch.commit())
+    
+    progress = ProgressLine(f"🗂 Đã {verb}", len(unique))
+    with LocalCache() as cache:
+        def run(ids, retry):
+            """1 lượt ghi; mã không tồn tại có ID nguyên văn khác được gom vào `retry` (nếu có)"""
+            chunks = [ids[i:i + MAX_BULK_WRITES] for i in range(0, len(ids), MAX_BULK_WRITES)]
+            
+            def report(index, task, error):
+                if error is not None:
+                    progress.note(f"   ✗ Lô {index}/{len(chunks)}: {error}")
+                    result['failed'].extend(task['codes'])
+                    progress.update(failed=len(task['codes']))
+                    return
+                ok, missing, failed = task['results']
+                if purge:
+                    cache.delete_many('reward_codes', ok + missing)
+                    shards.update((code, task['shards'][code]) for code in ok if code in task['shards'])
+                else:
+                    cache.update_many('reward_codes', ok, {'is_active': False})
+                    cache.delete_many('reward_codes', missing)
+                if retry is not None:
+                    retry.extend(fallback[code] for code in missing if code in fallback)
+                    missing = [code for code in missing if code not in fallback]
+                result['done'].extend(ok)
+                result['missing'].extend(missing)
+                result['failed'].extend(code for code, _ in failed)
+                for code, message in failed[:3]:
+                    progress.note(f"   ✗ {code}: {message}")
+                progress.update(success=len(ok), failed=len(missing) + len(failed))
+            
+            fan_out(
+                ((index, {'codes': chunk}) for index, chunk in enumerate(chunks, start=1)),
+                commit_chunk,
+                max_in_flight=MAX_IN_FLIGHT,
+                on_done=report,
+            )
+        
+        retry = []
+        run(unique, retry)
+        seen = set(unique)
+        retry = [code for code in dict.fromkeys(retry) if code not in seen]
+        if retry:
+            run(retry, None)
     
-    if not doc_ref.get().exists:
-        print(f"❌ Mã '{code}' không tồn tại!")
-        return False
+    if purge:
+        # Shard đếm không tự bị xóa theo mã (mã tạo lại cùng ID sẽ kế thừa count cũ)
+        if shards:
+            count = delete_shard_refs(db, [ref for refs in shards.values() for ref in refs])
+            print(f"   🧩 Đã xóa {count:,} shard đếm của {len(shards):,} mã")
+    progress.finish()
     
-    doc_ref.update({'is_active': False})
-    print(f"✅ Đã vô hiệu hóa mã '{code}'")
-    return True
+    print(f"   ✅ Đã {verb}: {len(result['done']):,}")
+    if result['missing']:
+        print(f"   ❓ Không tồn tại: {len(result['missing']):,} "
+              f"({', '.join(result['missing'][:10])}{', ...' if len(result['missing']) > 10 else ''})")
+        if missing_path:
+            with open(missing_path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(result['missing']) + '\n')
+            print(f"   💾 Danh sách mã không tồn tại: {missing_path}")
+    if result['failed']:
+        print(f"   ⚠ Lỗi: {len(result['failed']):,} mã, chạy lại để thử tiếp")
+    return result
 
-def delete_code(db, code: str):
-    """Xóa mã thưởng"""
-    code = code.upper().strip()
-    doc_ref = db.collection('reward_codes').document(code)
+def deactivate_codes_bulk(db, codes, dry_run: bool = False, missing_path: str = None):
+    """Vô hiệu hóa hàng loạt mã (list / generator, vd: read_code_file, iter_codes_by_title_prefix)"""
+    return _write_codes_bulk(db, codes, False, dry_run, missing_path)
+
+def delete_codes_bulk(db, codes, dry_run: bool = False, missing_path: str = None):
+    """Xóa hàng loạt mã (list / generator, vd: read_code_file, iter_codes_by_title_prefix)"""
+    return _write_codes_bulk(db, codes, True, dry_run, missing_path)
+
+def sweep_expired_codes(db, purge: bool = False, grace_days: int = 0, dry_run: bool = False):
+    """
+    Dọn hàng loạt mã đã hết hạn
     
-    if not doc_ref.get().exists:
-        print(f"❌ Mã '{code}' không tồn tại!")
-        return False
+    Args:
+        purge: True = xóa hẳn, False = chỉ vô hiệu hóa (giữ lịch sử)
+        grace_days: Chỉ dọn mã đã hết hạn quá N ngày
+        dry_run: Chỉ đếm, không ghi
+    """
+    action = 'delete' if purge else 'deactivate'
+    verb = 'xóa' if purge else 'vô hiệu hóa'
+    print(f"\n🧹 {'Đếm' if dry_run else 'Dọn'} mã đã hết hạn ({verb})...")
+    codes = db.collection('reward_codes')
+    stats = sweep_expired(
+        db, codes, action, 'reward_codes', grace_days, dry_run,
+        # Xóa hẳn => xóa shard đếm cùng batch với mã
+        extra_fields=('shard_count',),
+        children=lambda code, data: shard_refs(codes.document(code), data.get('shard_count')),
+    )
+    if dry_run:
+        print(f"   🔎 Có {stats['matched']:,} mã hết hạn cần {verb}")
+    else:
+        print(f"   ✅ Đã {verb} {stats['processed']:,}/{stats['matched']:,} mã hết hạn")
+    if stats['failed']:
+        print(f"   ⚠ {stats['failed']:,} mã lỗi, chạy lại để dọn tiếp")
+    return stats
+
+def search_codes(
+    db,
+    prefix: str = None,
+    title: str = None,
+    min_coins: int = None,
+    max_coins: int = None,
+    full_sync: bool = False,
+):
+    """Tìm mã trong cache cục bộ (tự sync tăng dần nếu cache đã cũ)"""
+    with LocalCache() as cache:
+        if full_sync:
+            print(f"🔄 Đã sync đầy đủ {cache.sync(db, 'reward_codes', full=True):,} mã")
+        elif cache.ensure_fresh(db, 'reward_codes'):
+            print("🔄 Đã cập nhật cache từ server")
+        results = cache.search(
+            'reward_codes', prefix.upper() if prefix else None, title, min_coins, max_coins
+        )
     
-    doc_ref.delete()
-    print(f"✅ Đã xóa mã '{code}'")
-    return True
+    print(f"\n{'='*60}")
+    print("🔎 KẾT QUẢ TÌM MÃ (cache cục bộ)")
+    print(f"{'='*60}")
+    for code, data in results:
+        reward = data.get('reward', {})
+        status = "✅" if data.get('is_active') else "❌"
+        print(f"{status} {code} | {data.get('title', 'N/A')} | "
+              f"💰 {reward.get('coins', 0):,} | 💎 {reward.get('diamonds', 0):,} | ⭐ {reward.get('xp', 0):,} | "
+              f"👥 {data.get('current_claims', 0)}/{data.get('max_claims', 0) or '∞'}")
+    print(f"{'='*60}")
+    print(f"Tìm thấy: {len(results)} mã")
+    print(f"{'='*60}\n")
+    return results
 
 def interactive_menu():
     """Menu tương tác"""
@@ -183,6 +654,12 @@ def interactive_menu():
         print("3. Xem danh sách mã")
         print("4. Vô hiệu hóa mã")
         print("5. Xóa mã")
+        print("6. Tạo nhiều mã (hàng loạt)")
+        print("7. Tìm mã (cache cục bộ)")
+        print("8. Dọn mã đã hết hạn")
+        print("9. Vô hiệu hóa / xóa hàng loạt")
+        print("10. Báo cáo lượt nhận (aggregation)")
+        print("11. Chia shard cho mã hot")
         print("0. Thoát")
         print("="*40)
         
@@ -199,11 +676,12 @@ def interactive_menu():
             expires = input("Hết hạn sau (ngày, Enter = không): ").strip()
             expires_days = int(expires) if expires else None
             max_claims = int(input("Giới hạn lượt (0 = không): ").strip() or 0)
+            shards = int(input("Số shard cho mã hot (0 = không chia): ").strip() or 0)
             
             create_reward_code(
                 db, code, title, description,
                 coins, diamonds, xp,
-                expires_days, max_claims
+                expires_days, max_claims, shards
             )
             
         elif choice == "2":
@@ -219,7 +697,12 @@ def interactive_menu():
             
         elif choice == "3":
             show_all = input("Hiện cả mã đã vô hiệu? (y/N): ").lower() == 'y'
-            list_codes(db, show_all)
+            within = input("Chỉ mã hết hạn trong N ngày tới (Enter = tất cả): ").strip()
+            if within:
+                now = datetime.now()
+                list_codes(db, show_all, expires_after=now, expires_before=now + timedelta(days=int(within)))
+            else:
+                list_codes(db, show_all)
             
         elif choice == "4":
             code = input("Nhập mã cần vô hiệu hóa: ").strip()
@@ -233,6 +716,84 @@ def interactive_menu():
                 if confirm == 'y':
                     delete_code(db, code)
                     
+        elif choice == "6":
+            print("\n--- TẠO NHIỀU MÃ ---")
+            count = int(input("Số lượng mã: ").strip() or 0)
+            if count <= 0:
+                print("❌ Số lượng phải lớn hơn 0!")
+                continue
+            title = input("Tiêu đề: ").strip() or "Mã thưởng"
+            description = input("Mô tả: ").strip() or "Nhập mã để nhận quà"
+            coins = int(input("Coins (0): ").strip() or 0)
+            diamonds = int(input("Diamonds (0): ").strip() or 0)
+            xp = int(input("XP (0): ").strip() or 0)
+            expires = input("Hết hạn sau (ngày, Enter = không): ").strip()
+            expires_days = int(expires) if expires else None
+            max_claims = int(input("Giới hạn lượt mỗi mã (1): ").strip() or 1)
+            prefix = input("Tiền tố đợt (VD: TET25, Enter = không): ").strip() or None
+            
+            try:
+                create_reward_codes_bulk(
+                    db, count, title, description,
+                    coins, diamonds, xp,
+                    expires_days, max_claims, prefix=prefix
+                )
+            except ValueError as e:
+                print(f"❌ {e}")
+                    
+        elif choice == "7":
+            print("\n--- TÌM MÃ ---")
+            prefix = input("Tiền tố mã (Enter = bỏ qua): ").strip() or None
+            title = input("Tiêu đề chứa (Enter = bỏ qua): ").strip() or None
+            min_coins = input("Coins từ (Enter = bỏ qua): ").strip()
+            max_coins = input("Coins đến (Enter = bỏ qua): ").strip()
+            full_sync = input("Sync lại toàn bộ? (y/N): ").lower() == 'y'
+            search_codes(
+                db, prefix, title,
+                int(min_coins) if min_coins else None,
+                int(max_coins) if max_coins else None,
+                full_sync,
+            )
+                    
+        elif choice == "8":
+            purge = input("Xóa hẳn thay vì vô hiệu hóa? (y/N): ").lower() == 'y'
+            grace = int(input("Chỉ dọn mã hết hạn quá N ngày (0): ").strip() or 0)
+            sweep_expired_codes(db, purge, grace, dry_run=True)
+            if input("Xác nhận? (y/N): ").lower() == 'y':
+                sweep_expired_codes(db, purge, grace)
+                    
+        elif choice == "9":
+            print("\n--- VÔ HIỆU HÓA / XÓA HÀNG LOẠT ---")
+            print("Nhập: @file (mỗi dòng 1 mã) | title:<tiền tố tiêu đề> | danh sách mã cách nhau bởi dấu phẩy")
+            source = input("Nguồn: ").strip()
+            if not source:
+                continue
+            if source.startswith('@'):
+                codes = list(read_code_file(source[1:]))
+            elif source.startswith('title:'):
+                codes = list(iter_codes_by_title_prefix(db, source[len('title:'):]))
+            else:
+                codes = [code for code in source.split(',') if code.strip()]
+            print(f"📋 {len(codes):,} mã. Ví dụ: {', '.join(codes[:5])}")
+            purge = input("Xóa hẳn thay vì vô hiệu hóa? (y/N): ").lower() == 'y'
+            if codes and input("Xác nhận? (y/N): ").lower() == 'y':
+                if purge:
+                    delete_codes_bulk(db, codes)
+                else:
+                    deactivate_codes_bulk(db, codes)
+                    
+        elif choice == "10":
+            top = int(input("Số mã top (10): ").strip() or 10)
+            redemption_report(db, top)
+            if input("Backfill field 'code' cho lượt nhận cũ? (y/N): ").lower() == 'y':
+                backfill_claim_codes(db)
+                    
+        elif choice == "11":
+            code = input("Nhập mã: ").strip()
+            shards = int(input("Số shard: ").strip() or 0)
+            if code and shards > 0:
+                set_claim_shards(db, code, shards)
+                    
         elif choice == "0":
             print("👋 Tạm biệt!")
             break
@@ -240,7 +801,8 @@ def interactive_menu():
 if __name__ == "__main__":
     print("🚀 Khởi động script quản lý mã thưởng...")
     try:
-        interactive_menu()
+        with run_metrics(labels={'script': 'create_reward_code'}):
+            interactive_menu()
     except FileNotFoundError:
         print(f"\n❌ Không tìm thấy file '{SERVICE_ACCOUNT_PATH}'")
         print("📝 Hướng dẫn:")
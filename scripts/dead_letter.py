@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+File dead-letter: người nhận vẫn gửi lỗi sau khi đã thử lại
+
+Mỗi dòng NDJSON là 1 người nhận kèm đủ thông tin để gửi lại đúng thư đó
+(cùng mail_id_prefix => cùng mail ID, gửi lại không bị nhân đôi):
+
+    {"mssv": "110122001", "fields": null, "mail_id_prefix": "mail_...", "params": {...},
+     "campaign_id": "tet2025", "error": "503 ...", "failed_at": "2025-01-20T08:00:00"}
+
+`fields` là phần ghi đè riêng của người nhận (thư theo mẫu), `params` là
+tham số thư (title, content, mail_type, coins, diamonds, xp, expires_days).
+Gửi lại bằng send_mail.redrive_dead_letters / `tvu_admin.py mail redrive`.
+"""
+
+from datetime import datetime
+import json
+import os
+
+# ============ CẤU HÌNH ============
+DEAD_LETTER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dead_letters.ndjson")
+# ==================================
+
+
+class DeadLetters:
+    """Ghi nối thêm vào file dead-letter (mở file khi có lỗi đầu tiên)"""
+
+    def __init__(self, path: str = DEAD_LETTER_PATH):
+        self.path = path
+        self.count = 0
+        self._file = None
+
+    def add(self, items, mail_id_prefix: str, params: dict, error, campaign_id: str = None):
+        """items: MSSV hoặc (mssv, field riêng) của 1 batch lỗi"""
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        failed_at = datetime.now().isoformat(timespec='seconds')
+        for item in items:
+            mssv, fields = item if isinstance(item, tuple) else (item, None)
+            self._file.write(json.dumps({
+                'mssv': mssv, 'fields': fields, 'mail_id_prefix': mail_id_prefix, 'params': params,
+                'campaign_id': campaign_id, 'error': str(error), 'failed_at': failed_at,
+            }, ensure_ascii=False, default=str) + '\n')
+            self.count += 1
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_dead_letters(path: str):
+    """
+    Đọc file dead-letter, gom theo thư
+
+    Returns:
+        list: [(campaign_id, mail_id_prefix, params, [mssv hoặc (mssv, fields)])]
+            theo thứ tự xuất hiện; MSSV trùng (lỗi nhiều lần) chỉ giữ lần cuối
+    """
+    groups = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            key = (entry.get('campaign_id'), entry['mail_id_prefix'], json.dumps(entry['params'], sort_keys=True))
+            items = groups.setdefault(key, {})
+            items.pop(entry['mssv'], None)
+            items[entry['mssv']] = (entry['mssv'], entry['fields']) if entry.get('fields') else entry['mssv']
+    return [(campaign_id, prefix, json.loads(params), list(items.values()))
+            for (campaign_id, prefix, params), items in groups.items()]
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Dọn document đã hết hạn (expires_at < bây giờ) theo lô
+
+Query theo `expires_at` từng trang (chỉ lấy các field cần thiết), mỗi trang
+thành 1 batch (≤ 500 thao tác) và commit song song qua fan_out, nên dọn
+hàng chục nghìn document chỉ tốn vài chục round trip. Document không có
+expires_at (vĩnh viễn) không bao giờ khớp query.
+
+Chế độ vô hiệu hóa chỉ query document còn is_active == True, để document đã
+vô hiệu không bị đọc lại mỗi lần chạy (cần composite index
+is_active + expires_at, cùng index với create_reward_code.query_codes).
+
+Dùng qua send_mail.sweep_expired_mails và
+create_reward_code.sweep_expired_codes.
+"""
+
+from datetime import datetime, timedelta
+
+from fanout import fan_out
+from lazy_import import lazy_module
+from local_cache import LocalCache
+from paging import iter_pages
+from recipients import ProgressLine
+
+firestore = lazy_module('firebase_admin.firestore')
+
+# ============ CẤU HÌNH ============
+SWEEP_PAGE_SIZE = 500  # Số document mỗi trang = mỗi batch (giới hạn batch là 500)
+MAX_IN_FLIGHT = 8  # Số batch được commit song song
+# ==================================
+
+ACTIONS = ('delete', 'deactivate')
+
+
+def expired_query(collection_ref, grace_days: int = 0, fields=('expires_at',), active_only: bool = False):
+    """Query các document có expires_at trước (bây giờ - grace_days), cũ nhất trước"""
+    cutoff = datetime.now() - timedelta(days=grace_days)
+    if active_only:
+        collection_ref = collection_ref.where(filter=firestore.FieldFilter('is_active', '==', True))
+    return (collection_ref
+            .where(filter=firestore.FieldFilter('expires_at', '<', cutoff))
+            .order_by('expires_at')
+            .select(list(fields)))
+
+
+def sweep_expired(
+    db,
+    collection_ref,
+    action: str,
+    cache_collection: str,
+    grace_days: int = 0,
+    dry_run: bool = False,
+    max_in_flight: int = MAX_IN_FLIGHT,
+    extra_fields=(),
+    children=None,
+):
+    """
+    Vô hiệu hóa (is_active = False) hoặc xóa các document đã hết hạn
+
+    Args:
+        collection_ref: Collection cần dọn
+        action: 'delete' hoặc 'deactivate'
+        cache_collection: Tên collection trong LocalCache để cập nhật theo
+        grace_days: Chỉ dọn document đã hết hạn quá N ngày
+        dry_run: Chỉ đếm, không ghi
+        extra_fields: Field cần đọc thêm cho `children`
+        children: children(doc_id, data) => list reference xóa cùng batch với
+            document khi action = 'delete' (vd: shard đếm của mã thưởng)
+
+    Returns:
+        dict: matched / processed / failed
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"action phải là một trong {ACTIONS}")
+
+    fields = ('expires_at',) + (tuple(extra_fields) if action == 'delete' else ())
+    extra = {}  # doc_id => reference con xóa kèm
+    query = expired_query(collection_ref, grace_days, fields, active_only=action == 'deactivate')
+    stats = {'matched': 0, 'processed': 0, 'failed': 0}
+    progress = ProgressLine("🧹 Đã dọn" if not dry_run else "🔎 Đã đếm")
+
+    def pages():
+        for page in iter_pages(query, SWEEP_PAGE_SIZE):
+            stats['matched'] += len(page)
+            ids = [doc.id for doc in page]
+            if action == 'delete' and children is not None:
+                for doc in page:
+                    refs = children(doc.id, doc.to_dict() or {})
+                    if refs:
+                        extra[doc.id] = refs
+            if dry_run:
+                progress.update(success=len(ids))
+                continue
+            # Chia lại để mỗi batch (document + reference con) ≤ SWEEP_PAGE_SIZE thao tác
+            group, size = [], 0
+            for doc_id in ids:
+                ops = 1 + len(extra.get(doc_id, ()))
+                if group and size + ops > SWEEP_PAGE_SIZE:
+                    yield group
+                    group, size = [], 0
+                group.append(doc_id)
+                size += ops
+            if group:
+                yield group
+
+    def commit_page(ids):
+        batch = db.batch()
+        for doc_id in ids:
+            if action == 'delete':
+                batch.delete(collection_ref.document(doc_id))
+                for ref in extra.get(doc_id, ()):
+                    batch.delete(ref)
+            else:
+                batch.update(collection_ref.document(doc_id), {
+                    'is_active': False,
+                    'updated_at': firestore.SERVER_TIMESTAMP,
+                })
+        batch.commit()
+
+    with LocalCache() as cache:
+        def report(index, ids, error):
+            if error is not None:
+                progress.note(f"   ✗ Batch {index}: {error}")
+                progress.update(failed=len(ids))
+                return
+            if action == 'delete':
+                cache.delete_many(cache_collection, ids)
+                for doc_id in ids:
+                    extra.pop(doc_id, None)
+            else:
+                cache.update_many(cache_collection, ids, {'is_active': False})
+            progress.update(success=len(ids))
+
+        fan_out(enumerate(pages(), start=1), commit_page,
+                max_in_flight=max_in_flight, on_done=report)
+    progress.finish()
+
+    stats['processed'] = 0 if dry_run else progress.success
+    stats['failed'] = progress.failed
+    return stats
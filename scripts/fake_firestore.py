@@ -0,0 +1,706 @@
+#!/usr/bin/env python3
+"""
+Firestore giả lập trong bộ nhớ (chỉ dùng cho benchmark / chạy thử offline)
+
+Mô phỏng phần API của google-cloud-firestore mà các script đang dùng:
+collection/document, set/create/update/delete, batch, get_all, where/order_by/
+limit/start_after/select, collection_group, get_partitions, count/sum.
+
+Mỗi RPC được đếm vào `client.rpc_counts`, thời gian từng RPC ghi vào
+`client.rpc_latencies` (giây), và có thể cộng thêm độ trễ giả (`latency`
+giây) để đo ảnh hưởng của số round trip.
+
+Yêu cầu:
+- pip install firebase-admin (dùng lại sentinel/transform và exception của SDK)
+"""
+
+import bisect
+import copy
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from google.api_core import exceptions
+from google.cloud.firestore_v1 import transforms
+
+MAX_BATCH_WRITES = 500
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _get_field(data, field_path: str):
+    """Lấy giá trị theo field path dạng 'a.b.c' (None nếu không có)"""
+    value = data
+    for part in field_path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _has_field(data, field_path: str) -> bool:
+    value = data
+    for part in field_path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return False
+        value = value[part]
+    return True
+
+
+def _set_field(data: dict, field_path: str, value):
+    parts = field_path.split('.')
+    for part in parts[:-1]:
+        data = data.setdefault(part, {})
+    data[parts[-1]] = value
+
+
+def _delete_field(data: dict, field_path: str):
+    parts = field_path.split('.')
+    for part in parts[:-1]:
+        data = data.get(part)
+        if not isinstance(data, dict):
+            return
+    data.pop(parts[-1], None)
+
+
+def _apply_transforms(value, old, now):
+    """Thay sentinel (SERVER_TIMESTAMP, Increment, ...) bằng giá trị thật"""
+    if value is transforms.SERVER_TIMESTAMP:
+        return now
+    if isinstance(value, transforms.Increment):
+        return (old if isinstance(old, (int, float)) else 0) + value.value
+    if isinstance(value, transforms.Maximum):
+        return value.value if not isinstance(old, (int, float)) else max(old, value.value)
+    if isinstance(value, transforms.Minimum):
+        return value.value if not isinstance(old, (int, float)) else min(old, value.value)
+    if isinstance(value, transforms.ArrayUnion):
+        result = list(old) if isinstance(old, list) else []
+        result.extend(v for v in value.values if v not in result)
+        return result
+    if isinstance(value, transforms.ArrayRemove):
+        return [v for v in (old if isinstance(old, list) else []) if v not in value.values]
+    if isinstance(value, dict):
+        old = old if isinstance(old, dict) else {}
+        return {k: _apply_transforms(v, old.get(k), now) for k, v in value.items()}
+    return value
+
+
+def _sort_key(value):
+    """Thứ tự so sánh gần giống Firestore giữa các kiểu khác nhau"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.astimezone(timezone.utc)
+        return (3, value.timestamp())
+    if isinstance(value, str):
+        return (4, value)
+    return (5, str(value))
+
+
+def _matches(data, doc_id, field, op, value):
+    if field == '__name__':
+        actual = doc_id
+    else:
+        if not _has_field(data, field):
+            return False
+        actual = _get_field(data, field)
+    if op == '==':
+        return actual == value
+    if op == '!=':
+        return actual != value
+    if op == 'in':
+        return actual in value
+    if op == 'not-in':
+        return actual not in value
+    if op == 'array_contains':
+        return isinstance(actual, list) and value in actual
+    if op == 'array_contains_any':
+        return isinstance(actual, list) and any(v in actual for v in value)
+    a, b = _sort_key(actual), _sort_key(value)
+    if a[0] != b[0]:
+        return False
+    if op == '<':
+        return a < b
+    if op == '<=':
+        return a <= b
+    if op == '>':
+        return a > b
+    if op == '>=':
+        return a >= b
+    raise ValueError(f"Toán tử không hỗ trợ: {op}")
+
+
+class FakeWriteResult:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data, update_time=None):
+        self.reference = reference
+        self._data = data
+        self.update_time = update_time
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        return _get_field(self._data or {}, field_path)
+
+
+class FakeDocumentReference:
+    def __init__(self, client, path: str):
+        self._client = client
+        self.path = path
+
+    @property
+    def id(self):
+        return self.path.rsplit('/', 1)[-1]
+
+    @property
+    def parent(self):
+        return FakeCollectionReference(self._client, self.path.rsplit('/', 1)[0])
+
+    def collection(self, collection_id: str):
+        return FakeCollectionReference(self._client, f"{self.path}/{collection_id}")
+
+    def collections(self):
+        with self._client._rpc('list_collections'):
+            return [FakeCollectionReference(self._client, p)
+                    for p in self._client._child_collections(self.path)]
+
+    def get(self, field_paths=None, transaction=None):
+        with self._client._rpc('read'):
+            return self._client._snapshot(self, field_paths)
+
+    def set(self, document_data, merge=False):
+        return self._client._commit([('set', self, document_data, merge)])[0]
+
+    def create(self, document_data):
+        return self._client._commit([('create', self, document_data, None)])[0]
+
+    def update(self, field_updates, option=None):
+        return self._client._commit([('update', self, field_updates, option)])[0]
+
+    def delete(self, option=None):
+        return self._client._commit([('delete', self, None, option)])[0]
+
+
+class FakeAggregationQuery:
+    def __init__(self, query):
+        self._query = query
+        self._aggregations = []
+
+    def count(self, alias=None):
+        self._aggregations.append(('count', None, alias or 'count'))
+        return self
+
+    def sum(self, field_ref, alias=None):
+        self._aggregations.append(('sum', field_ref, alias or f"sum_{field_ref}"))
+        return self
+
+    def get(self, transaction=None):
+        with self._query._client._rpc('aggregate'):
+            docs = self._query._run()
+        result = []
+        for kind, field, alias in self._aggregations:
+            if kind == 'count':
+                value = len(docs)
+            else:
+                value = sum(v for _, data in docs
+                            for v in [_get_field(data, field)]
+                            if isinstance(v, (int, float)) and not isinstance(v, bool))
+            result.append(_AggregationResult(alias, value))
+        return [result]
+
+
+class _AggregationResult:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class FakeQuery:
+    def __init__(self, client, parent_path: str, all_descendants=False):
+        self._client = client
+        self._parent_path = parent_path
+        self._all_descendants = all_descendants
+        self._filters = []
+        self._orders = []
+        self._limit = None
+        self._start_after = None
+        self._projection = None
+        self._name_range = None  # (từ path, tới trước path) của 1 partition
+
+    def _copy(self):
+        query = copy.copy(self)
+        query._filters = list(self._filters)
+        query._orders = list(self._orders)
+        return query
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        query = self._copy()
+        query._filters.append((field_path, op_string, value))
+        return query
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        query = self._copy()
+        query._orders.append((field_path, direction))
+        return query
+
+    def limit(self, count):
+        query = self._copy()
+        query._limit = count
+        return query
+
+    def start_after(self, document_fields_or_snapshot):
+        query = self._copy()
+        query._start_after = document_fields_or_snapshot
+        return query
+
+    def select(self, field_paths):
+        query = self._copy()
+        query._projection = list(field_paths)
+        return query
+
+    def get_partitions(self, partition_count, retry=None, timeout=None):
+        """Chia theo path document thành tối đa partition_count khoảng liên tiếp"""
+        with self._client._rpc('partition_query'):
+            paths = sorted(path for path, _ in self._client._query_docs(self._parent_path, self._all_descendants))
+        step = -(-len(paths) // partition_count) if paths and partition_count > 1 else 0
+        cursors = [None] + (paths[step::step] if step else []) + [None]
+        return [FakeQueryPartition(self, start, end) for start, end in zip(cursors, cursors[1:])]
+
+    def count(self, alias=None):
+        return FakeAggregationQuery(self).count(alias)
+
+    def sum(self, field_ref, alias=None):
+        return FakeAggregationQuery(self).sum(field_ref, alias)
+
+    def _run(self):
+        fast = self._run_by_name()
+        if fast is not None:
+            return fast
+        docs = self._client._query_docs(self._parent_path, self._all_descendants)
+        docs = [(path, data) for path, data in docs
+                if all(_matches(data, path.rsplit('/', 1)[-1], f, op, v)
+                       for f, op, v in self._filters)]
+        if self._name_range is not None:
+            start, end = self._name_range
+            docs = [(p, d) for p, d in docs if (start is None or p >= start) and (end is None or p < end)]
+        # Firestore bỏ qua document thiếu field dùng để order_by
+        for field, _ in self._orders:
+            if field != '__name__':
+                docs = [(p, d) for p, d in docs if _has_field(d, field)]
+        docs.sort(key=lambda item: item[0])
+        for field, direction in reversed(self._orders):
+            docs.sort(
+                key=lambda item: _sort_key(item[0] if field == '__name__' else _get_field(item[1], field)),
+                reverse=direction in ('DESCENDING', 'desc'),
+            )
+        if self._start_after is not None:
+            docs = self._after_cursor(docs)
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        return docs
+
+    def _run_by_name(self):
+        """Đường tắt cho query sắp xếp theo ID có limit (phân trang): dùng bisect"""
+        if self._all_descendants or self._limit is None:
+            return None
+        if self._orders not in ([], [('__name__', 'ASCENDING')]):
+            return None
+        cursor = self._start_after
+        if cursor is not None and not isinstance(cursor, FakeSnapshot):
+            return None
+        paths = self._client._sorted_paths(self._parent_path)
+        start = bisect.bisect_right(paths, cursor.reference.path) if cursor is not None else 0
+        result = []
+        for path in paths[start:]:
+            data = self._client._docs.get(path)
+            if data is None:
+                continue
+            if all(_matches(data, path.rsplit('/', 1)[-1], f, op, v) for f, op, v in self._filters):
+                result.append((path, data))
+                if len(result) >= self._limit:
+                    break
+        return result
+
+    def _cursor_values(self, path, data):
+        # Firestore luôn ngầm thêm __name__ vào cuối thứ tự sắp xếp
+        fields = [f for f, _ in self._orders]
+        if '__name__' not in fields:
+            fields.append('__name__')
+        return [path if f == '__name__' else _get_field(data, f) for f in fields]
+
+    def _after_cursor(self, docs):
+        cursor = self._start_after
+        if isinstance(cursor, FakeSnapshot):
+            cursor_path = cursor.reference.path
+            for index, (path, _) in enumerate(docs):
+                if path == cursor_path:
+                    return docs[index + 1:]
+            cursor = self._cursor_values(cursor_path, cursor._data or {})
+        elif isinstance(cursor, dict):
+            cursor = [cursor.get(f) for f, _ in self._orders]
+        cursor_key = [_sort_key(v) for v in cursor]
+        result = []
+        for path, data in docs:
+            # Cursor dạng dict chỉ có các field order_by => so sánh đúng số phần tử đó
+            key = [_sort_key(v) for v in self._cursor_values(path, data)][:len(cursor_key)]
+            descending = self._orders and self._orders[0][1] in ('DESCENDING', 'desc')
+            if (key < cursor_key) if descending else (key > cursor_key):
+                result.append((path, data))
+        return result
+
+    def stream(self, transaction=None):
+        with self._client._rpc('query'):
+            snapshots = [self._snapshot(path, data) for path, data in self._run()]
+            self._client._count('read', len(snapshots))
+        yield from snapshots
+
+    def _snapshot(self, path, data):
+        if self._projection is not None:
+            projected = {}
+            for field in self._projection:
+                if _has_field(data, field):
+                    _set_field(projected, field, copy.deepcopy(_get_field(data, field)))
+            data = projected
+        return FakeSnapshot(FakeDocumentReference(self._client, path), copy.deepcopy(data))
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+
+class FakeQueryPartition:
+    def __init__(self, parent, start_at, end_at):
+        self._parent = parent
+        self.start_at = start_at
+        self.end_at = end_at
+
+    def query(self):
+        query = self._parent.order_by('__name__')
+        query._name_range = (self.start_at, self.end_at)
+        return query
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client, path: str):
+        super().__init__(client, path)
+        self.path = path
+
+    @property
+    def id(self):
+        return self.path.rsplit('/', 1)[-1]
+
+    def document(self, document_id=None):
+        if document_id is None:
+            document_id = self._client._auto_id()
+        return FakeDocumentReference(self._client, f"{self.path}/{document_id}")
+
+    def add(self, document_data):
+        doc_ref = self.document()
+        return doc_ref.set(document_data), doc_ref
+
+    def list_documents(self):
+        with self._client._rpc('list_documents'):
+            return [FakeDocumentReference(self._client, p)
+                    for p, _ in self._client._query_docs(self.path, False)]
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def _add(self, write):
+        if len(self._writes) >= MAX_BATCH_WRITES:
+            raise exceptions.InvalidArgument(f"Batch tối đa {MAX_BATCH_WRITES} thao tác")
+        self._writes.append(write)
+
+    def set(self, reference, document_data, merge=False):
+        self._add(('set', reference, document_data, merge))
+
+    def create(self, reference, document_data):
+        self._add(('create', reference, document_data, None))
+
+    def update(self, reference, field_updates, option=None):
+        self._add(('update', reference, field_updates, option))
+
+    def delete(self, reference, option=None):
+        self._add(('delete', reference, None, option))
+
+    def __len__(self):
+        return len(self._writes)
+
+    def commit(self, retry=None, timeout=None):
+        return self._client._commit(self._writes)
+
+
+class FakeBulkWriteBatch(FakeWriteBatch):
+    """BatchWrite: mỗi thao tác áp dụng độc lập, trả về trạng thái riêng"""
+
+    def commit(self, retry=None, timeout=None):
+        return self._client._batch_write(self._writes)
+
+
+class _Status:
+    def __init__(self, code, message=''):
+        self.code = code
+        self.message = message
+
+
+class _BatchWriteResponse:
+    def __init__(self, write_results, status):
+        self.write_results = write_results
+        self.status = status
+
+
+class FakeFirestore:
+    """
+    Client Firestore giả lập
+
+    Args:
+        latency: Độ trễ giả cho mỗi RPC (giây)
+        fail_rate: Tỉ lệ RPC ghi bị lỗi UNAVAILABLE (0..1) để thử retry
+    """
+
+    def __init__(self, latency: float = 0.0, fail_rate: float = 0.0, seed: int = 0):
+        import random
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self._random = random.Random(seed)
+        self._docs = {}
+        self._children = {}  # parent path => set path document con
+        self._sorted = {}  # parent path => list path đã sắp xếp (cache)
+        self._update_times = {}
+        self._lock = threading.Lock()
+        self._id_counter = 0
+        self.rpc_counts = Counter()
+        self.rpc_latencies = defaultdict(list)  # kind => [giây]
+
+
+    # ---------- Đếm RPC ----------
+
+    def _count(self, kind, n=1):
+        with self._lock:
+            self.rpc_counts[kind] += n
+
+    @contextmanager
+    def _rpc(self, kind):
+        """Bao 1 RPC: đếm, cộng độ trễ giả, ghi lại thời gian thực hiện"""
+        self._count(f"rpc_{kind}")
+        start = time.perf_counter()
+        if self.latency:
+            time.sleep(self.latency)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.rpc_latencies[kind].append(elapsed)
+
+    def reset_counts(self):
+        with self._lock:
+            self.rpc_counts = Counter()
+            self.rpc_latencies = defaultdict(list)
+
+    def document_count(self, prefix: str = '') -> int:
+        """Số document có path bắt đầu bằng `prefix`"""
+        with self._lock:
+            return sum(1 for path in self._docs if path.startswith(prefix))
+
+    # ---------- API client ----------
+
+    def collection(self, collection_id: str):
+        return FakeCollectionReference(self, collection_id)
+
+    def collection_group(self, collection_id: str):
+        return FakeQuery(self, collection_id, all_descendants=True)
+
+    def document(self, document_path: str):
+        return FakeDocumentReference(self, document_path)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def bulk_batch(self):
+        return FakeBulkWriteBatch(self)
+
+    @staticmethod
+    def write_option(**kwargs):
+        from google.cloud.firestore_v1.client import Client
+        return Client.write_option(**kwargs)
+
+    def collections(self):
+        with self._rpc('list_collections'):
+            return [FakeCollectionReference(self, p) for p in self._child_collections('')]
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        references = list(references)
+        # Tính hết kết quả trong RPC để thời gian đo được không lẫn thời gian xử lý của caller
+        with self._rpc('batch_get'):
+            snapshots = [self._snapshot(ref, field_paths) for ref in references]
+            self._count('read', len(snapshots))
+        yield from snapshots
+
+    # ---------- Nội bộ ----------
+
+    def _auto_id(self):
+        with self._lock:
+            self._id_counter += 1
+            return f"auto{self._id_counter:016d}"
+
+    def _snapshot(self, ref, field_paths=None):
+        with self._lock:
+            data = self._docs.get(ref.path)
+            data = copy.deepcopy(data) if data is not None else None
+            update_time = self._update_times.get(ref.path)
+        if data is not None and field_paths is not None:
+            projected = {}
+            for field in field_paths:
+                if _has_field(data, field):
+                    _set_field(projected, field, _get_field(data, field))
+            data = projected
+        return FakeSnapshot(ref, data, update_time)
+
+    def _query_docs(self, parent_path, all_descendants):
+        with self._lock:
+            if not all_descendants:
+                return [(path, self._docs[path]) for path in self._children.get(parent_path, ())]
+            parents = [p for p in self._children if p.rsplit('/', 1)[-1] == parent_path]
+            return [(path, self._docs[path]) for p in parents for path in self._children[p]]
+
+    def _sorted_paths(self, parent_path):
+        with self._lock:
+            paths = self._sorted.get(parent_path)
+            if paths is None:
+                paths = sorted(self._children.get(parent_path, ()))
+                self._sorted[parent_path] = paths
+            return paths
+
+    def _store(self, path, data):
+        """Ghi document (gọi khi đang giữ lock)"""
+        if path not in self._docs:
+            parent = path.rsplit('/', 1)[0]
+            self._children.setdefault(parent, set()).add(path)
+            self._sorted.pop(parent, None)
+        self._docs[path] = data
+
+    def _remove(self, path):
+        """Xóa document (gọi khi đang giữ lock)"""
+        if self._docs.pop(path, None) is not None:
+            parent = path.rsplit('/', 1)[0]
+            self._children[parent].discard(path)
+            if not self._children[parent]:
+                del self._children[parent]
+            self._sorted.pop(parent, None)
+
+    def _child_collections(self, doc_path):
+        prefix = f"{doc_path}/" if doc_path else ''
+        depth = prefix.count('/')
+        with self._lock:
+            paths = list(self._docs)
+        children = set()
+        for path in paths:
+            if path.startswith(prefix):
+                parts = path.split('/')
+                if len(parts) > depth + 1:
+                    children.add('/'.join(parts[:depth + 1]))
+        return sorted(children)
+
+    def _commit(self, writes):
+        with self._rpc('commit'):
+            return self._apply_writes(writes)
+
+    def _batch_write(self, writes):
+        with self._rpc('batch_write'):
+            if self.fail_rate and self._random.random() < self.fail_rate:
+                raise exceptions.ServiceUnavailable("Fake UNAVAILABLE")
+            write_results, status = [], []
+            for write in writes:
+                try:
+                    write_results.extend(self._apply_writes([write], fail=False))
+                    status.append(_Status(0))
+                except exceptions.GoogleAPICallError as e:
+                    write_results.append(FakeWriteResult(None))
+                    status.append(_Status(e.grpc_status_code.value[0], e.message))
+            return _BatchWriteResponse(write_results, status)
+
+    def _apply_writes(self, writes, fail=True):
+        """Commit nguyên khối: kiểm tra điều kiện trước, rồi mới ghi"""
+        if fail and self.fail_rate and self._random.random() < self.fail_rate:
+            raise exceptions.ServiceUnavailable("Fake UNAVAILABLE")
+        now = _now()
+        results = []
+        with self._lock:
+            for kind, ref, _, option in writes:
+                exists = ref.path in self._docs
+                if kind == 'create' and exists:
+                    raise exceptions.AlreadyExists(f"Document already exists: {ref.path}")
+                if kind == 'update' and not exists:
+                    raise exceptions.NotFound(f"No document to update: {ref.path}")
+                if option is not None and getattr(option, '_exists', None) is not None:
+                    if option._exists != exists:
+                        raise exceptions.NotFound(f"Precondition failed: {ref.path}")
+                last_update = getattr(option, '_last_update_time', None)
+                if last_update is not None and self._update_times.get(ref.path) != last_update:
+                    raise exceptions.FailedPrecondition(f"Update time mismatch: {ref.path}")
+            for kind, ref, data, option in writes:
+                old = self._docs.get(ref.path)
+                if kind == 'delete':
+                    self._remove(ref.path)
+                    self._update_times.pop(ref.path, None)
+                    self.rpc_counts['delete'] += 1
+                elif kind == 'update':
+                    new = copy.deepcopy(old)
+                    for field, value in data.items():
+                        if value is transforms.DELETE_FIELD:
+                            _delete_field(new, field)
+                        else:
+                            _set_field(new, field, _apply_transforms(value, _get_field(old, field), now))
+                    self._store(ref.path, new)
+                    self.rpc_counts['write'] += 1
+                elif kind == 'set' and option:
+                    new = copy.deepcopy(old) if old is not None else {}
+                    merged = _apply_transforms(data, old, now)
+                    _deep_merge(new, merged)
+                    self._store(ref.path, new)
+                    self.rpc_counts['write'] += 1
+                else:
+                    self._store(ref.path, _apply_transforms(copy.deepcopy(data), None, now))
+                    self.rpc_counts['write'] += 1
+                if kind != 'delete':
+                    self._update_times[ref.path] = now
+                results.append(FakeWriteResult(now))
+        return results
+
+
+def _deep_merge(target: dict, source: dict):
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _deep_merge(target[key], value)
+        else:
+            target[key] = value
+
+
+__all__ = ['FakeFirestore']
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Fan-out engine: chạy nhiều tác vụ ghi Firestore song song
+
+- Giữ tối đa `max_in_flight` tác vụ đang chạy (backpressure: chỉ lấy tác vụ mới
+  khi có chỗ trống, nên có thể đưa vào generator rất lớn mà không tốn bộ nhớ)
+- Ngừng gửi tiếp khi tỉ lệ lỗi trong cửa sổ gần nhất vượt ngưỡng
+"""
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class FanOutResult:
+    """Kết quả fan-out: danh sách key thành công / thất bại / chưa gửi"""
+
+    def __init__(self):
+        self.succeeded = []
+        self.failed = []  # [(key, exception)]
+        self.aborted = False
+
+    @property
+    def success_count(self):
+        return len(self.succeeded)
+
+    @property
+    def failed_count(self):
+        return len(self.failed)
+
+
+def fan_out(
+    tasks,
+    worker,
+    max_in_flight: int = 8,
+    max_error_rate: float = 0.5,
+    error_window: int = 10,
+    on_done=None,
+):
+    """
+    Chạy worker(payload) cho từng (key, payload) trong `tasks` bằng thread pool
+
+    Args:
+        tasks: Iterable các cặp (key, payload), có thể là generator
+        worker: Hàm xử lý 1 payload, raise exception nếu lỗi
+        max_in_flight: Số tác vụ chạy đồng thời tối đa
+        max_error_rate: Ngưỡng tỉ lệ lỗi (0..1) trong `error_window` tác vụ gần
+            nhất; vượt ngưỡng thì ngừng lấy tác vụ mới
+        error_window: Số tác vụ gần nhất dùng để tính tỉ lệ lỗi
+        on_done: Callback on_done(key, payload, error) sau mỗi tác vụ
+            (error = None nếu OK)
+
+    Returns:
+        FanOutResult
+    """
+    result = FanOutResult()
+    recent = deque(maxlen=error_window)
+    task_iter = iter(tasks)
+    pending = {}
+
+    def error_rate_exceeded():
+        if len(recent) < recent.maxlen:
+            return False
+        return sum(recent) / len(recent) > max_error_rate
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        exhausted = False
+        while True:
+            # Đổ thêm tác vụ cho đến khi đủ max_in_flight
+            while not exhausted and not result.aborted and len(pending) < max_in_flight:
+                try:
+                    key, payload = next(task_iter)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[executor.submit(worker, payload)] = (key, payload)
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, payload = pending.pop(future)
+                error = future.exception()
+                if error is None:
+                    result.succeeded.append(key)
+                else:
+                    result.failed.append((key, error))
+                recent.append(error is not None)
+                if on_done:
+                    on_done(key, payload, error)
+
+            if not result.aborted and error_rate_exceeded():
+                result.aborted = True
+
+    return result
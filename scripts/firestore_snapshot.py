@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Sao lưu / khôi phục reward_codes, reward_codes_claimed, mailbox và mail_bodies
+
+Export đọc từng trang (cursor theo __name__) và ghi ngay ra file NDJSON nén,
+nên bộ nhớ không tăng theo số document. Mỗi dòng là 1 document:
+
+    {"tree": "mailbox", "path": "mailbox/users/110122001/mail_..._110122001", "data": {...}}
+
+Dòng đầu là header ({"$snapshot": {...}}), dòng cuối là footer ({"$end":
+{số document theo tree}}) để phát hiện file bị cắt ngang. Kiểu dữ liệu
+Firestore được giữ lại khi import: thời gian => {"$ts": ISO 8601 (đến micro
+giây)}, bytes => {"$bytes": base64}, GeoPoint => {"$geo": [lat, lng]},
+DocumentReference => {"$ref": path}. Map có key bắt đầu bằng "$" được bọc
+thành {"$map": {...}} để không bị đọc nhầm thành các kiểu trên.
+
+Import đọc file dạng luồng và ghi lại đúng path (giữ nguyên document ID)
+bằng batch 500 thao tác, commit song song. Import chỉ ghi đè / tạo lại
+document có trong snapshot, không xóa document mới tạo sau đó. Dùng để
+nạp dữ liệu cho emulator khi test tải, hoặc khôi phục sau 1 chiến dịch lỗi.
+
+Định dạng theo đuôi file: .gz (gzip), .zst (zstd, cần: pip install
+zstandard), .parquet (cần: pip install pyarrow), còn lại là NDJSON thường.
+"""
+
+import base64
+from datetime import datetime
+import gzip
+import io
+import json
+import os
+
+from fanout import fan_out
+from lazy_import import lazy_module
+from paging import iter_documents
+from recipients import ProgressLine, chunked
+
+zstandard = lazy_module('zstandard')
+pq = lazy_module('pyarrow.parquet')
+pa = lazy_module('pyarrow')
+firestore = lazy_module('firebase_admin.firestore')
+
+# ============ CẤU HÌNH ============
+EXPORT_PAGE_SIZE = 500  # Số document mỗi trang khi export
+BATCH_SIZE = 500  # Số document mỗi batch khi import (giới hạn 500)
+MAX_IN_FLIGHT = 8  # Số batch import commit song song
+MAX_ERROR_RATE = 0.5  # Ngừng import khi tỉ lệ batch lỗi gần đây vượt ngưỡng này
+SNAPSHOT_VERSION = 1
+# ==================================
+
+# Nguồn của từng cây dữ liệu:
+# ('collection', tên) | ('group', collection id, tiền tố path) | ('subcollections', path document)
+TREES = {
+    'reward_codes': [
+        ('collection', 'reward_codes'),
+        ('group', 'claim_shards', 'reward_codes/'),
+    ],
+    'reward_codes_claimed': [
+        ('collection', 'reward_codes_claimed'),
+        ('group', 'codes', 'reward_codes_claimed/'),
+    ],
+    'mailbox': [
+        ('collection', 'mailbox'),
+        ('group', 'mails', 'mailbox/'),  # mailbox/global/mails, mailbox/audience/mails
+        ('group', 'recipients', 'mailbox/'),  # mailbox/index/recipients/{mssv}
+        ('subcollections', 'mailbox/users'),  # mailbox/users/{mssv}/{mail_id}
+        ('subcollections', 'mailbox/claimed'),  # mailbox/claimed/{mssv}/{mail_id}
+        ('subcollections', 'mailbox/deleted'),  # mailbox/deleted/{mssv}/{mail_id}
+    ],
+    'mail_bodies': [
+        ('collection', 'mail_bodies'),  # Nội dung thư dùng chung (body_ref)
+    ],
+}
+
+
+# ============ MÃ HÓA GIÁ TRỊ ============
+
+def encode_value(value):
+    """Giá trị Firestore => giá trị JSON (giữ kiểu bằng {"$ts"}, {"$bytes"}...)"""
+    if isinstance(value, datetime):
+        return {'$ts': value.isoformat()}
+    if isinstance(value, bytes):
+        return {'$bytes': base64.b64encode(value).decode('ascii')}
+    if isinstance(value, dict):
+        encoded = {key: encode_value(item) for key, item in value.items()}
+        # Map có key bắt đầu bằng $ => bọc lại để không bị nhầm với {"$ts"}, {"$ref"}...
+        if any(str(key).startswith('$') for key in value):
+            return {'$map': encoded}
+        return encoded
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item) for item in value]
+    if hasattr(value, 'latitude') and hasattr(value, 'longitude'):
+        return {'$geo': [value.latitude, value.longitude]}
+    if hasattr(value, 'path') and hasattr(value, 'collection'):
+        return {'$ref': value.path}
+    return value
+
+
+def decode_value(value, db):
+    """Ngược lại của encode_value"""
+    if isinstance(value, list):
+        return [decode_value(item, db) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if len(value) == 1:
+        (key, item), = value.items()
+        if key == '$ts':
+            return datetime.fromisoformat(item)
+        if key == '$bytes':
+            return base64.b64decode(item)
+        if key == '$geo':
+            return firestore.GeoPoint(*item)
+        if key == '$ref':
+            return db.document(item)
+        if key == '$map':
+            return {inner: decode_value(field, db) for inner, field in item.items()}
+    return {key: decode_value(item, db) for key, item in value.items()}
+
+
+# ============ FILE ============
+
+def _format(path: str) -> str:
+    if path.endswith('.parquet'):
+        return 'parquet'
+    if path.endswith('.zst'):
+        return 'zstd'
+    if path.endswith('.gz'):
+        return 'gzip'
+    return 'ndjson'
+
+
+def _open_text(path: str, mode: str):
+    """Mở file NDJSON (nén theo đuôi file) ở chế độ text 'r' / 'w'"""
+    kind = _format(path)
+    if kind == 'gzip':
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    if kind == 'zstd':
+        raw = open(path, mode + 'b')
+        if mode == 'w':
+            stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class _NdjsonWriter:
+    def __init__(self, path: str, header: dict):
+        self._file = _open_text(path, 'w')
+        self._write({'$snapshot': header})
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def write_page(self, records):
+        for record in records:
+            self._write(record)
+
+    def close(self, counts: dict = None):
+        """counts = None (export lỗi) => không ghi footer, file bị coi là cắt ngang"""
+        if counts is not None:
+            self._write({'$end': counts})
+        self._file.close()
+
+
+class _ParquetWriter:
+    """Cột tree, path, data (JSON); header nằm trong metadata của file"""
+
+    def __init__(self, path: str, header: dict):
+        self._schema = pa.schema(
+            [('tree', pa.string()), ('path', pa.string()), ('data', pa.string())],
+            metadata={'snapshot': json.dumps(header)},
+        )
+        self._writer = pq.ParquetWriter(path, self._schema, compression='zstd')
+
+    def write_page(self, records):
+        self._writer.write_table(pa.Table.from_pylist([
+            {'tree': r['tree'], 'path': r['path'], 'data': json.dumps(r['data'], ensure_ascii=False)}
+            for r in records
+        ], schema=self._schema))
+
+    def close(self, counts: dict = None):
+        self._writer.close()
+
+
+def read_snapshot(path: str, info: dict = None):
+    """
+    Generator: từng record {'tree', 'path', 'data'} (data chưa giải mã)
+
+    `info` (nếu có) nhận 'header' và 'end' (None nếu file NDJSON bị cắt ngang;
+    dòng cuối bị cắt giữa chừng được bỏ qua).
+    """
+    info = info if info is not None else {}
+    info.setdefault('end', None)
+    if _format(path) == 'parquet':
+        parquet = pq.ParquetFile(path)
+        info['header'] = json.loads(parquet.schema_arrow.metadata[b'snapshot'])
+        for batch in parquet.iter_batches(batch_size=EXPORT_PAGE_SIZE):
+            for row in batch.to_pylist():
+                yield {'tree': row['tree'], 'path': row['path'], 'data': json.loads(row['data'])}
+        info['end'] = True  # Parquet ghi dở thì không đọc được footer => luôn đầy đủ
+        return
+    with _open_text(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                if line.endswith('\n'):
+                    raise
+                return  # Dòng cuối ghi dở (file bị cắt ngang): end vẫn là None
+            if '$snapshot' in record:
+                info['header'] = record['$snapshot']
+            elif '$end' in record:
+                info['end'] = record['$end']
+            else:
+                yield record
+
+
+# ============ EXPORT ============
+
+def _source_documents(db, source):
+    """Mọi snapshot của 1 nguồn, đọc theo trang"""
+    kind = source[0]
+    if kind == 'collection':
+        yield from iter_documents(db.collection(source[1]).order_by('__name__'), EXPORT_PAGE_SIZE)
+    elif kind == 'group':
+        _, collection_id, prefix = source
+        for snapshot in iter_documents(db.collection_group(collection_id).order_by('__name__'), EXPORT_PAGE_SIZE):
+            if snapshot.reference.path.startswith(prefix):
+                yield snapshot
+    elif kind == 'subcollections':
+        for collection in db.document(source[1]).collections():
+            yield from iter_documents(collection.order_by('__name__'), EXPORT_PAGE_SIZE)
+
+
+def export_snapshot(db, path: str, trees=None):
+    """
+    Export các cây dữ liệu ra file snapshot
+
+    Args:
+        trees: Tên cây trong TREES (mặc định tất cả)
+
+    Returns:
+        dict: Số document đã export theo từng cây
+    """
+    trees = list(trees or TREES)
+    unknown = set(trees) - set(TREES)
+    if unknown:
+        raise ValueError(f"Không có cây dữ liệu: {', '.join(sorted(unknown))} (có: {', '.join(TREES)})")
+
+    header = {'version': SNAPSHOT_VERSION, 'created_at': datetime.now().isoformat(timespec='seconds'),
+              'trees': trees}
+    writer = (_ParquetWriter if _format(path) == 'parquet' else _NdjsonWriter)(path, header)
+    counts = {tree: 0 for tree in trees}
+    progress = ProgressLine("💾 Đã export")
+
+    print(f"\n💾 Export {', '.join(trees)} => {path}")
+    try:
+        for tree in trees:
+            for source in TREES[tree]:
+                documents = _source_documents(db, source)
+                for page in chunked(documents, EXPORT_PAGE_SIZE):
+                    writer.write_page([
+                        {'tree': tree, 'path': s.reference.path, 'data': encode_value(s.to_dict())}
+                        for s in page
+                    ])
+                    counts[tree] += len(page)
+                    progress.update(success=len(page))
+    except BaseException:
+        # Không ghi footer + xóa file dở: bản sao lưu thiếu không được trông như đầy đủ
+        progress.finish()
+        writer.close()
+        os.remove(path)
+        print(f"   ❌ Export lỗi, đã xóa file dở {path}")
+        raise
+    writer.close(counts)
+    progress.finish()
+    for tree, count in counts.items():
+        print(f"   📁 {tree}: {count:,} document")
+    return counts
+
+
+# ============ IMPORT ============
+
+def import_snapshot(db, path: str, trees=None, dry_run: bool = False, max_in_flight: int = MAX_IN_FLIGHT):
+    """
+    Ghi lại snapshot lên Firestore (giữ nguyên path / document ID)
+
+    Args:
+        trees: Chỉ import các cây này (mặc định tất cả trong file)
+        dry_run: Chỉ đọc và đếm, không ghi
+
+    Returns:
+        dict: {'written', 'failed', 'skipped'}
+    """
+    info = {}
+    wanted = set(trees) if trees else None
+    stats = {'written': 0, 'failed': 0, 'skipped': 0}
+
+    def selected():
+        for record in read_snapshot(path, info):
+            if wanted is not None and record['tree'] not in wanted:
+                stats['skipped'] += 1
+                continue
+            yield record
+
+    print(f"\n📥 Import {path}{' (dry run)' if dry_run else ''}")
+    if dry_run:
+        for _ in selected():
+            stats['written'] += 1
+    else:
+        progress = ProgressLine("📥 Đã ghi")
+
+        def commit_chunk(chunk):
+            batch = db.batch()
+            for record in chunk:
+                batch.set(db.document(record['path']), decode_value(record['data'], db))
+            batch.commit()
+
+        def report(index, chunk, error):
+            if error is None:
+                stats['written'] += len(chunk)
+                progress.update(success=len(chunk))
+            else:
+                stats['failed'] += len(chunk)
+                progress.note(f"   ✗ Batch {index} ({chunk[0]['path']} ...): {error}")
+                progress.update(failed=len(chunk))
+
+        result = fan_out(
+            enumerate(chunked(selected(), BATCH_SIZE), start=1), commit_chunk,
+            max_in_flight=max_in_flight, max_error_rate=MAX_ERROR_RATE, on_done=report,
+        )
+        progress.finish()
+        if result.aborted:
+            print("   ⛔ Tỉ lệ lỗi quá cao, đã ngừng import!")
+            info['end'] = info.get('end') or 'aborted'  # Chưa đọc hết file, không phải file lỗi
+
+    header = info.get('header') or {}
+    print(f"   🗓 Snapshot lúc {header.get('created_at', '?')}, cây: {', '.join(header.get('trees', []))}")
+    if info.get('end') is None:
+        print("   ⚠️ File không có dòng kết thúc - snapshot có thể bị cắt ngang!")
+    action = "Sẽ ghi" if dry_run else "Đã ghi"
+    print(f"   → {action}: {stats['written']:,} | Lỗi: {stats['failed']:,} | Bỏ qua: {stats['skipped']:,}")
+    return stats
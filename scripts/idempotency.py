@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Ghi "chỉ tạo mới" và ID suy ra từ nội dung
+
+- create_only: doc_ref.create() (hoặc batch.create()) - 1 RPC, server từ chối
+  nếu document đã có. Không còn get() rồi set() (2 lượt gọi, và 2 người chạy
+  cùng lúc có thể ghi đè lên nhau).
+- content_hash: SHA-256 của nội dung. Thư global dùng nó làm ID khi bật
+  idempotent, nên chạy lại lệnh sau khi bị timeout chỉ "đụng" đúng document
+  cũ thay vì tạo thư thứ hai. Mã thưởng lưu hash trong field `content_hash`
+  để nhận ra lần tạo trước là cùng nội dung (không dùng hash làm mã vì sẽ
+  đoán được).
+"""
+
+import hashlib
+import json
+
+from lazy_import import lazy_module
+
+exceptions = lazy_module('google.api_core.exceptions')
+
+# ============ CẤU HÌNH ============
+HASH_ID_LENGTH = 20  # Số ký tự hex của hash dùng trong ID (80 bit)
+# ==================================
+
+
+def content_hash(payload: dict) -> str:
+    """SHA-256 (hex) của payload, không phụ thuộc thứ tự key"""
+    text = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def content_id(prefix: str, payload: dict) -> str:
+    """ID ổn định theo nội dung: <prefix>_<hash rút gọn>"""
+    return f"{prefix}_{content_hash(payload)[:HASH_ID_LENGTH]}"
+
+
+def create_only(doc_ref, data: dict) -> bool:
+    """
+    Tạo document, không ghi đè
+
+    Returns:
+        bool: False nếu document đã tồn tại
+    """
+    try:
+        doc_ref.create(data)
+    except exceptions.Conflict:  # AlreadyExists là lớp con của Conflict
+        return False
+    return True
+
+
+def commit_create_only(batch) -> bool:
+    """Commit batch có batch.create(); False nếu 1 document đã tồn tại (cả batch không được ghi)"""
+    try:
+        batch.commit()
+    except exceptions.Conflict:
+        return False
+    return True
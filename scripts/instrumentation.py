@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""
+Đo đạc các lời gọi Firestore của script quản trị
+
+`instrument(db)` bọc Firestore client bằng proxy: mọi RPC (get, stream,
+get_all, set/create/update/delete, batch commit, BatchWrite, aggregation)
+được đếm số document đọc/ghi/xóa, ước lượng số byte và ghi thời gian vào
+histogram theo từng loại thao tác. Các lời gọi không phải RPC (collection, document, where,
+batch.set...) chỉ đi qua proxy, không tốn round trip.
+
+Cuối mỗi lần chạy, `run_metrics(...)` in tóm tắt, ghi JSON và (tùy chọn)
+textfile Prometheus cho node_exporter. Có thể bật cProfile / tracemalloc
+cho cả chiến dịch. Số byte chỉ được ước lượng khi có xuất JSON / Prometheus
+(hoặc TVU_METRICS_BYTES=1): duyệt to_dict() của mọi document đọc/ghi tốn CPU
+đáng kể khi quét lớn.
+
+Biến môi trường (cho menu tương tác; CLI có tham số tương ứng):
+    TVU_METRICS_JSON=metrics.json  TVU_METRICS_PROM=tvu.prom
+    TVU_PROFILE=run.prof           TVU_TRACEMALLOC=1
+    TVU_METRICS_BYTES=1            (ước lượng byte cả khi không xuất file, vd: service)
+"""
+
+import contextlib
+import cProfile
+import json
+import os
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+from bulk_write import bulk_batch
+
+# ============ CẤU HÌNH ============
+# Mốc histogram thời gian (giây), theo kiểu bucket của Prometheus
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_PREFIX = "tvu_firestore"  # Tiền tố tên metric Prometheus
+TRACEMALLOC_TOP = 10  # Số dòng cấp phát bộ nhớ lớn nhất ghi vào JSON
+# ==================================
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, '') not in ('', '0')
+
+
+def estimate_size(value) -> int:
+    """
+    Ước lượng số byte lưu trữ của 1 giá trị theo quy tắc tính dung lượng
+    document của Firestore (chuỗi = UTF-8 + 1, số/timestamp = 8, ...)
+    """
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, datetime)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode('utf-8')) + 1
+    if isinstance(value, bytes):
+        return len(value) + 1
+    if isinstance(value, dict):
+        return sum(len(str(k).encode('utf-8')) + 1 + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(v) for v in value)
+    return 8  # Sentinel (SERVER_TIMESTAMP, Increment...), GeoPoint, reference
+
+
+class Metrics:
+    """Bộ đếm + histogram thời gian theo loại thao tác (an toàn đa luồng)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Có ước lượng bytes_read / bytes_written không (run_metrics bật khi xuất file)
+        self.measure_bytes = _env_flag('TVU_METRICS_BYTES')
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.ops = {}  # op => {'calls', 'errors', 'seconds', 'buckets'}
+            self.totals = {'reads': 0, 'writes': 0, 'deletes': 0, 'bytes_read': 0, 'bytes_written': 0}
+            self.extra = {}
+
+    def record(self, op: str, seconds: float, reads=0, writes=0, deletes=0,
+               bytes_read=0, bytes_written=0, error=False):
+        with self._lock:
+            stats = self.ops.get(op)
+            if stats is None:
+                stats = self.ops[op] = {
+                    'calls': 0, 'errors': 0, 'seconds': 0.0,
+                    'buckets': [0] * (len(LATENCY_BUCKETS) + 1),  # ô cuối = +Inf
+                }
+            stats['calls'] += 1
+            stats['errors'] += int(error)
+            stats['seconds'] += seconds
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    stats['buckets'][index] += 1
+                    break
+            else:
+                stats['buckets'][-1] += 1
+            self.totals['reads'] += reads
+            self.totals['writes'] += writes
+            self.totals['deletes'] += deletes
+            self.totals['bytes_read'] += bytes_read
+            self.totals['bytes_written'] += bytes_written
+
+    @staticmethod
+    def _quantile(buckets, q):
+        """Ước lượng quantile từ histogram (cận trên của bucket chứa nó)"""
+        total = sum(buckets)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(buckets):
+            seen += count
+            if seen >= rank:
+                return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else float('inf')
+        return float('inf')
+
+    def summary(self) -> dict:
+        with self._lock:
+            wall = time.time() - self.started
+            operations = {}
+            for op, stats in sorted(self.ops.items()):
+                p50 = self._quantile(stats['buckets'], 0.5)
+                p99 = self._quantile(stats['buckets'], 0.99)
+                operations[op] = {
+                    'calls': stats['calls'],
+                    'errors': stats['errors'],
+                    'seconds': round(stats['seconds'], 4),
+                    'p50_le_seconds': p50,
+                    'p99_le_seconds': p99,
+                    'histogram': {
+                        **{str(b): c for b, c in zip(LATENCY_BUCKETS, stats['buckets'])},
+                        '+Inf': stats['buckets'][-1],
+                    },
+                }
+            firestore_seconds = sum(stats['seconds'] for stats in self.ops.values())
+            return {
+                'started_at': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+                'wall_seconds': round(wall, 3),
+                # Tổng thời gian chờ Firestore (cộng dồn các luồng, có thể > wall khi gửi song song)
+                'firestore_seconds': round(firestore_seconds, 3),
+                'calls': sum(stats['calls'] for stats in self.ops.values()),
+                'errors': sum(stats['errors'] for stats in self.ops.values()),
+                **self.totals,
+                'bytes_measured': self.measure_bytes,
+                'operations': operations,
+                **self.extra,
+            }
+
+    def write_json(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+    def write_prometheus(self, path: str, labels: dict = None):
+        """Ghi textfile cho node_exporter (ghi file tạm rồi đổi tên => không đọc dở)"""
+        summary = self.summary()
+        base = ','.join(f'{k}="{v}"' for k, v in (labels or {}).items())
+
+        def fmt(**extra):
+            parts = [base] if base else []
+            parts += [f'{k}="{v}"' for k, v in extra.items()]
+            return '{' + ','.join(parts) + '}' if parts else ''
+
+        p = METRIC_PREFIX
+        lines = [
+            f"# HELP {p}_calls_total Số lời gọi Firestore theo thao tác",
+            f"# TYPE {p}_calls_total counter",
+        ]
+        lines += [f"{p}_calls_total{fmt(op=op)} {s['calls']}" for op, s in summary['operations'].items()]
+        lines += [f"# TYPE {p}_errors_total counter"]
+        lines += [f"{p}_errors_total{fmt(op=op)} {s['errors']}" for op, s in summary['operations'].items()]
+        lines += [f"# TYPE {p}_duration_seconds histogram"]
+        for op, s in summary['operations'].items():
+            cumulative = 0
+            for le, count in s['histogram'].items():
+                cumulative += count
+                lines.append(f"{p}_duration_seconds_bucket{fmt(op=op, le=le)} {cumulative}")
+            lines.append(f"{p}_duration_seconds_sum{fmt(op=op)} {s['seconds']}")
+            lines.append(f"{p}_duration_seconds_count{fmt(op=op)} {s['calls']}")
+        for key in ('reads', 'writes', 'deletes', 'bytes_read', 'bytes_written'):
+            lines += [f"# TYPE {p}_{key}_total counter", f"{p}_{key}_total{fmt()} {summary[key]}"]
+        lines += [f"# TYPE {p}_run_wall_seconds gauge", f"{p}_run_wall_seconds{fmt()} {summary['wall_seconds']}"]
+        if 'memory_peak_bytes' in summary:
+            lines += [f"# TYPE {p}_run_memory_peak_bytes gauge",
+                      f"{p}_run_memory_peak_bytes{fmt()} {summary['memory_peak_bytes']}"]
+        lines.append(f"{p}_run_timestamp_seconds{fmt()} {int(time.time())}")
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+
+    def print_summary(self):
+        s = self.summary()
+        print(f"\n📊 Firestore: {s['calls']:,} lời gọi ({s['errors']} lỗi) | "
+              f"📖 {s['reads']:,} đọc | ✏️ {s['writes']:,} ghi | 🗑 {s['deletes']:,} xóa")
+        bytes_line = f"📦 {s['bytes_read']:,} B đọc | {s['bytes_written']:,} B ghi | " if self.measure_bytes else ""
+        print(f"   {bytes_line}⏱ {s['wall_seconds']:.2f}s tổng, {s['firestore_seconds']:.2f}s chờ Firestore")
+        for op, stats in s['operations'].items():
+            p50 = stats['p50_le_seconds']
+            p99 = stats['p99_le_seconds']
+            print(f"   • {op:<14} {stats['calls']:>7,} lần | p50 ≤ {p50 * 1000:g}ms | p99 ≤ {p99 * 1000:g}ms")
+
+
+METRICS = Metrics()  # Bộ đếm dùng chung cho cả tiến trình
+
+
+# ============ PROXY ============
+
+def _unwrap(value):
+    return value._target if isinstance(value, _Proxy) else value
+
+
+def _kind(obj):
+    """Phân loại object Firestore theo các method nó có (chạy được cả với client giả lập)"""
+    if hasattr(obj, 'commit') and hasattr(obj, 'set'):
+        return _BatchProxy
+    if hasattr(obj, 'collection') and hasattr(obj, 'set'):
+        return _DocumentProxy
+    if hasattr(obj, 'where'):
+        return _QueryProxy
+    if hasattr(obj, 'count') and hasattr(obj, 'get'):
+        return _AggregationProxy
+    return None
+
+
+class _Proxy:
+    """Chuyển tiếp thuộc tính; bọc lại các object Firestore trả về"""
+
+    def __init__(self, target, metrics):
+        self._target = target
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*[_unwrap(a) for a in args], **{k: _unwrap(v) for k, v in kwargs.items()})
+            return self._wrap(result)
+        return call
+
+    def _wrap(self, result):
+        proxy_class = _kind(result)
+        return proxy_class(result, self._metrics) if proxy_class else result
+
+    def _timed(self, op, fn, *args, **kwargs):
+        """Gọi 1 RPC, ghi thời gian; counters(result) trả về dict reads/writes/..."""
+        counters = kwargs.pop('_counters', None)
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self._metrics.record(op, time.perf_counter() - start, error=True)
+            raise
+        self._metrics.record(op, time.perf_counter() - start, **(counters(result) if counters else {}))
+        return result
+
+    def _size(self, data) -> int:
+        """Số byte ước lượng của data ghi đi (0 nếu không đo byte)"""
+        return estimate_size(data) if self._metrics.measure_bytes else 0
+
+    def _snapshot_size(self, snapshot) -> int:
+        """Số byte ước lượng của snapshot đọc về; không đo byte thì không gọi to_dict()"""
+        if not self._metrics.measure_bytes or not getattr(snapshot, 'exists', True):
+            return 0
+        return estimate_size(snapshot.to_dict())
+
+    def _timed_stream(self, op, iterator):
+        """Bọc generator: chỉ tính thời gian nằm trong Firestore, không tính thời gian của caller"""
+        spent = 0.0
+        reads = size = 0
+        error = False
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    snapshot = next(iterator)
+                except StopIteration:
+                    spent += time.perf_counter() - start
+                    break
+                except Exception:
+                    spent += time.perf_counter() - start
+                    error = True
+                    raise
+                spent += time.perf_counter() - start
+                reads += 1
+                size += self._snapshot_size(snapshot)
+                yield snapshot
+        finally:
+            # Query rỗng vẫn tính 1 lượt đọc (cách Firestore tính phí)
+            self._metrics.record(op, spent, reads=max(reads, 1), bytes_read=size, error=error)
+
+    def __repr__(self):
+        return f"<instrumented {self._target!r}>"
+
+
+class _QueryProxy(_Proxy):
+    def stream(self, *args, **kwargs):
+        return self._timed_stream('query', iter(self._target.stream(*args, **kwargs)))
+
+    def get(self, *args, **kwargs):
+        return list(self.stream(*args, **kwargs))
+
+    def add(self, document_data, *args, **kwargs):
+        result = self._timed('add', self._target.add, document_data, *args, _counters=lambda _: {
+            'writes': 1, 'bytes_written': self._size(document_data)}, **kwargs)
+        return result[0], _DocumentProxy(result[1], self._metrics)
+
+    def list_documents(self, *args, **kwargs):
+        refs = self._timed('list_documents', lambda: list(self._target.list_documents(*args, **kwargs)),
+                           _counters=lambda refs: {'reads': max(len(refs), 1)})
+        return [_DocumentProxy(ref, self._metrics) for ref in refs]
+
+
+class _AggregationProxy(_Proxy):
+    def get(self, *args, **kwargs):
+        # Aggregation tính 1 lượt đọc cho mỗi 1000 index entry; không biết trước => tính 1
+        return self._timed('aggregate', self._target.get, *args, _counters=lambda _: {'reads': 1}, **kwargs)
+
+
+class _DocumentProxy(_Proxy):
+    def get(self, *args, **kwargs):
+        def counters(snapshot):
+            return {'reads': 1, 'bytes_read': self._snapshot_size(snapshot)}
+        return self._timed('get', self._target.get, *args, _counters=counters, **kwargs)
+
+    def _write(self, op, data, *args, **kwargs):
+        method = getattr(self._target, op)
+        return self._timed(op, method, data, *args, _counters=lambda _: {
+            'writes': 1, 'bytes_written': self._size(data)}, **kwargs)
+
+    def set(self, document_data, *args, **kwargs):
+        return self._write('set', document_data, *args, **kwargs)
+
+    def create(self, document_data, *args, **kwargs):
+        return self._write('create', document_data, *args, **kwargs)
+
+    def update(self, field_updates, *args, **kwargs):
+        return self._write('update', field_updates, *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._timed('delete', self._target.delete, *[_unwrap(a) for a in args],
+                           _counters=lambda _: {'deletes': 1}, **kwargs)
+
+    def collections(self, *args, **kwargs):
+        return [_QueryProxy(c, self._metrics) for c in self._target.collections(*args, **kwargs)]
+
+
+class _BatchProxy(_Proxy):
+    """WriteBatch / BulkWriteBatch: set/create/update/delete chỉ gom lại, commit mới là RPC"""
+
+    def __init__(self, target, metrics, bulk=False):
+        super().__init__(target, metrics)
+        self._bulk = bulk
+        self._staged = []  # (là delete?, số byte) theo thứ tự thêm vào batch
+
+    def _stage(self, method, reference, data=None, *args, **kwargs):
+        if data is None:
+            self._staged.append((True, 0))
+            getattr(self._target, method)(_unwrap(reference), *args, **kwargs)
+        else:
+            self._staged.append((False, self._size(data)))
+            getattr(self._target, method)(_unwrap(reference), data, *args, **kwargs)
+        return self
+
+    def set(self, reference, document_data, *args, **kwargs):
+        return self._stage('set', reference, document_data, *args, **kwargs)
+
+    def create(self, reference, document_data, *args, **kwargs):
+        return self._stage('create', reference, document_data, *args, **kwargs)
+
+    def update(self, reference, field_updates, *args, **kwargs):
+        return self._stage('update', reference, field_updates, *args, **kwargs)
+
+    def delete(self, reference, *args, **kwargs):
+        return self._stage('delete', reference, None, *args, **kwargs)
+
+    def commit(self, *args, **kwargs):
+        def counters(response):
+            # BatchWrite trả về trạng thái từng thao tác: chỉ tính thao tác thành công
+            status = getattr(response, 'status', None) if self._bulk else None
+            ok = [s.code == 0 for s in status] if status is not None else [True] * len(self._staged)
+            staged = [item for item, success in zip(self._staged, ok) if success]
+            return {
+                'writes': sum(1 for is_delete, _ in staged if not is_delete),
+                'deletes': sum(1 for is_delete, _ in staged if is_delete),
+                'bytes_written': sum(size for _, size in staged),
+            }
+        op = 'batch_write' if self._bulk else 'commit'
+        return self._timed(op, self._target.commit, *args, _counters=counters, **kwargs)
+
+
+class _ClientProxy(_Proxy):
+    def bulk_batch(self):
+        return _BatchProxy(bulk_batch(self._target), self._metrics, bulk=True)
+
+    def get_all(self, references, *args, **kwargs):
+        references = [_unwrap(ref) for ref in references]
+        return self._timed_stream('get_all', iter(self._target.get_all(references, *args, **kwargs)))
+
+    def collections(self, *args, **kwargs):
+        return [_QueryProxy(c, self._metrics) for c in self._target.collections(*args, **kwargs)]
+
+
+def instrument(db, metrics: Metrics = METRICS):
+    """Bọc Firestore client để đo mọi lời gọi (gọi lại nhiều lần không bọc chồng)"""
+    if isinstance(db, _Proxy):
+        return db
+    return _ClientProxy(db, metrics)
+
+
+# ============ CHẠY CẢ PHIÊN ============
+
+@contextlib.contextmanager
+def run_metrics(json_path: str = None, prometheus_path: str = None, profile_path: str = None,
+                trace_memory: bool = None, labels: dict = None, metrics: Metrics = METRICS):
+    """
+    Bao 1 lần chạy (1 lệnh CLI / 1 phiên menu / 1 chiến dịch)
+
+    Khi kết thúc (kể cả bị lỗi / Ctrl+C): in tóm tắt nếu có lời gọi Firestore,
+    ghi JSON / textfile Prometheus nếu có đường dẫn, lưu cProfile và thống kê
+    tracemalloc nếu được bật. Tham số None => đọc từ biến môi trường TVU_*.
+    """
+    json_path = json_path or os.environ.get('TVU_METRICS_JSON')
+    prometheus_path = prometheus_path or os.environ.get('TVU_METRICS_PROM')
+    profile_path = profile_path or os.environ.get('TVU_PROFILE')
+    if trace_memory is None:
+        trace_memory = _env_flag('TVU_TRACEMALLOC')
+
+    metrics.reset()
+    measure_bytes = metrics.measure_bytes
+    metrics.measure_bytes = bool(json_path or prometheus_path) or _env_flag('TVU_METRICS_BYTES')
+    profiler = cProfile.Profile() if profile_path else None
+    if trace_memory:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield metrics
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+            metrics.extra['profile_path'] = profile_path
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            metrics.extra['memory_current_bytes'] = current
+            metrics.extra['memory_peak_bytes'] = peak
+            metrics.extra['memory_top'] = [
+                {'where': str(stat.traceback), 'bytes': stat.size, 'blocks': stat.count}
+                for stat in snapshot.statistics('lineno')[:TRACEMALLOC_TOP]
+            ]
+        if metrics.ops:
+            metrics.print_summary()
+        if json_path:
+            metrics.write_json(json_path)
+            print(f"💾 Metrics JSON: {json_path}")
+        if prometheus_path:
+            metrics.write_prometheus(prometheus_path, labels)
+            print(f"💾 Metrics Prometheus: {prometheus_path}")
+        if profiler:
+            print(f"💾 cProfile: {profile_path} (xem: python -m pstats {profile_path})")
+        metrics.measure_bytes = measure_bytes
+        if trace_memory:
+            print(f"🧠 Bộ nhớ đỉnh: {metrics.extra['memory_peak_bytes'] / 1024 / 1024:.1f} MB")
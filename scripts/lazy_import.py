@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Import module nặng (firebase_admin, google.cloud...) khi dùng lần đầu
+
+`firestore = lazy_module('firebase_admin.firestore')` dùng y như module thật,
+nhưng chỉ thực sự import khi truy cập thuộc tính đầu tiên. Nhờ vậy --help,
+kiểm tra tham số và dry run chạy ngay, kể cả khi chưa cài firebase-admin.
+"""
+
+import importlib
+
+
+class LazyModule:
+    """Proxy cho 1 module, import khi truy cập thuộc tính đầu tiên"""
+
+    def __init__(self, name: str):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_module(name: str) -> LazyModule:
+    return LazyModule(name)
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Cache cục bộ (SQLite) cho reward_codes và mailbox/global/mails
+
+- Đồng bộ tăng dần theo watermark `updated_at`: mỗi lần sync chỉ đọc các
+  document có updated_at mới hơn lần trước (các script ghi updated_at khi
+  tạo/sửa). Lần đầu (hoặc sync đầy đủ) đọc toàn bộ collection.
+- Tìm kiếm tức thì trên máy theo tiền tố mã, tiêu đề, khoảng phần thưởng.
+- Chỉ gọi lên server khi cache đã cũ hơn CACHE_MAX_AGE giây.
+- Document bị xóa bởi script được xóa khỏi cache ngay; xóa từ nơi khác
+  chỉ được nhận ra khi sync đầy đủ (full=True).
+"""
+
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from lazy_import import lazy_module
+from paging import iter_documents
+
+firestore = lazy_module('firebase_admin.firestore')
+
+# ============ CẤU HÌNH ============
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache.db")
+CACHE_MAX_AGE = 300  # Số giây cache được coi là còn mới
+SYNC_PAGE_SIZE = 500  # Số document mỗi trang khi sync
+# ==================================
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    collection TEXT NOT NULL,
+    id TEXT NOT NULL,
+    title TEXT,
+    coins INTEGER NOT NULL DEFAULT 0,
+    diamonds INTEGER NOT NULL DEFAULT 0,
+    xp INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL,
+    PRIMARY KEY (collection, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS docs_coins ON docs (collection, coins);
+CREATE TABLE IF NOT EXISTS sync_state (
+    collection TEXT PRIMARY KEY,
+    watermark TEXT,
+    synced_at REAL NOT NULL
+);
+"""
+
+# Tên collection trong cache => hàm lấy collection reference
+COLLECTIONS = {
+    'reward_codes': lambda db: db.collection('reward_codes'),
+    'global_mails': lambda db: db.collection('mailbox').document('global').collection('mails'),
+}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    # Sentinel (vd: SERVER_TIMESTAMP) khi ghi xuyên cache trước lần sync kế tiếp
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _parse_datetime(value):
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    return value
+
+
+class LocalCache:
+    """Cache SQLite của các collection quản trị"""
+
+    def __init__(self, path: str = None):
+        # Đọc CACHE_PATH lúc khởi tạo để benchmark/thử nghiệm có thể đổi sang file tạm
+        self.path = path or CACHE_PATH
+        self._conn = sqlite3.connect(self.path)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------- Đồng bộ ----------
+
+    def _state(self, collection: str):
+        return self._conn.execute(
+            "SELECT watermark, synced_at FROM sync_state WHERE collection = ?", (collection,)
+        ).fetchone()
+
+    def is_stale(self, collection: str, max_age: float = CACHE_MAX_AGE) -> bool:
+        state = self._state(collection)
+        return state is None or time.time() - state[1] > max_age
+
+    def sync(self, db, collection: str, full: bool = False) -> int:
+        """
+        Đồng bộ 1 collection từ Firestore
+
+        Returns:
+            int: Số document đã tải về
+        """
+        ref = COLLECTIONS[collection](db)
+        state = self._state(collection)
+        watermark = _parse_datetime(state[0]) if state and state[0] and not full else None
+
+        if watermark is None:
+            # Sync đầy đủ: đọc cả document cũ chưa có updated_at
+            query = ref.order_by('__name__')
+            with self._conn:
+                self._conn.execute("DELETE FROM docs WHERE collection = ?", (collection,))
+        else:
+            query = ref.where(
+                filter=firestore.FieldFilter('updated_at', '>', watermark)
+            ).order_by('updated_at')
+
+        count = 0
+        newest = watermark
+        rows = []
+        for doc in iter_documents(query, SYNC_PAGE_SIZE):
+            data = doc.to_dict()
+            updated_at = data.get('updated_at')
+            if isinstance(updated_at, datetime) and (newest is None or updated_at > newest):
+                newest = updated_at
+            rows.append(self._row(collection, doc.id, data))
+            count += 1
+            if len(rows) >= SYNC_PAGE_SIZE:
+                self._upsert_rows(rows)
+                rows = []
+        self._upsert_rows(rows)
+
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_state (collection, watermark, synced_at) VALUES (?, ?, ?)",
+                (collection, newest.isoformat() if isinstance(newest, datetime) else None, time.time()),
+            )
+        return count
+
+    def ensure_fresh(self, db, collection: str, max_age: float = CACHE_MAX_AGE) -> bool:
+        """Sync nếu cache đã cũ. Trả về True nếu có gọi lên server"""
+        if not self.is_stale(collection, max_age):
+            return False
+        self.sync(db, collection)
+        return True
+
+    # ---------- Ghi xuyên (write-through) ----------
+
+    @staticmethod
+    def _row(collection, doc_id, data):
+        reward = data.get('reward') or {}
+        return (
+            collection, doc_id, data.get('title'),
+            int(reward.get('coins', 0) or 0),
+            int(reward.get('diamonds', 0) or 0),
+            int(reward.get('xp', 0) or 0),
+            json.dumps(data, default=_json_default, ensure_ascii=False),
+        )
+
+    def _upsert_rows(self, rows):
+        if not rows:
+            return
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO docs (collection, id, title, coins, diamonds, xp, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def put(self, collection: str, doc_id: str, data: dict):
+        """Cập nhật cache ngay sau khi script ghi lên Firestore"""
+        self._upsert_rows([self._row(collection, doc_id, data)])
+
+    def put_many(self, collection: str, doc_ids, data: dict):
+        """Ghi xuyên nhiều document có cùng data (vd: mã tạo hàng loạt)"""
+        self._upsert_rows([self._row(collection, doc_id, data) for doc_id in doc_ids])
+
+    def update(self, collection: str, doc_id: str, fields: dict):
+        current = self.get(collection, doc_id)
+        if current is not None:
+            current.update(fields)
+            self.put(collection, doc_id, current)
+
+    def delete(self, collection: str, doc_id: str):
+        with self._conn:
+            self._conn.execute("DELETE FROM docs WHERE collection = ? AND id = ?", (collection, doc_id))
+
+    def update_many(self, collection: str, doc_ids, fields: dict):
+        """Cập nhật cùng các field cho nhiều document, trong 1 transaction SQLite"""
+        rows = []
+        for doc_id in doc_ids:
+            current = self.get(collection, doc_id)
+            if current is not None:
+                current.update(fields)
+                rows.append(self._row(collection, doc_id, current))
+        self._upsert_rows(rows)
+
+    def delete_many(self, collection: str, doc_ids):
+        with self._conn:
+            self._conn.executemany(
+                "DELETE FROM docs WHERE collection = ? AND id = ?",
+                ((collection, doc_id) for doc_id in doc_ids),
+            )
+
+    # ---------- Tra cứu ----------
+
+    def get(self, collection: str, doc_id: str):
+        row = self._conn.execute(
+            "SELECT data FROM docs WHERE collection = ? AND id = ?", (collection, doc_id)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def contains(self, collection: str, doc_id: str) -> bool:
+        return self._conn.execute(
+            "SELECT 1 FROM docs WHERE collection = ? AND id = ?", (collection, doc_id)
+        ).fetchone() is not None
+
+    def search(
+        self,
+        collection: str,
+        prefix: str = None,
+        title: str = None,
+        min_coins: int = None,
+        max_coins: int = None,
+        active_only: bool = False,
+        limit: int = 100,
+    ):
+        """
+        Tìm kiếm trong cache
+
+        Returns:
+            list: [(doc_id, data)]
+        """
+        sql = "SELECT id, data FROM docs WHERE collection = ?"
+        params = [collection]
+        if prefix:
+            # Khoảng [prefix, prefix + U+FFFF) dùng được primary key
+            sql += " AND id >= ? AND id < ?"
+            params += [prefix, prefix + '\uffff']
+        if title:
+            sql += " AND title LIKE ?"
+            params.append(f"%{title}%")
+        if min_coins is not None:
+            sql += " AND coins >= ?"
+            params.append(min_coins)
+        if max_coins is not None:
+            sql += " AND coins <= ?"
+            params.append(max_coins)
+        sql += " ORDER BY id"
+        results = []
+        for doc_id, data in self._conn.execute(sql, params):
+            data = json.loads(data)
+            if active_only and data.get('is_active') is False:
+                continue
+            results.append((doc_id, data))
+            if len(results) >= limit:
+                break
+        return results
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Index người nhận thư riêng + dọn thư riêng đã hết hạn / đã nhận quà
+
+Thư riêng nằm ở mailbox/users/{mssv}/{mail_id} - mỗi user 1 collection
+riêng, nên không query chung được (collection group cần cùng collection ID)
+và muốn liệt kê phải list_collections() toàn bộ. Vì vậy mỗi lần gửi thư
+riêng, cùng batch ghi thêm 1 document index:
+
+    mailbox/index/recipients/{mssv}: {mssv, last_sent_at, min_expires_ts}
+
+min_expires_ts (epoch giây) = hạn sớm nhất của các thư còn trong hòm, cập
+nhật bằng transform Minimum nên không cần đọc trước. Dọn thư chỉ cần query
+index `min_expires_ts < mốc` => đúng các user có thư hết hạn, rồi nhiều
+worker xóa song song theo batch và đặt lại min_expires_ts theo thư còn lại.
+
+Lưu ý:
+- min_expires_ts chỉ được đặt lại với điều kiện update_time của index không
+  đổi từ lúc đọc (trước khi đọc thư). Có thư gửi xen vào => bỏ qua, index giữ
+  giá trị cũ (<= mốc) nên user được xét lại ở lần chạy sau. Hòm thư trống =>
+  xóa field (không ghi None, để Minimum của lần gửi sau luôn có hiệu lực).
+- Thư gửi trước khi có index: chạy rebuild_recipient_index 1 lần.
+- `claimed`: xóa cả thư đã nhận quà (mailbox/claimed/{mssv}/{mail_id});
+  app vẫn giữ bản sao trên máy nên người dùng không mất thư đã đọc.
+"""
+
+from datetime import datetime, timedelta, timezone
+import threading
+
+from fanout import fan_out
+from lazy_import import lazy_module
+from paging import iter_documents
+from recipients import ProgressLine, chunked
+
+firestore = lazy_module('firebase_admin.firestore')
+exceptions = lazy_module('google.api_core.exceptions')
+
+# ============ CẤU HÌNH ============
+BATCH_SIZE = 500  # Số thao tác tối đa trong 1 batch Firestore (giới hạn 500)
+INDEX_PAGE_SIZE = 500  # Số document index mỗi trang
+INDEX_ATTEMPTS = 3  # Số lần tính lại index khi có thư gửi xen vào (rebuild)
+MAX_IN_FLIGHT = 8  # Số user được dọn song song
+# ==================================
+
+
+def recipients_index(db):
+    """Collection index: mailbox/index/recipients"""
+    return db.collection('mailbox').document('index').collection('recipients')
+
+
+def index_update(expires_at: datetime) -> dict:
+    """Data ghi (merge) vào index khi gửi 1 thư riêng hết hạn lúc `expires_at`"""
+    return {
+        'last_sent_at': firestore.SERVER_TIMESTAMP,
+        'min_expires_ts': firestore.Minimum(int(expires_at.timestamp())),
+    }
+
+
+def add_to_index(batch, db, mssv: str, update: dict):
+    """Thêm thao tác cập nhật index của 1 người nhận vào batch"""
+    batch.set(recipients_index(db).document(mssv), {'mssv': mssv, **update}, merge=True)
+
+
+def _user_mails(db, mssv: str):
+    return db.collection('mailbox').document('users').collection(mssv)
+
+
+def _claimed_ids(db, mssv: str):
+    claimed = db.collection('mailbox').document('claimed').collection(mssv)
+    return {snapshot.id for snapshot in claimed.select([]).stream()}
+
+
+def _expires_ts(snapshot):
+    expires_at = (snapshot.to_dict() or {}).get('expires_at')
+    return int(expires_at.timestamp()) if expires_at is not None else None
+
+
+def _reset_index(db, mssv: str, snapshot, remaining) -> bool:
+    """
+    Đặt min_expires_ts theo hạn các thư còn lại, chỉ khi index không đổi từ lúc
+    đọc `snapshot` (đọc trước khi đọc thư)
+
+    Returns:
+        bool: False nếu có thư gửi xen vào (index giữ nguyên)
+    """
+    ref = recipients_index(db).document(mssv)
+    try:
+        if snapshot.exists:
+            value = min(remaining) if remaining else firestore.DELETE_FIELD
+            ref.update({'min_expires_ts': value}, option=db.write_option(last_update_time=snapshot.update_time))
+        else:
+            ref.create({'mssv': mssv, **({'min_expires_ts': min(remaining)} if remaining else {})})
+    except (exceptions.FailedPrecondition, exceptions.Conflict):
+        return False
+    return True
+
+
+def _remaining_expires(db, mssv: str):
+    return [ts for ts in map(_expires_ts, _user_mails(db, mssv).select(['expires_at']).stream()) if ts is not None]
+
+
+def _compact_user(db, mssv: str, cutoff_ts: int, claimed: bool, dry_run: bool):
+    """
+    Dọn hòm thư của 1 user
+
+    Returns:
+        tuple: (số thư xóa, số thư còn lại)
+    """
+    index_snapshot = None if dry_run else recipients_index(db).document(mssv).get()
+    snapshots = list(_user_mails(db, mssv).select(['expires_at']).stream())
+    claimed_ids = _claimed_ids(db, mssv) if claimed else set()
+    remove, keep = [], []
+    for snapshot in snapshots:
+        expires_ts = _expires_ts(snapshot)
+        if (expires_ts is not None and expires_ts < cutoff_ts) or snapshot.id in claimed_ids:
+            remove.append(snapshot.reference)
+        else:
+            keep.append(expires_ts)
+    if dry_run:
+        return len(remove), len(keep)
+
+    for chunk in chunked(remove, BATCH_SIZE):
+        batch = db.batch()
+        for ref in chunk:
+            batch.delete(ref)
+        batch.commit()
+    remaining = [ts for ts in keep if ts is not None]
+    # Không xóa gì và index đã đúng => không ghi lại index
+    indexed = (index_snapshot.to_dict() or {}).get('min_expires_ts') if index_snapshot.exists else False
+    if remove or indexed != (min(remaining) if remaining else None):
+        _reset_index(db, mssv, index_snapshot, remaining)
+    return len(remove), len(keep)
+
+
+def compact_user_mail(
+    db,
+    grace_days: int = 0,
+    claimed: bool = False,
+    dry_run: bool = False,
+    max_in_flight: int = MAX_IN_FLIGHT,
+):
+    """
+    Xóa thư riêng đã hết hạn (và đã nhận quà nếu `claimed`) của mọi user
+
+    Args:
+        grace_days: Chỉ xóa thư đã hết hạn quá N ngày
+        claimed: Xóa cả thư đã nhận quà (phải quét toàn bộ index)
+        dry_run: Chỉ đếm, không xóa
+
+    Returns:
+        dict: {'users', 'deleted', 'kept', 'failed'}
+    """
+    cutoff_ts = int((datetime.now(timezone.utc) - timedelta(days=grace_days)).timestamp())
+    index = recipients_index(db)
+    if claimed:
+        query = index.order_by('__name__')
+    else:
+        query = index.where(filter=firestore.FieldFilter('min_expires_ts', '<', cutoff_ts)).order_by('min_expires_ts')
+    tasks = ((snapshot.id, snapshot.id) for snapshot in iter_documents(query.select(['mssv']), INDEX_PAGE_SIZE))
+
+    stats = {'users': 0, 'deleted': 0, 'kept': 0, 'failed': 0}
+    lock = threading.Lock()
+    print(f"\n🧹 {'Đếm' if dry_run else 'Dọn'} thư riêng đã hết hạn{' / đã nhận quà' if claimed else ''}...")
+    progress = ProgressLine("📭 Đã dọn (user)")
+
+    def report(mssv, _, error):
+        if error is not None:
+            stats['failed'] += 1
+            progress.note(f"   ✗ {mssv}: {error}")
+            progress.update(failed=1)
+        else:
+            progress.update(success=1)
+
+    def worker(mssv):
+        removed, kept = _compact_user(db, mssv, cutoff_ts, claimed, dry_run)
+        with lock:
+            stats['deleted'] += removed
+            stats['kept'] += kept
+
+    result = fan_out(tasks, worker, max_in_flight=max_in_flight, on_done=report)
+    progress.finish()
+    stats['users'] = progress.success
+    if result.aborted:
+        print("   ⛔ Tỉ lệ lỗi quá cao, đã ngừng dọn!")
+    action = "Có" if dry_run else "Đã xóa"
+    print(f"   ✅ {action} {stats['deleted']:,} thư ở {stats['users']:,} user, còn lại {stats['kept']:,} thư")
+    if stats['failed']:
+        print(f"   ⚠ {stats['failed']:,} user lỗi, chạy lại để dọn tiếp")
+    return stats
+
+
+def rebuild_recipient_index(db, max_in_flight: int = MAX_IN_FLIGHT):
+    """
+    Tạo index cho thư riêng gửi trước khi có index (list_collections 1 lần)
+
+    Returns:
+        int: Số user đã ghi index
+    """
+    print("\n🗂 Tạo lại index người nhận từ mailbox/users...")
+    progress = ProgressLine("🗂 Đã index (user)")
+
+    def worker(mssv):
+        for _ in range(INDEX_ATTEMPTS):
+            snapshot = recipients_index(db).document(mssv).get()
+            if _reset_index(db, mssv, snapshot, _remaining_expires(db, mssv)):
+                return
+        # Vẫn có thư gửi xen vào: index đã có Minimum của thư mới, các thư cũ
+        # được tính lại khi dọn tới user này
+
+    def report(mssv, _, error):
+        if error is not None:
+            progress.note(f"   ✗ {mssv}: {error}")
+            progress.update(failed=1)
+        else:
+            progress.update(success=1)
+
+    collections = db.collection('mailbox').document('users').collections()
+    fan_out(((c.id, c.id) for c in collections), worker, max_in_flight=max_in_flight, on_done=report)
+    progress.finish()
+    return progress.success
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Mẫu thư cá nhân hóa: "Chúc mừng {name} đạt GPA {gpa}!"
+
+Mẫu được phân tích 1 lần (MailTemplate), mỗi người nhận chỉ còn ghép các
+đoạn đã tách sẵn với giá trị trong dòng dữ liệu. Cú pháp giống str.format:
+{cột}, {cột:,} (định dạng số), {cột:>20} (căn lề chuỗi), {{ và }} để viết dấu ngoặc.
+
+Dữ liệu đọc dạng luồng bằng recipients.iter_recipient_rows; các cột
+coins / diamonds / xp (nếu có và không trống) ghi đè phần quà mặc định.
+"""
+
+import string
+
+# ============ CẤU HÌNH ============
+REWARD_COLUMNS = ('coins', 'diamonds', 'xp')  # Cột ghi đè phần quà theo từng dòng
+# ==================================
+
+
+class TemplateError(ValueError):
+    """Mẫu sai cú pháp, thiếu cột hoặc giá trị không dùng được"""
+
+
+def _is_numeric_spec(format_spec: str) -> bool:
+    """Định dạng chỉ dùng cho số ({x:,} {x:.2f} {x:+}...) => đổi chuỗi sang số; {x:>20} thì không"""
+    align, spec = '', format_spec
+    if len(spec) >= 2 and spec[1] in '<>=^':
+        align, spec = spec[1], spec[2:]  # Ký tự đệm (có thể là ',') + căn lề
+    elif spec[:1] in ('<', '>', '=', '^'):
+        align, spec = spec[0], spec[1:]
+    return (align == '=' or spec[:1] in ('+', '-', ' ') or ',' in spec or '_' in spec
+            or spec[-1:] in tuple('bcdeEfFgGnoxX%'))
+
+
+def _number(value: str):
+    """'1200' => 1200, '3.5' => 3.5 (để dùng được định dạng như {coins:,})"""
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+class MailTemplate:
+    """Mẫu đã phân tích sẵn: list (đoạn chữ, tên cột, định dạng)"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self._parts = []
+        try:
+            for literal, field, format_spec, conversion in string.Formatter().parse(text):
+                if field is not None:
+                    if not field or conversion or not field.isidentifier():
+                        raise TemplateError(f"Chỉ hỗ trợ {{tên_cột}} hoặc {{tên_cột:định_dạng}}: {text!r}")
+                    field = field.lower()
+                self._parts.append((literal, field, format_spec or ''))
+        except ValueError as e:
+            if isinstance(e, TemplateError):
+                raise
+            raise TemplateError(f"Mẫu sai cú pháp ({e}): {text!r}")
+        self.fields = {field for _, field, _ in self._parts if field}
+
+    def render(self, row: dict) -> str:
+        """Ghép mẫu với 1 dòng dữ liệu (key đã viết thường)"""
+        out = []
+        for literal, field, format_spec in self._parts:
+            out.append(literal)
+            if field is None:
+                continue
+            value = row.get(field)
+            if value is None or value == '':
+                raise TemplateError(f"thiếu giá trị cột '{field}'")
+            if format_spec:
+                try:
+                    value = format(_number(value) if _is_numeric_spec(format_spec) else value, format_spec)
+                except ValueError:
+                    raise TemplateError(f"cột '{field}' = {value!r} không định dạng được '{format_spec}'")
+            out.append(value)
+        return ''.join(out)
+
+
+def required_columns(*templates):
+    """Các cột file dữ liệu phải có (cột quà không bắt buộc vì có giá trị mặc định)"""
+    fields = set().union(*(template.fields for template in templates))
+    return fields - set(REWARD_COLUMNS)
+
+
+def row_reward(row: dict, defaults: dict):
+    """
+    Phần quà của 1 dòng: cột coins / diamonds / xp ghi đè giá trị mặc định
+
+    Returns:
+        dict: {'coins', 'diamonds', 'xp'}
+    """
+    reward = {}
+    for column in REWARD_COLUMNS:
+        value = row.get(column)
+        if value is None or value == '':
+            reward[column] = defaults.get(column, 0)
+            continue
+        try:
+            reward[column] = int(value)
+        except ValueError:
+            raise TemplateError(f"cột '{column}' = {value!r} không phải số nguyên")
+        if reward[column] < 0:
+            raise TemplateError(f"cột '{column}' = {value!r} không được âm")
+    return reward
+
+
+def render_rows(rows, title: MailTemplate, content: MailTemplate, defaults: dict, errors: list = None):
+    """
+    Generator: mỗi dòng hợp lệ => (mssv, {'title', 'content', 'reward'})
+
+    Mẫu dùng được {coins} / {diamonds} / {xp} = phần quà thật của dòng (kể
+    cả khi lấy từ giá trị mặc định). Dòng lỗi (thiếu giá trị, số sai) bị bỏ
+    qua và ghi vào `errors` dạng (mssv, thông báo).
+    """
+    for row in rows:
+        try:
+            reward = row_reward(row, defaults)
+            values = {**row, **{column: str(amount) for column, amount in reward.items()}}
+            fields = {
+                'title': title.render(values),
+                'content': content.render(values),
+                'reward': reward if any(reward.values()) else None,
+            }
+        except TemplateError as e:
+            if errors is not None:
+                errors.append((row['mssv'], str(e)))
+            continue
+        yield row['mssv'], fields
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Phân trang query Firestore bằng cursor (order_by + start_after)
+
+Mỗi trang là 1 query có limit, trang sau bắt đầu ngay sau document cuối của
+trang trước => không phải tải lại từ đầu, không bị giới hạn bởi offset.
+"""
+
+PAGE_SIZE = 50  # Số document mỗi trang mặc định
+
+
+def iter_pages(query, page_size: int = PAGE_SIZE, start_after=None):
+    """
+    Generator trả về từng trang (list snapshot) của query
+
+    Args:
+        query: Query đã có order_by (cursor dựa trên thứ tự này)
+        page_size: Số document mỗi trang
+        start_after: Snapshot (hoặc dict giá trị các field order_by) để bắt đầu sau
+    """
+    cursor = start_after
+    while True:
+        page_query = query.limit(page_size)
+        if cursor is not None:
+            page_query = page_query.start_after(cursor)
+        page = list(page_query.stream())
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        cursor = page[-1]
+
+
+def iter_documents(query, page_size: int = PAGE_SIZE, start_after=None):
+    """Generator trả về từng snapshot, tải theo trang"""
+    for page in iter_pages(query, page_size, start_after):
+        yield from page
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Tìm người nhận từ dữ liệu app trên Firestore (students/{mssv})
+
+App ghi students/{mssv} mỗi khi sinh viên đồng bộ (điểm, học phí, game...),
+nên "mọi sinh viên từng mở app" = mọi document trong students. Thay vì 1
+luồng đọc tuần tự, collection được chia bằng partition query
+(get_partitions) rồi nhiều worker đọc các partition song song. Nhờ select()
+mỗi document chỉ tải ID (thêm lastUpdated khi cần lọc theo thời gian).
+
+MSSV khớp điều kiện được đẩy qua hàng đợi có giới hạn vào pipeline gửi
+(send_mail_to_multiple_users): gửi bắt đầu ngay khi worker đầu tiên tìm thấy
+người nhận, và worker tự chờ khi phía gửi chưa theo kịp.
+
+Điều kiện lọc được kiểm tra trên máy (partition query không cho thêm where):
+- prefix: MSSV bắt đầu bằng (VD: 110122 = khóa K22)
+- active_since: lastUpdated từ thời điểm này trở đi
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import threading
+
+from campaign_scheduler import parse_time
+from recipients import is_valid_mssv
+
+# ============ CẤU HÌNH ============
+STUDENTS_COLLECTION = "students"  # Collection app ghi dữ liệu sinh viên
+PARTITION_COUNT = 32  # Số partition tối đa xin server chia (có thể nhận ít hơn)
+MAX_WORKERS = 8  # Số partition đọc song song
+QUEUE_SIZE = 5000  # Số MSSV chờ gửi tối đa trước khi worker phải chờ
+# ==================================
+
+_DONE = object()
+
+
+class ResolveStats:
+    """Thống kê khi quét students"""
+
+    def __init__(self):
+        self.partitions = 0
+        self.scanned = 0
+        self.matched = 0
+        self.invalid = 0
+
+    def summary(self):
+        return (f"Quét {self.scanned:,} sinh viên / {self.partitions} partition | "
+                f"Khớp {self.matched:,} | MSSV không hợp lệ {self.invalid:,}")
+
+
+def _aware(moment):
+    """datetime không múi giờ => theo giờ máy (Firestore trả về datetime có múi giờ)"""
+    if moment is not None and moment.tzinfo is None:
+        moment = moment.astimezone()
+    return moment
+
+
+def resolve_students(
+    db,
+    prefix: str = None,
+    active_since=None,
+    partitions: int = PARTITION_COUNT,
+    workers: int = MAX_WORKERS,
+    stats: ResolveStats = None,
+):
+    """
+    Generator: MSSV trong students khớp điều kiện, đọc song song theo partition
+
+    Thứ tự MSSV không cố định. Dừng đọc generator giữa chừng (hoặc lỗi ở 1
+    worker) sẽ dừng mọi worker.
+
+    Args:
+        prefix: Chỉ lấy MSSV bắt đầu bằng chuỗi này
+        active_since: Chỉ lấy sinh viên có lastUpdated >= mốc này (datetime
+            hoặc chuỗi ISO)
+        partitions: Số partition tối đa
+        workers: Số partition đọc cùng lúc
+    """
+    stats = stats if stats is not None else ResolveStats()
+    active_since = _aware(parse_time(active_since))
+    fields = ['lastUpdated'] if active_since is not None else []
+    lock = threading.Lock()
+    out = queue.Queue(maxsize=QUEUE_SIZE)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def matches(snapshot):
+        if active_since is None:
+            return True
+        last_updated = (snapshot.to_dict() or {}).get('lastUpdated')
+        return last_updated is not None and last_updated >= active_since
+
+    def scan(partition):
+        try:
+            scanned = matched = invalid = 0
+            for snapshot in partition.query().select(fields).stream():
+                if stop.is_set():
+                    break
+                # collection_group còn gồm collection "students" lồng bên dưới => bỏ qua
+                if snapshot.reference.path.count('/') != 1:
+                    continue
+                scanned += 1
+                mssv = snapshot.id
+                if prefix and not mssv.startswith(prefix):
+                    continue
+                if not is_valid_mssv(mssv):
+                    invalid += 1
+                    continue
+                if matches(snapshot):
+                    matched += 1
+                    put(mssv)
+            with lock:
+                stats.scanned += scanned
+                stats.matched += matched
+                stats.invalid += invalid
+            put(_DONE)
+        except Exception as e:
+            put(e)
+
+    parts = list(db.collection_group(STUDENTS_COLLECTION).get_partitions(partitions))
+    stats.partitions = len(parts)
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        for partition in parts:
+            executor.submit(scan, partition)
+        remaining = len(parts)
+        while remaining:
+            item = out.get()
+            if item is _DONE:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def count_students(db, prefix: str = None, active_since=None, **kwargs) -> ResolveStats:
+    """Chỉ đếm (không gửi): dùng cho dry run"""
+    stats = ResolveStats()
+    for _ in resolve_students(db, prefix, active_since, stats=stats, **kwargs):
+        pass
+    return stats
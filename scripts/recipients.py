@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Đọc danh sách người nhận (MSSV) dạng luồng
+
+Nguồn hỗ trợ:
+- File CSV (lấy cột 'mssv' nếu có header, không thì cột đầu tiên)
+- File text, mỗi dòng 1 MSSV (hoặc nhiều MSSV cách nhau bởi dấu phẩy)
+- stdin (đường dẫn '-')
+- File CSV dữ liệu theo từng người (iter_recipient_rows, dùng cho thư cá nhân hóa)
+
+Mọi bước đều là generator nên file lớn bao nhiêu cũng không phải nạp hết
+vào bộ nhớ; chỉ giữ tập MSSV đã gặp để loại trùng.
+"""
+
+import csv
+import re
+import sys
+import time
+
+# ============ CẤU HÌNH ============
+MSSV_PATTERN = re.compile(r'^[A-Za-z0-9]{5,20}$')  # MSSV hợp lệ (dùng làm tên collection)
+PROGRESS_INTERVAL = 1.0  # Số giây tối thiểu giữa 2 lần in tiến độ
+# ==================================
+
+
+class RecipientStats:
+    """Thống kê khi đọc danh sách người nhận"""
+
+    def __init__(self):
+        self.read = 0
+        self.valid = 0
+        self.invalid = 0
+        self.duplicate = 0
+
+    def summary(self):
+        return (f"Đọc {self.read:,} | Hợp lệ {self.valid:,} | "
+                f"Không hợp lệ {self.invalid:,} | Trùng {self.duplicate:,}")
+
+
+def is_valid_mssv(mssv: str) -> bool:
+    """Kiểm tra MSSV hợp lệ"""
+    return bool(MSSV_PATTERN.match(mssv))
+
+
+def _open_source(path: str):
+    if path == '-':
+        return sys.stdin
+    return open(path, 'r', encoding='utf-8-sig', newline='')
+
+
+def read_raw_recipients(path: str):
+    """Đọc từng MSSV thô (chưa kiểm tra) từ file CSV/text hoặc stdin"""
+    source = _open_source(path)
+    try:
+        if path.lower().endswith('.csv'):
+            reader = csv.reader(source)
+            column = 0
+            for row_index, row in enumerate(reader):
+                if not row:
+                    continue
+                if row_index == 0:
+                    header = [cell.strip().lower() for cell in row]
+                    if 'mssv' in header:
+                        column = header.index('mssv')
+                        continue
+                if column < len(row):
+                    yield row[column]
+        else:
+            for line in source:
+                for item in line.split(','):
+                    yield item
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+
+def clean_recipients(raw_mssvs, stats: RecipientStats = None):
+    """Chuẩn hóa, kiểm tra và loại trùng MSSV ngay khi đọc"""
+    stats = stats if stats is not None else RecipientStats()
+    seen = set()
+    for raw in raw_mssvs:
+        mssv = raw.strip()
+        if not mssv:
+            continue
+        stats.read += 1
+        if not is_valid_mssv(mssv):
+            stats.invalid += 1
+            continue
+        if mssv in seen:
+            stats.duplicate += 1
+            continue
+        seen.add(mssv)
+        stats.valid += 1
+        yield mssv
+
+
+def iter_recipients(path: str, stats: RecipientStats = None):
+    """Đọc MSSV hợp lệ, không trùng từ file hoặc stdin"""
+    return clean_recipients(read_raw_recipients(path), stats)
+
+
+def iter_recipient_rows(path: str, stats: RecipientStats = None, required=()):
+    """
+    Đọc file CSV có header (bắt buộc cột 'mssv') dạng luồng, mỗi dòng là
+    dict {tên cột viết thường: giá trị}. MSSV được kiểm tra và loại trùng
+    như iter_recipients.
+    
+    Raises:
+        ValueError: Header thiếu cột 'mssv' hoặc cột trong `required`
+            (khi lấy phần tử đầu tiên)
+    """
+    stats = stats if stats is not None else RecipientStats()
+    seen = set()
+    source = _open_source(path)
+    try:
+        reader = csv.reader(source)
+        header = next(reader, None)
+        header = [cell.strip().lower() for cell in header or []]
+        missing = [column for column in ('mssv', *sorted(required)) if column not in header]
+        if missing:
+            raise ValueError(f"Header file dữ liệu thiếu cột: {', '.join(missing)}")
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            record = {column: value.strip() for column, value in zip(header, row)}
+            mssv = record.get('mssv', '')
+            stats.read += 1
+            if not is_valid_mssv(mssv):
+                stats.invalid += 1
+                continue
+            if mssv in seen:
+                stats.duplicate += 1
+                continue
+            seen.add(mssv)
+            stats.valid += 1
+            yield record
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+
+def chunked(iterable, size: int):
+    """Gom iterable thành từng list tối đa `size` phần tử (không nạp hết vào bộ nhớ)"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ProgressLine:
+    """In 1 dòng tiến độ gộp, tối đa 1 lần mỗi PROGRESS_INTERVAL giây"""
+
+    def __init__(self, label: str, total: int = None, interval: float = PROGRESS_INTERVAL):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.success = 0
+        self.failed = 0
+        self._started = time.monotonic()
+        self._last_print = 0.0
+
+    def update(self, success: int = 0, failed: int = 0):
+        self.success += success
+        self.failed += failed
+        now = time.monotonic()
+        if now - self._last_print >= self.interval:
+            self._last_print = now
+            self._print()
+
+    def note(self, text: str):
+        """In 1 dòng thông báo riêng (vd: lỗi) mà không làm vỡ dòng tiến độ"""
+        print(f"\r\033[K{text}", flush=True)
+
+    def _print(self, end=''):
+        done = self.success + self.failed
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        total = f"/{self.total:,}" if self.total else ""
+        print(f"\r\033[K   {self.label}: {done:,}{total} | ✓ {self.success:,} | "
+              f"✗ {self.failed:,} | {done / elapsed:,.0f}/s", end=end, flush=True)
+
+    def finish(self):
+        self._print(end='\n')
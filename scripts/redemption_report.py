@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Báo cáo lượt nhận mã thưởng / quà trong thư bằng aggregation query
+
+Mọi con số tổng (số mã, số lượt nhận, tổng xu/kim cương/XP đã phát) được
+Firestore tính trên server bằng count()/sum() - mỗi con số là 1 RPC, không
+tải document về máy. Chỉ top mã (limit N) là được đọc.
+
+Lượt nhận mã nằm ở reward_codes_claimed/{mssv}/codes/{code} nên đếm được
+cho cả hệ thống bằng collection group 'codes'. Để đếm theo TỪNG mã, document
+nhận mã cần field `code` (app ghi từ bản này; dữ liệu cũ dùng backfill) và
+index collection group cho field `code` (Firebase Console > Firestore >
+Indexes > Single field > thêm exemption cho collection group 'codes').
+
+Thư: lượt nhận quà thư lưu ở mailbox/claimed/{mssv}/{mailId} - tên collection
+là MSSV nên không gom nhóm được; báo cáo chỉ tính quà đang được phát qua
+thư global / thư theo nhóm.
+"""
+
+import json
+
+from claim_shards import all_shard_claims, claim_totals
+from fanout import fan_out
+from lazy_import import lazy_module
+from paging import iter_pages
+
+firestore = lazy_module('firebase_admin.firestore')
+
+# ============ CẤU HÌNH ============
+TOP_CODES = 10  # Số mã nhiều lượt nhận nhất hiển thị trong báo cáo
+DRIFT_CHECK = 50  # Số mã (nhiều lượt nhất) được kiểm tra lệch current_claims
+MAX_IN_FLIGHT = 8  # Số aggregation query chạy song song khi kiểm tra lệch
+BACKFILL_PAGE_SIZE = 500  # Số document mỗi trang / mỗi batch khi backfill
+# ==================================
+
+REWARD_FIELDS = ('reward.coins', 'reward.diamonds', 'reward.xp')
+
+
+def aggregate(query, sums=()):
+    """
+    count() + sum() các field của query trong 1 RPC
+
+    Returns:
+        dict: {'count': n, 'reward.coins': tổng, ...}
+    """
+    aggregation = query.count(alias='count')
+    for index, field in enumerate(sums):
+        aggregation = aggregation.sum(field, alias=f"sum_{index}")
+    values = {result.alias: result.value for result in aggregation.get()[0]}
+    report = {'count': int(values.get('count') or 0)}
+    for index, field in enumerate(sums):
+        report[field] = values.get(f"sum_{index}") or 0
+    return report
+
+
+def _claims_group(db):
+    """Mọi document nhận mã: reward_codes_claimed/{mssv}/codes/{code}"""
+    return db.collection_group('codes')
+
+
+def count_claims(db, code: str) -> int:
+    """Số lượt nhận thực tế của 1 mã (cần field `code` trong document nhận mã)"""
+    query = _claims_group(db).where(filter=firestore.FieldFilter('code', '==', code))
+    return aggregate(query)['count']
+
+
+def build_report(db, top: int = TOP_CODES, drift_check: int = DRIFT_CHECK):
+    """
+    Tạo báo cáo (dict). Số RPC: ~7 + 1-2 query top mã + 1 aggregation mỗi mã
+    chia shard + drift_check aggregation
+    """
+    codes_ref = db.collection('reward_codes')
+    report = {}
+
+    # 1. Tổng quan mã
+    all_codes = aggregate(codes_ref, sums=('current_claims',))
+    active = aggregate(codes_ref.where(filter=firestore.FieldFilter('is_active', '==', True)))
+    # Mã chia shard đếm lượt nhận ở shard, không ở current_claims (xem claim_shards.py)
+    shard_claims = all_shard_claims(db)
+    report['codes'] = {
+        'total': all_codes['count'],
+        'active': active['count'],
+        'current_claims_total': all_codes['current_claims'] + shard_claims,
+        'shard_claims': shard_claims,
+    }
+
+    # 2. Lượt nhận thực tế + quà đã phát (collection group)
+    claims = aggregate(_claims_group(db), sums=REWARD_FIELDS)
+    tagged = aggregate(_claims_group(db).where(filter=firestore.FieldFilter('code', '>=', '')))
+    report['claims'] = {
+        'total': claims['count'],
+        'without_code_field': claims['count'] - tagged['count'],
+        'coins': claims['reward.coins'],
+        'diamonds': claims['reward.diamonds'],
+        'xp': claims['reward.xp'],
+    }
+    # Lệch tổng: current_claims cộng dồn so với số document nhận mã thật
+    report['claims']['total_drift'] = report['codes']['current_claims_total'] - claims['count']
+
+    # 3. Top mã theo lượt nhận (chỉ đọc `limit` document, chỉ lấy field cần)
+    #    + mọi mã chia shard (ít, là mã hot) vì current_claims của chúng chưa đủ
+    limit = max(top, drift_check)
+    fields = ['title', 'current_claims', 'max_claims', 'is_active', 'shard_count']
+    top_query = (codes_ref
+                 .order_by('current_claims', direction=firestore.Query.DESCENDING)
+                 .limit(limit)
+                 .select(fields))
+    sharded_query = codes_ref.where(filter=firestore.FieldFilter('shard_count', '>', 0)).select(fields)
+    docs = {doc.id: doc.to_dict() for doc in top_query.stream()}
+    if shard_claims:
+        docs.update((doc.id, doc.to_dict()) for doc in sharded_query.stream())
+    totals = claim_totals(db, docs.items())
+    top_codes = []
+    for code, data in docs.items():
+        current = totals[code]
+        max_claims = int(data.get('max_claims') or 0)
+        top_codes.append({
+            'code': code,
+            'title': data.get('title'),
+            'current_claims': current,
+            'max_claims': max_claims,
+            'redemption_rate': round(current / max_claims, 4) if max_claims else None,
+            'is_active': data.get('is_active', True),
+            'shard_count': int(data.get('shard_count') or 0),
+        })
+    top_codes.sort(key=lambda entry: entry['current_claims'], reverse=True)
+    top_codes = top_codes[:limit]
+    report['top_codes'] = top_codes[:top]
+
+    # 4. Lệch current_claims theo từng mã (mỗi mã 1 aggregation, chạy song song)
+    drift = []
+    if drift_check and report['claims']['without_code_field'] == 0:
+        def check(entry):
+            entry['actual_claims'] = count_claims(db, entry['code'])
+
+        checked = top_codes[:drift_check]
+        fan_out(((entry['code'], entry) for entry in checked), check, max_in_flight=MAX_IN_FLIGHT)
+        for entry in checked:
+            actual = entry.pop('actual_claims', None)
+            if actual is not None and actual != entry['current_claims']:
+                drift.append({'code': entry['code'], 'current_claims': entry['current_claims'],
+                              'actual_claims': actual, 'drift': entry['current_claims'] - actual})
+        report['drift_checked'] = len(checked)
+    else:
+        report['drift_checked'] = 0
+    report['drift'] = drift
+
+    # 5. Quà đang phát qua thư (không có dữ liệu lượt nhận, xem docstring module)
+    mailbox = db.collection('mailbox')
+    global_mails = aggregate(mailbox.document('global').collection('mails'), sums=REWARD_FIELDS)
+    audience_mails = aggregate(mailbox.document('audience').collection('mails'))
+    report['mail'] = {
+        'global_mails': global_mails['count'],
+        'global_coins_per_user': global_mails['reward.coins'],
+        'global_diamonds_per_user': global_mails['reward.diamonds'],
+        'global_xp_per_user': global_mails['reward.xp'],
+        'audience_mail_documents': audience_mails['count'],
+    }
+    return report
+
+
+def print_report(report):
+    codes, claims, mail = report['codes'], report['claims'], report['mail']
+    print(f"\n{'='*60}")
+    print("📊 BÁO CÁO LƯỢT NHẬN MÃ THƯỞNG")
+    print(f"{'='*60}")
+    print(f"🎁 Mã: {codes['total']:,} (đang hoạt động {codes['active']:,})")
+    print(f"👥 Lượt nhận: {claims['total']:,} document | current_claims cộng dồn: {codes['current_claims_total']:,}"
+          + (f" (gồm {codes['shard_claims']:,} ở shard)" if codes['shard_claims'] else ""))
+    print(f"💰 Đã phát: {claims['coins']:,} xu | 💎 {claims['diamonds']:,} kim cương | ⭐ {claims['xp']:,} XP")
+    if claims['total_drift']:
+        print(f"⚠ Tổng current_claims lệch {claims['total_drift']:+,} so với số lượt nhận thật")
+
+    print(f"\n🏆 TOP {len(report['top_codes'])} MÃ")
+    for entry in report['top_codes']:
+        rate = f"{entry['redemption_rate']:.0%}" if entry['redemption_rate'] is not None else "∞"
+        status = "✅" if entry['is_active'] is not False else "❌"
+        shards = f" | ⚡ {entry['shard_count']} shard" if entry['shard_count'] else ""
+        print(f"   {status} {entry['code']:<16} {entry['current_claims']:>8,}/"
+              f"{entry['max_claims'] or '∞'} ({rate}) | {entry.get('title') or ''}{shards}")
+
+    if claims['without_code_field']:
+        print(f"\n⚠ {claims['without_code_field']:,} lượt nhận cũ chưa có field 'code' "
+              f"=> bỏ qua kiểm tra lệch từng mã (chạy backfill trước)")
+    elif report['drift']:
+        print(f"\n⚠ {len(report['drift'])}/{report['drift_checked']} mã bị lệch current_claims:")
+        for entry in report['drift']:
+            print(f"   • {entry['code']}: current_claims={entry['current_claims']:,}, "
+                  f"thực tế={entry['actual_claims']:,} ({entry['drift']:+,})")
+    elif report['drift_checked']:
+        print(f"\n✅ {report['drift_checked']} mã đã kiểm tra, current_claims khớp")
+
+    print(f"\n📧 Thư global: {mail['global_mails']:,} (mỗi user nhận tối đa "
+          f"{mail['global_coins_per_user']:,} xu | {mail['global_diamonds_per_user']:,} kim cương | "
+          f"{mail['global_xp_per_user']:,} XP)")
+    print(f"📧 Thư theo nhóm: {mail['audience_mail_documents']:,} document")
+    print(f"{'='*60}\n")
+
+
+def redemption_report(db, top: int = TOP_CODES, drift_check: int = DRIFT_CHECK, json_path: str = None):
+    """Tạo, in và (tùy chọn) lưu báo cáo JSON"""
+    report = build_report(db, top, drift_check)
+    print_report(report)
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Đã lưu báo cáo: {json_path}")
+    return report
+
+
+def backfill_claim_codes(db):
+    """
+    Ghi field `code` (= document ID) cho các document nhận mã cũ chưa có
+
+    Đọc theo trang chỉ lấy field `code`, ghi theo batch song song.
+
+    Returns:
+        int: Số document đã cập nhật
+    """
+    query = _claims_group(db).order_by('__name__').select(['code'])
+
+    def pages():
+        for page in iter_pages(query, BACKFILL_PAGE_SIZE):
+            refs = [doc.reference for doc in page if 'code' not in (doc.to_dict() or {})]
+            if refs:
+                yield refs
+
+    def commit(refs):
+        batch = db.batch()
+        for ref in refs:
+            batch.update(ref, {'code': ref.id})
+        batch.commit()
+
+    updated = 0
+
+    def report(index, refs, error):
+        nonlocal updated
+        if error is None:
+            updated += len(refs)
+        else:
+            print(f"   ✗ Batch {index}: {error}")
+
+    print("\n🔧 Backfill field 'code' cho lượt nhận mã cũ...")
+    fan_out(enumerate(pages(), start=1), commit, max_in_flight=MAX_IN_FLIGHT, on_done=report)
+    print(f"   ✅ Đã cập nhật {updated:,} document")
+    return updated
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Thử lại lỗi tạm thời của Firestore với exponential backoff + jitter
+
+Chỉ thử lại lỗi gRPC mang tính tạm thời: DEADLINE_EXCEEDED, UNAVAILABLE,
+ABORTED. Lỗi khác (sai quyền, sai dữ liệu, quá hạn mức...) có thử lại cũng
+không khỏi nên được trả về ngay.
+
+Thời gian chờ lần thứ n là ngẫu nhiên trong [0, min(BACKOFF_MAX, BACKOFF_BASE * 2^n)]
+("full jitter"): các worker cùng gặp lỗi không dội lại server cùng 1 lúc.
+
+Lưu ý: DEADLINE_EXCEEDED không có nghĩa là chưa ghi - chỉ nên thử lại các
+thao tác ghi lặp lại được (set cùng document ID), không dùng cho create hay
+increment.
+"""
+
+import random
+import time
+
+from lazy_import import lazy_module
+
+exceptions = lazy_module('google.api_core.exceptions')
+
+# ============ CẤU HÌNH ============
+MAX_ATTEMPTS = 5  # Tổng số lần gọi (kể cả lần đầu)
+BACKOFF_BASE = 0.5  # Giây
+BACKOFF_MAX = 30.0  # Giây
+# ==================================
+
+
+def is_retryable(error: Exception) -> bool:
+    """Lỗi tạm thời (DEADLINE_EXCEEDED / UNAVAILABLE / ABORTED)?"""
+    return isinstance(error, (exceptions.DeadlineExceeded, exceptions.ServiceUnavailable, exceptions.Aborted))
+
+
+def backoff_delay(attempt: int, rng=random) -> float:
+    """Thời gian chờ trước lần thử lại thứ `attempt` (bắt đầu từ 1)"""
+    return rng.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+def with_retry(fn, max_attempts: int = MAX_ATTEMPTS, on_retry=None, sleep=time.sleep):
+    """
+    Gọi fn(), thử lại khi gặp lỗi tạm thời
+
+    Args:
+        on_retry: Callback on_retry(attempt, error, delay) trước mỗi lần chờ
+
+    Returns:
+        Kết quả của fn(); lỗi không thử lại được hoặc lỗi ở lần cuối được raise lại
+    """
+    attempt = 1
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= max_attempts or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt)
+            if on_retry is not None:
+                on_retry(attempt, e, delay)
+            sleep(delay)
+            attempt += 1
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Định dạng mã thưởng có ký tự kiểm tra: [TIỀN TỐ-]XXXXX-XXXXX
+
+- Bảng chữ Crockford Base32 (0-9, A-Z bỏ I, L, O, U): không có ký tự dễ
+  nhầm. Khi nhập, O được hiểu là 0, I và L là 1.
+- 9 ký tự ngẫu nhiên (45 bit) + 1 ký tự kiểm tra Luhn mod 32: bắt được mọi
+  lỗi gõ sai 1 ký tự và hầu hết lỗi đảo 2 ký tự liền nhau.
+- Tiền tố tùy chọn (A-Z, 0-9, tối đa 10 ký tự) để nhóm mã theo đợt/chiến dịch,
+  không nằm trong phần kiểm tra.
+
+Document ID trên Firestore là dạng chuẩn có dấu gạch. App kiểm tra mã ngay
+trên máy (lib/features/gamification/modules/reward_code/utils/
+reward_code_format.dart, cùng thuật toán) nên mã gõ sai không tốn lượt đọc.
+Mã kiểu cũ (A-Z0-9, không gạch) vẫn dùng được bình thường.
+"""
+
+import re
+import secrets
+
+# ============ CẤU HÌNH ============
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"  # Crockford Base32
+BODY_LENGTH = 10  # 9 ký tự ngẫu nhiên + 1 ký tự kiểm tra
+GROUP_LENGTH = 5  # Chia thân mã thành nhóm 5 ký tự
+MAX_PREFIX_LENGTH = 10
+# ==================================
+
+# Ký tự dễ nhầm khi gõ => ký tự đúng trong bảng chữ
+_ALIASES = str.maketrans({'O': '0', 'I': '1', 'L': '1'})
+_PREFIX_PATTERN = re.compile(rf"[A-Z0-9]{{1,{MAX_PREFIX_LENGTH}}}")
+
+
+def _luhn_sum(values, double_first: bool) -> int:
+    """Tổng Luhn mod 32, duyệt từ phải sang trái"""
+    n = len(ALPHABET)
+    total = 0
+    double = double_first
+    for value in reversed(values):
+        addend = value * 2 if double else value
+        total += addend // n + addend % n
+        double = not double
+    return total
+
+
+def check_char(payload: str) -> str:
+    """Ký tự kiểm tra cho phần ngẫu nhiên"""
+    total = _luhn_sum([ALPHABET.index(ch) for ch in payload], double_first=True)
+    return ALPHABET[-total % len(ALPHABET)]
+
+
+def is_valid_body(body: str) -> bool:
+    """Thân mã (10 ký tự, không gạch) có ký tự kiểm tra đúng không"""
+    if len(body) != BODY_LENGTH or any(ch not in ALPHABET for ch in body):
+        return False
+    return _luhn_sum([ALPHABET.index(ch) for ch in body], double_first=False) % len(ALPHABET) == 0
+
+
+def format_code(body: str, prefix: str = None) -> str:
+    """Dạng chuẩn: [TIỀN TỐ-]XXXXX-XXXXX"""
+    groups = [body[i:i + GROUP_LENGTH] for i in range(0, len(body), GROUP_LENGTH)]
+    return '-'.join(([prefix] if prefix else []) + groups)
+
+
+def validate_prefix(prefix: str) -> str:
+    """Chuẩn hóa tiền tố, ValueError nếu sai định dạng"""
+    prefix = prefix.strip().upper()
+    if not _PREFIX_PATTERN.fullmatch(prefix):
+        raise ValueError(f"Tiền tố chỉ gồm A-Z, 0-9, tối đa {MAX_PREFIX_LENGTH} ký tự")
+    return prefix
+
+
+def generate_code(prefix: str = None) -> str:
+    """Sinh 1 mã mới (RNG mật mã)"""
+    payload = ''.join(secrets.choice(ALPHABET) for _ in range(BODY_LENGTH - 1))
+    return format_code(payload + check_char(payload), validate_prefix(prefix) if prefix else None)
+
+
+def normalize_code(text: str):
+    """
+    Chuẩn hóa mã người dùng nhập
+
+    - Có dạng [TIỀN TỐ-]XXXXX-XXXXX: sửa ký tự dễ nhầm, kiểm tra ký tự kiểm
+      tra, sai => None (từ chối ngay, không cần đọc Firestore)
+    - Không gạch nhưng 10 ký tự cuối là thân mã hợp lệ => dạng chuẩn có gạch
+    - Còn lại: mã kiểu cũ, chỉ viết hoa
+
+    Returns:
+        str | None: Mã dạng chuẩn, None nếu sai định dạng
+    """
+    code = ''.join(text.split()).upper()
+    if not code:
+        return None
+
+    parts = code.split('-')
+    if len(parts) in (2, 3) and all(len(part) == GROUP_LENGTH for part in parts[-2:]):
+        prefix = parts[0] if len(parts) == 3 else None
+        body = (parts[-2] + parts[-1]).translate(_ALIASES)
+        if prefix is not None and not _PREFIX_PATTERN.fullmatch(prefix):
+            return None
+        return format_code(body, prefix) if is_valid_body(body) else None
+
+    if '-' not in code and len(code) >= BODY_LENGTH:
+        prefix, body = code[:-BODY_LENGTH], code[-BODY_LENGTH:].translate(_ALIASES)
+        if (not prefix or _PREFIX_PATTERN.fullmatch(prefix)) and is_valid_body(body):
+            return format_code(body, prefix)
+    return code
+
+
+def code_candidates(text: str):
+    """
+    Các document ID cần thử cho 1 mã: dạng chuẩn trước, rồi nguyên văn
+
+    Mã kiểu cũ không gạch có thể tình cờ qua ký tự kiểm tra và bị
+    normalize_code đổi sang dạng có gạch => vẫn thử ID nguyên văn (giống
+    RewardCodeFormat.normalize bên app). Mã sai ký tự kiểm tra chỉ còn ID
+    nguyên văn.
+
+    Returns:
+        list: 1 hoặc 2 ID khác nhau (rỗng nếu text trống)
+    """
+    literal = ''.join(text.split()).upper()
+    return list(dict.fromkeys(code for code in (normalize_code(text), literal) if code))
@@ -2,21 +2,51 @@
 #!/usr/bin/env python3
 """
 Script gửi thư hòm thư trên Firebase Firestore
-Sử dụng: python send_mail.py
+Sử dụng: python send_mail.py  (menu tương tác)
+         python tvu_admin.py --help  (dòng lệnh, dùng cho cron / shell)
 
 Yêu cầu:
 - pip install firebase-admin
 - File service account JSON từ Firebase Console
 """
 
-import firebase_admin
-from firebase_admin import credentials, firestore
 from datetime import datetime, timedelta
+import itertools
+import os
 import random
 import string
 
+from campaign_journal import CampaignJournal
+from campaign_scheduler import OPS_PER_RECIPIENT, CampaignPacer, parse_time
+from dead_letter import DEAD_LETTER_PATH, DeadLetters, read_dead_letters
+from expiry_sweeper import sweep_expired
+from fanout import fan_out
+from idempotency import content_hash, content_id, create_only
+from instrumentation import instrument, run_metrics
+from lazy_import import lazy_module
+from local_cache import LocalCache
+from mail_compaction import add_to_index, compact_user_mail, index_update
+from mail_template import MailTemplate, TemplateError, render_rows, required_columns
+from paging import iter_pages
+from recipient_resolver import MAX_WORKERS, PARTITION_COUNT, ResolveStats, resolve_students
+from recipients import (
+    ProgressLine, RecipientStats, chunked, clean_recipients, is_valid_mssv, iter_recipient_rows, iter_recipients,
+)
+from retry import with_retry
+
+# firebase_admin chỉ được import khi thực sự cần (xem lazy_import.py)
+firebase_admin = lazy_module('firebase_admin')
+credentials = lazy_module('firebase_admin.credentials')
+firestore = lazy_module('firebase_admin.firestore')
+
 # ============ CẤU HÌNH ============
 SERVICE_ACCOUNT_PATH = "serviceAccountKey.json"  # Đường dẫn file service account
+BATCH_SIZE = 500  # Số thao tác tối đa trong 1 batch Firestore (giới hạn 500)
+RECIPIENTS_PER_BATCH = BATCH_SIZE // OPS_PER_RECIPIENT  # Mỗi người nhận 2 thao tác: thư + index (mail_compaction)
+MAX_IN_FLIGHT = 8  # Số batch được commit song song
+MAX_ERROR_RATE = 0.5  # Ngừng gửi khi tỉ lệ batch lỗi gần đây vượt ngưỡng này
+AUDIENCE_CHUNK = 1000  # Số MSSV tối đa trong 1 document thư theo nhóm (~20 KB app phải tải)
+AUDIENCE_DOCS_PER_BATCH = 200  # Số document thư theo nhóm mỗi batch (request commit tối đa 10 MiB)
 # ==================================
 
 def init_firebase():
@@ -24,7 +54,8 @@ def init_firebase():
     if not firebase_admin._apps:
         cred = credentials.Certificate(SERVICE_ACCOUNT_PATH)
         firebase_admin.initialize_app(cred)
-    return firestore.client()
+    # Mọi lời gọi Firestore đi qua lớp đo đạc (xem instrumentation.py)
+    return instrument(firestore.client())
 
 def generate_mail_id():
     """Tạo mail ID ngẫu nhiên"""
@@ -32,6 +63,87 @@ def generate_mail_id():
     suffix = ''.join(random.choice(chars) for _ in range(6))
     return f"mail_{int(datetime.now().timestamp())}_{suffix}"
 
+def mail_expires_at(expires_days) -> str:
+    """Hạn thư tuyệt đối (chuỗi ISO) tính từ bây giờ"""
+    return (datetime.now() + timedelta(days=expires_days)).isoformat(timespec='seconds')
+
+def _build_mail_data(title, content, mail_type, coins, diamonds, xp, expires_days,
+                     body_ref: str = None, expires_at: str = None):
+    """
+    Tạo data cho 1 thư (dùng chung cho global, user và gửi hàng loạt)
+    
+    body_ref: Hash của mail_bodies/{hash} (store_mail_body) => thư chỉ lưu
+    tham chiếu thay vì title / content
+    expires_at: Hạn tuyệt đối (ISO, mail_expires_at) đã lưu ở journal /
+    dead-letter => gửi lại vẫn đúng hạn cũ, không tính lại từ expires_days
+    """
+    if expires_at:
+        expires_at = datetime.fromisoformat(expires_at)
+    else:
+        expires_at = datetime.now() + timedelta(days=expires_days)
+    
+    data = {
+        'type': mail_type,
+        'sent_at': firestore.SERVER_TIMESTAMP,
+        'expires_at': expires_at,
+        'is_active': True,
+    }
+    if body_ref:
+        data['body_ref'] = body_ref
+    else:
+        data['title'] = title
+        data['content'] = content
+    
+    # Thêm reward nếu có
+    if coins > 0 or diamonds > 0 or xp > 0:
+        data['reward'] = {
+            'coins': coins,
+            'diamonds': diamonds,
+            'xp': xp,
+        }
+    
+    return data
+
+def _recipient_mssv(item):
+    """Phần tử người nhận: MSSV hoặc (MSSV, field riêng)"""
+    return item[0] if isinstance(item, tuple) else item
+
+def _personalize(data: dict, fields: dict):
+    """Data chung + title / content / reward riêng (reward None = không có quà)"""
+    personal = {**data, **fields}
+    if personal.get('reward') is None:
+        personal.pop('reward', None)
+    return personal
+
+def _user_mail_ref(db, mssv: str, mail_id: str):
+    """Document thư riêng: mailbox/users/{mssv}/{mail_id}"""
+    return db.collection('mailbox').document('users').collection(mssv).document(mail_id)
+
+def store_mail_body(db, title: str, content: str) -> str:
+    """
+    Lưu title + content 1 lần ở mail_bodies/{sha256} (định danh theo nội dung)
+    
+    Thư riêng gửi cho nhiều người chỉ cần ghi body_ref thay vì lặp lại nội
+    dung dài ở mỗi document; app tải nội dung 1 lần và cache theo hash.
+    Nội dung giống nhau => cùng document, ghi lại không tạo bản mới.
+    
+    Returns:
+        str: Hash (document ID trong mail_bodies)
+    """
+    body = {'title': title, 'content': content}
+    body_hash = content_hash(body)
+    ref = db.collection('mail_bodies').document(body_hash)
+    # Document đã có = cùng nội dung => create lại khi timeout cũng an toàn
+    with_retry(lambda: create_only(ref, {**body, 'created_at': firestore.SERVER_TIMESTAMP}))
+    return body_hash
+
+def _shared_mail_data(db, params: dict):
+    """Data chung khi gửi hàng loạt; params['shared_body'] => nội dung lưu ở mail_bodies"""
+    args = {key: value for key, value in params.items() if key != 'shared_body'}
+    if params.get('shared_body'):
+        args['body_ref'] = store_mail_body(db, params['title'], params['content'])
+    return _build_mail_data(**args)
+
 # ============ MAIL TYPES ============
 MAIL_TYPES = {
     '1': ('system', 'Hệ thống'),
@@ -51,10 +163,14 @@ def send_global_mail(
     diamonds: int = 0,
     xp: int = 0,
     expires_days: int = 30,
+    idempotent: bool = False,
 ):
     """
     Gửi thư cho TẤT CẢ user
     
+    Ghi bằng create (1 RPC, server từ chối nếu Mail ID đã có), không ghi đè
+    thư đã gửi.
+    
     Args:
         db: Firestore client
         mail_id: ID thư (tự động tạo nếu None)
@@ -65,42 +181,35 @@ def send_global_mail(
         diamonds: Số diamonds thưởng
         xp: Số XP thưởng
         expires_days: Số ngày hết hạn
+        idempotent: Mail ID suy ra từ nội dung (nếu không truyền mail_id), thư
+            cùng nội dung đã gửi => coi như thành công (an toàn khi chạy lại
+            sau timeout; muốn gửi lại đúng nội dung cũ thì truyền mail_id mới)
     
     Returns:
         str: Mail ID đã tạo
     """
     if mail_id is None:
-        mail_id = generate_mail_id()
+        if idempotent:
+            mail_id = content_id('mail', {
+                'title': title, 'content': content, 'mail_type': mail_type,
+                'coins': coins, 'diamonds': diamonds, 'xp': xp, 'expires_days': expires_days,
+            })
+        else:
+            mail_id = generate_mail_id()
     
-    # Kiểm tra mail đã tồn tại chưa
+    data = _build_mail_data(title, content, mail_type, coins, diamonds, xp, expires_days)
+    data['updated_at'] = firestore.SERVER_TIMESTAMP
+    
+    # Lưu lên Firebase (create: thất bại nếu Mail ID đã tồn tại)
     doc_ref = db.collection('mailbox').document('global').collection('mails').document(mail_id)
-    if doc_ref.get().exists:
+    if not create_only(doc_ref, data):
+        if idempotent:
+            print(f"♻️ Thư '{mail_id}' đã được gửi trước đó - bỏ qua")
+            return mail_id
         print(f"❌ Mail ID '{mail_id}' đã tồn tại!")
         return None
-    
-    # Tạo data
-    now = datetime.now()
-    expires_at = now + timedelta(days=expires_days)
-    
-    data = {
-        'title': title,
-        'content': content,
-        'type': mail_type,
-        'sent_at': firestore.SERVER_TIMESTAMP,
-        'expires_at': expires_at,
-        'is_active': True,
-    }
-    
-    # Thêm reward nếu có
-    if coins > 0 or diamonds > 0 or xp > 0:
-        data['reward'] = {
-            'coins': coins,
-            'diamonds': diamonds,
-            'xp': xp,
-        }
-    
-    # Lưu lên Firebase
-    doc_ref.set(data)
+    with LocalCache() as cache:
+        cache.put('global_mails', mail_id, data)
     
     print(f"\n✅ Đã gửi thư GLOBAL thành công!")
     _print_mail_info(mail_id, title, content, mail_type, coins, diamonds, xp, expires_days, "Tất cả user")
@@ -118,6 +227,7 @@ def send_user_mail(
     diamonds: int = 0,
     xp: int = 0,
     expires_days: int = 30,
+    shared_body: bool = False,
 ):
     """
     Gửi thư cho USER cụ thể
@@ -131,6 +241,7 @@ def send_user_mail(
         mail_type: Loại thư
         coins, diamonds, xp: Phần thưởng
         expires_days: Số ngày hết hạn
+        shared_body: Lưu nội dung ở mail_bodies (store_mail_body), thư chỉ giữ body_ref
     
     Returns:
         str: Mail ID đã tạo
@@ -138,33 +249,158 @@ def send_user_mail(
     if mail_id is None:
         mail_id = generate_mail_id()
     
-    # Tạo data
-    now = datetime.now()
-    expires_at = now + timedelta(days=expires_days)
+    body_ref = store_mail_body(db, title, content) if shared_body else None
+    data = _build_mail_data(title, content, mail_type, coins, diamonds, xp, expires_days, body_ref)
     
-    data = {
-        'title': title,
-        'content': content,
-        'type': mail_type,
-        'sent_at': firestore.SERVER_TIMESTAMP,
-        'expires_at': expires_at,
-        'is_active': True,
-    }
+    # Lưu lên Firebase (cùng batch với index người nhận để dọn thư sau này)
+    batch = db.batch()
+    batch.set(_user_mail_ref(db, mssv, mail_id), data)
+    add_to_index(batch, db, mssv, index_update(data['expires_at']))
+    batch.commit()
     
-    # Thêm reward nếu có
-    if coins > 0 or diamonds > 0 or xp > 0:
-        data['reward'] = {
-            'coins': coins,
-            'diamonds': diamonds,
-            'xp': xp,
-        }
+    return mail_id
+
+def _audience_mails_ref(db):
+    """Thư theo nhóm: mailbox/audience/mails/{doc_id}"""
+    return db.collection('mailbox').document('audience').collection('mails')
+
+def send_audience_mail(
+    db,
+    mssv_list=None,
+    prefixes=None,
+    mail_id: str = None,
+    title: str = "Thông báo",
+    content: str = "",
+    mail_type: str = "system",
+    coins: int = 0,
+    diamonds: int = 0,
+    xp: int = 0,
+    expires_days: int = 30,
+):
+    """
+    Gửi thư cho 1 NHÓM user, nội dung chỉ lưu 1 lần
+    
+    Thay vì ghi 1 bản sao vào mailbox/users/{mssv} cho mỗi người, thư được
+    lưu trong mailbox/audience/mails với mảng `audience` gồm:
+    - 'mssv:<MSSV>': từng người nhận cụ thể (chia thành nhiều document,
+      mỗi document tối đa AUDIENCE_CHUNK MSSV, cùng `mail_id`)
+    - 'prefix:<tiền tố>': mọi MSSV bắt đầu bằng tiền tố (khóa, khoa...)
+    App tìm thư của mình bằng 1 query array-contains-any, mới nhất trước
+    (sắp xếp sent_at giảm dần, cần composite index audience + sent_at).
+    
+    Args:
+        mssv_list: List / iterable MSSV (vd: recipients.iter_recipients)
+        prefixes: List tiền tố MSSV
+        Các tham số còn lại giống send_global_mail
+    
+    Returns:
+        str: Mail ID đã tạo (None nếu không có người nhận)
+    """
+    if mail_id is None:
+        mail_id = generate_mail_id()
+    
+    prefix_keys = []
+    for prefix in prefixes or []:
+        prefix = prefix.strip()
+        if not prefix or not prefix.isalnum():
+            print(f"❌ Tiền tố không hợp lệ: '{prefix}'")
+            return None
+        prefix_keys.append(f"prefix:{prefix}")
+    
+    data = _build_mail_data(title, content, mail_type, coins, diamonds, xp, expires_days)
+    data['mail_id'] = mail_id
+    data['updated_at'] = firestore.SERVER_TIMESTAMP
     
-    # Lưu lên Firebase
-    doc_ref = db.collection('mailbox').document('users').collection(mssv).document(mail_id)
-    doc_ref.set(data)
+    # Mỗi document: các khóa tiền tố (chỉ ở document đầu) + 1 cụm MSSV
+    audiences = [prefix_keys] if prefix_keys else []
+    seen = set()
+    
+    def mssv_keys():
+        for mssv in mssv_list or []:
+            mssv = mssv.strip()
+            if is_valid_mssv(mssv) and mssv not in seen:
+                seen.add(mssv)
+                yield f"mssv:{mssv}"
+    
+    for index, chunk in enumerate(chunked(mssv_keys(), AUDIENCE_CHUNK)):
+        if index == 0 and audiences:
+            audiences[0] = audiences[0] + chunk
+        else:
+            audiences.append(chunk)
+    
+    if not audiences:
+        print("❌ Không có người nhận hợp lệ!")
+        return None
+    
+    # Mỗi batch tối đa AUDIENCE_DOCS_PER_BATCH document; nhóm dưới 200k MSSV
+    # chỉ cần 1 batch nguyên khối
+    collection = _audience_mails_ref(db)
+    for start in range(0, len(audiences), AUDIENCE_DOCS_PER_BATCH):
+        batch = db.batch()
+        for index in range(start, min(start + AUDIENCE_DOCS_PER_BATCH, len(audiences))):
+            doc_id = mail_id if len(audiences) == 1 else f"{mail_id}_p{index}"
+            batch.set(collection.document(doc_id), {**data, 'audience': audiences[index]})
+        batch.commit()
+    
+    target = []
+    if prefix_keys:
+        target.append("MSSV bắt đầu bằng " + ', '.join(key.split(':', 1)[1] for key in prefix_keys))
+    if seen:
+        target.append(f"{len(seen):,} MSSV")
+    print(f"\n✅ Đã gửi thư THEO NHÓM thành công! ({len(audiences)} document)")
+    _print_mail_info(mail_id, title, content, mail_type, coins, diamonds, xp, expires_days, ' + '.join(target))
     
     return mail_id
 
+def delete_audience_mail(db, mail_id: str):
+    """Xóa thư theo nhóm (mọi document cùng mail_id)"""
+    docs = list(_audience_mails_ref(db)
+                .where(filter=firestore.FieldFilter('mail_id', '==', mail_id))
+                .select([])
+                .stream())
+    if not docs:
+        print(f"❌ Mail '{mail_id}' không tồn tại!")
+        return False
+    batch = db.batch()
+    for doc in docs:
+        batch.delete(doc.reference)
+    batch.commit()
+    print(f"✅ Đã xóa mail theo nhóm '{mail_id}' ({len(docs)} document)")
+    return True
+
+def _commit_mail_chunk(db, mail_id_prefix: str, data: dict, chunk, progress: ProgressLine = None):
+    """
+    Ghi 1 batch thư riêng + index người nhận (tối đa RECIPIENTS_PER_BATCH người)
+
+    Lỗi tạm thời được thử lại: set cùng mail ID và Minimum trên index nên ghi lại an toàn.
+    """
+    update = index_update(data['expires_at'])
+    
+    def commit():
+        batch = db.batch()
+        for item in chunk:
+            if isinstance(item, tuple):
+                mssv, fields = item
+                batch.set(_user_mail_ref(db, mssv, f"{mail_id_prefix}_{mssv}"), _personalize(data, fields))
+            else:
+                mssv = item
+                batch.set(_user_mail_ref(db, mssv, f"{mail_id_prefix}_{mssv}"), data)
+            add_to_index(batch, db, mssv, update)
+        batch.commit()
+    
+    def on_retry(attempt, error, delay):
+        if progress is not None:
+            progress.note(f"   ↻ Batch {_recipient_mssv(chunk[0])}...: {type(error).__name__}, thử lại lần {attempt} sau {delay:.1f}s")
+    
+    with_retry(commit, on_retry=on_retry)
+
+def _close_dead_letters(dead_letters):
+    if dead_letters is not None:
+        dead_letters.close()
+        if dead_letters.count:
+            print(f"   ☠ {dead_letters.count:,} user gửi lỗi đã ghi vào {dead_letters.path} "
+                  f"(gửi lại: tvu_admin.py mail redrive {dead_letters.path})")
+
 def send_mail_to_multiple_users(
     db,
     mssv_list: list,
@@ -176,56 +412,572 @@ def send_mail_to_multiple_users(
     diamonds: int = 0,
     xp: int = 0,
     expires_days: int = 30,
+    max_in_flight: int = MAX_IN_FLIGHT,
+    campaign_id: str = None,
+    campaign_source: dict = None,
+    pacer=None,
+    dead_letter_path: str = DEAD_LETTER_PATH,
+    shared_body: bool = False,
+    expires_at: str = None,
 ):
     """
     Gửi thư cho NHIỀU user cụ thể
+    
+    Ghi theo batch (tối đa RECIPIENTS_PER_BATCH thư/batch, kèm index người nhận) thay vì 1 request cho mỗi user,
+    và commit song song tối đa `max_in_flight` batch cùng lúc. Mỗi batch thành
+    công hoặc thất bại cùng nhau. Nếu tỉ lệ batch lỗi vượt MAX_ERROR_RATE thì
+    ngừng gửi tiếp, các user còn lại được báo là chưa gửi.
+    Gửi cho 1 user lẻ thì dùng send_user_mail.
+    
+    Batch gặp lỗi tạm thời (DEADLINE_EXCEEDED / UNAVAILABLE / ABORTED) được
+    thử lại với backoff (retry.py). Batch vẫn lỗi được ghi vào file dead-letter
+    để gửi lại sau bằng redrive_dead_letters.
+    
+    Nếu có `campaign_id`, các MSSV commit thành công được ghi vào journal
+    (campaign_journal). Chạy lại cùng campaign_id sẽ dùng lại mail_id_prefix
+    cũ và chỉ gửi cho các MSSV còn lại. Batch đang gửi dở lúc bị ngắt có thể
+    được gửi lại, nhưng mail ID giống hệt nên chỉ ghi đè, không nhân đôi quà.
+    
+    Args:
+        mssv_list: List MSSV hoặc iterable bất kỳ (vd: generator từ
+            recipients.iter_recipients) - được đọc dần theo từng batch.
+            Phần tử có thể là (mssv, field riêng) để ghi đè title / content /
+            reward cho từng người (xem send_templated_mail)
+        campaign_id: Mã chiến dịch để ghi journal / tiếp tục khi bị gián đoạn
+        campaign_source: Nguồn người nhận lưu kèm journal (để resume_campaign)
+        pacer: campaign_scheduler.CampaignPacer - giãn tốc độ gửi theo lịch
+        dead_letter_path: File ghi người nhận gửi lỗi (None = không ghi)
+        shared_body: Title / content lưu 1 lần ở mail_bodies, mỗi thư chỉ giữ
+            body_ref + quà + hạn (giảm dung lượng ghi và app tải về khi gửi
+            thư dài cho nhiều người). Title / content riêng từng người vẫn
+            được ghi thẳng vào thư và được app ưu tiên
+        expires_at: Hạn tuyệt đối (ISO); mặc định tính từ expires_days lúc gửi.
+            Được lưu vào journal / dead-letter để resume và redrive dùng lại
+    
+    Returns:
+        int: Số user gửi thành công
     """
     if mail_id_prefix is None:
         mail_id_prefix = generate_mail_id()
     
+    total = len(mssv_list) if hasattr(mssv_list, '__len__') else None
+    
+    params = {
+        'title': title, 'content': content, 'mail_type': mail_type,
+        'coins': coins, 'diamonds': diamonds, 'xp': xp,
+        'expires_days': expires_days, 'shared_body': shared_body,
+        'expires_at': expires_at or mail_expires_at(expires_days),
+    }
+    journal = None
+    skip_stats = {}
+    if campaign_id:
+        journal = CampaignJournal()
+        mail_id_prefix = journal.start(campaign_id, mail_id_prefix, {
+            **params,
+            'source': campaign_source or {'mssv_list': list(mssv_list) if total is not None else None},
+        })
+        # Chiến dịch đã chạy (hoặc đã lên lịch) trước đó => giữ hạn của lần gửi đầu tiên
+        params['expires_at'] = journal.setdefault_param(campaign_id, 'expires_at', params['expires_at'])
+        already_sent = journal.sent_count(campaign_id)
+        if already_sent:
+            print(f"\n🗂 Tiếp tục chiến dịch '{campaign_id}' (đã gửi {already_sent:,} user)")
+            total = None
+        mssv_list = journal.iter_pending(campaign_id, mssv_list, skip_stats, key=_recipient_mssv)
+    
     print(f"\n📧 Gửi thư: \"{title}\"")
     if coins > 0 or diamonds > 0 or xp > 0:
         print(f"   💰 {coins:,} xu | 💎 {diamonds:,} kim cương | ⭐ {xp:,} XP")
-    print(f"   📤 Gửi cho {len(mssv_list)} user...")
+    chunk_size = pacer.batch_size(RECIPIENTS_PER_BATCH) if pacer is not None else RECIPIENTS_PER_BATCH
+    if total is not None:
+        print(f"   📤 Gửi cho {total:,} user...")
+    else:
+        print(f"   📤 Gửi theo luồng, {chunk_size} user/batch...")
+    if pacer is not None:
+        print(f"   🕒 Theo lịch: {pacer.current_rate():,.1f} thư/giây (ramp 500/50/5 thao tác, {OPS_PER_RECIPIENT} thao tác/thư)")
     
-    success = 0
-    failed = 0
+    # Data giống nhau cho mọi user => chỉ tạo 1 lần
+    data = _shared_mail_data(db, params)
+    if shared_body:
+        print(f"   🧾 Nội dung dùng chung: mail_bodies/{data['body_ref'][:12]}...")
+    progress = ProgressLine("📦 Đã gửi", total)
     
-    for mssv in mssv_list:
-        try:
-            mail_id = f"{mail_id_prefix}_{mssv}"
-            send_user_mail(
-                db, mssv, mail_id, title, content, mail_type,
-                coins, diamonds, xp, expires_days
-            )
-            print(f"   ✓ {mssv}")
-            success += 1
-        except Exception as e:
-            print(f"   ✗ {mssv}: {e}")
-            failed += 1
+    dead_letters = DeadLetters(dead_letter_path) if dead_letter_path else None
+    
+    def commit_chunk(chunk):
+        _commit_mail_chunk(db, mail_id_prefix, data, chunk, progress)
+    
+    def report(index, chunk, error):
+        mssvs = [_recipient_mssv(item) for item in chunk]
+        if error is None:
+            if journal is not None:
+                journal.mark_sent(campaign_id, mssvs)
+            progress.update(success=len(chunk))
+        else:
+            progress.note(f"   ✗ Batch {index}: {error}")
+            progress.note(f"     MSSV lỗi: {', '.join(mssvs)}")
+            progress.update(failed=len(chunk))
+            if dead_letters is not None:
+                dead_letters.add(chunk, mail_id_prefix, params, error, campaign_id)
+    
+    tasks = enumerate(chunked(mssv_list, chunk_size), start=1)
+    if pacer is not None:
+        tasks = pacer.pace(tasks)
+    
+    try:
+        result = fan_out(
+            tasks, commit_chunk,
+            max_in_flight=max_in_flight,
+            max_error_rate=MAX_ERROR_RATE,
+            on_done=report,
+        )
+    except KeyboardInterrupt:
+        progress.finish()
+        print(f"   ⏹ Đã dừng! Thành công: {progress.success}, Thất bại: {progress.failed}")
+        _close_dead_letters(dead_letters)
+        if journal is not None:
+            print(f"   🗂 Chạy lại chiến dịch '{campaign_id}' để gửi tiếp phần còn lại")
+            journal.close()
+        return progress.success
+    progress.finish()
+    
+    success, failed = progress.success, progress.failed
+    paused = pacer is not None and pacer.paused
+    
+    if paused:
+        print("   ⏸ Hết thời gian chạy lần này, phần còn lại gửi ở lần chạy sau")
+    if result.aborted:
+        print("   ⛔ Tỉ lệ lỗi quá cao, đã ngừng gửi!")
+        if total is not None:
+            print(f"   ⏸ Chưa gửi: {total - success - failed} user")
+        else:
+            print("   ⏸ Phần còn lại của danh sách chưa được gửi")
+    
+    if journal is not None:
+        if skip_stats.get('skipped'):
+            print(f"   ⏭ Bỏ qua {skip_stats['skipped']:,} user đã gửi trước đó")
+        if not result.aborted and not paused and failed == 0:
+            journal.finish(campaign_id)
+        else:
+            print(f"   🗂 Chạy lại chiến dịch '{campaign_id}' để gửi lại phần lỗi/còn lại")
+        journal.close()
+    _close_dead_letters(dead_letters)
     
     print(f"   → Thành công: {success}, Thất bại: {failed}")
     return success
 
-def list_global_mails(db, limit=20):
-    """Liệt kê thư global"""
-    docs = db.collection('mailbox').document('global').collection('mails').limit(limit).stream()
+def _take_dead_letters(path: str, working_path: str):
+    """
+    Chuyển file dead-letter sang file làm việc <path>.redrive
+
+    File làm việc còn sót (lần redrive trước bị ngắt) được giữ lại và gộp
+    thêm nội dung `path` vào, không bị ghi đè.
+    """
+    if not os.path.isfile(path):
+        return
+    if not os.path.isfile(working_path):
+        os.replace(path, working_path)
+        return
+    with open(path, encoding='utf-8') as src, open(working_path, 'a', encoding='utf-8') as dst:
+        for line in src:
+            dst.write(line if line.endswith('\n') else line + '\n')
+    os.remove(path)
+
+def redrive_dead_letters(db, path: str = DEAD_LETTER_PATH, max_in_flight: int = MAX_IN_FLIGHT):
+    """
+    Gửi lại người nhận trong file dead-letter, đủ tốc độ batch (không giãn lịch)
+    
+    Dùng lại mail_id_prefix cũ nên người đã nhận được (vd: batch bị timeout
+    nhưng thực ra đã ghi) chỉ bị ghi đè, không nhân đôi thư. Người nhận thuộc
+    chiến dịch được đánh dấu đã gửi trong journal. File cũ được đổi tên thành
+    <path>.redrive trong lúc gửi; người vẫn lỗi hoặc chưa kịp gửi (bị ngắt,
+    ngừng vì lỗi) được ghi lại vào `path`, sau đó file làm việc mới bị xóa.
+    Nếu bị ngắt trước khi ghi lại xong, lần redrive sau gộp file làm việc vào.
+    
+    Returns:
+        int: Số user gửi lại thành công
+    """
+    working_path = path + '.redrive'
+    _take_dead_letters(path, working_path)
+    if not os.path.isfile(working_path):
+        print(f"✅ Không có file dead-letter {path} - không có ai cần gửi lại")
+        return 0
+    groups = read_dead_letters(working_path)
+    total = sum(len(items) for *_, items in groups)
+    print(f"\n☠ Gửi lại {total:,} user từ {path} ({len(groups)} thư)")
+    
+    progress = ProgressLine("📦 Đã gửi lại", total)
+    journal = CampaignJournal()
+    aborted = False
+    handled = set()  # (số thứ tự thư, mssv) đã gửi được hoặc đã ghi lại lỗi
+    dead_letters = DeadLetters(path)
+    try:
+        for number, (campaign_id, mail_id_prefix, params, items) in enumerate(groups):
+            data = _shared_mail_data(db, params)
+            
+            def commit_chunk(chunk):
+                _commit_mail_chunk(db, mail_id_prefix, data, chunk, progress)
+            
+            def report(index, chunk, error):
+                mssvs = [_recipient_mssv(item) for item in chunk]
+                if error is None:
+                    if campaign_id:
+                        journal.mark_sent(campaign_id, mssvs)
+                    progress.update(success=len(chunk))
+                else:
+                    progress.note(f"   ✗ {mail_id_prefix} batch {index}: {error}")
+                    progress.update(failed=len(chunk))
+                    dead_letters.add(chunk, mail_id_prefix, params, error, campaign_id)
+                handled.update((number, mssv) for mssv in mssvs)
+            
+            result = fan_out(
+                enumerate(chunked(items, RECIPIENTS_PER_BATCH), start=1), commit_chunk,
+                max_in_flight=max_in_flight, max_error_rate=MAX_ERROR_RATE, on_done=report,
+            )
+            if result.aborted:
+                aborted = True
+                break
+    finally:
+        progress.finish()
+        journal.close()
+        # Mọi người nhận chưa gửi được / chưa ghi lại lỗi => ghi lại trước khi xóa file làm việc
+        for number, (campaign_id, mail_id_prefix, params, items) in enumerate(groups):
+            pending = [item for item in items if (number, _recipient_mssv(item)) not in handled]
+            if pending:
+                dead_letters.add(pending, mail_id_prefix, params, "chưa gửi lại (đã ngừng)", campaign_id)
+        dead_letters.close()
+        os.remove(working_path)
+    
+    if aborted:
+        print("   ⛔ Tỉ lệ lỗi quá cao, đã ngừng gửi lại!")
+    if dead_letters.count:
+        print(f"   ☠ {dead_letters.count:,} user vẫn lỗi, đã ghi lại vào {path}")
+    print(f"   → Thành công: {progress.success}, Thất bại: {progress.failed}")
+    return progress.success
+
+def send_mail_from_file(db, path: str, **mail_args):
+    """
+    Gửi thư cho danh sách MSSV đọc dạng luồng từ file CSV/text hoặc stdin ('-')
+    
+    MSSV được kiểm tra và loại trùng ngay khi đọc, rồi đưa thẳng vào
+    send_mail_to_multiple_users theo từng batch.
+    
+    Returns:
+        int: Số user gửi thành công
+    """
+    stats = RecipientStats()
+    if mail_args.get('campaign_id') and path != '-':
+        mail_args.setdefault('campaign_source', {'file': os.path.abspath(path)})
+    success = send_mail_to_multiple_users(db, iter_recipients(path, stats), **mail_args)
+    print(f"   📋 {stats.summary()}")
+    return success
+
+def send_mail_to_students(
+    db,
+    prefix: str = None,
+    active_since=None,
+    partitions: int = PARTITION_COUNT,
+    workers: int = MAX_WORKERS,
+    **mail_args,
+):
+    """
+    Gửi thư cho sinh viên tìm được trong students/{mssv} (đã từng dùng app)
+    
+    Người nhận được quét song song theo partition (recipient_resolver.py) và
+    đưa thẳng vào send_mail_to_multiple_users trong lúc quét.
+    
+    Args:
+        prefix: Chỉ gửi MSSV bắt đầu bằng chuỗi này (VD: 110122 = khóa K22)
+        active_since: Chỉ gửi sinh viên hoạt động (lastUpdated) từ mốc này
+        partitions, workers: Số partition tối đa / số partition quét song song
+    
+    Returns:
+        int: Số user gửi thành công
+    """
+    stats = ResolveStats()
+    active_since = parse_time(active_since)
+    if mail_args.get('campaign_id'):
+        mail_args.setdefault('campaign_source', {'students': {
+            'prefix': prefix,
+            'active_since': active_since.isoformat() if active_since else None,
+        }})
+    recipients = resolve_students(db, prefix, active_since, partitions, workers, stats)
+    success = send_mail_to_multiple_users(db, recipients, **mail_args)
+    print(f"   🔎 {stats.summary()}")
+    return success
+
+def send_templated_mail(
+    db,
+    path: str,
+    title: str = "Thông báo",
+    content: str = "",
+    mail_type: str = "system",
+    coins: int = 0,
+    diamonds: int = 0,
+    xp: int = 0,
+    expires_days: int = 30,
+    campaign_id: str = None,
+    expires_at: str = None,
+    **send_args,
+):
+    """
+    Gửi thư cá nhân hóa: title / content là mẫu ("Chào {name}!"), dữ liệu
+    từng người đọc dạng luồng từ file CSV có header (cột mssv bắt buộc)
+    
+    Mẫu được phân tích 1 lần; mỗi dòng được ghép thành (mssv, title, content,
+    reward) rồi đưa thẳng vào send_mail_to_multiple_users, nên tốc độ như gửi
+    hàng loạt thư giống nhau. Cột coins / diamonds / xp (nếu có) ghi đè quà
+    mặc định của từng người. Dòng thiếu dữ liệu bị bỏ qua và liệt kê ở cuối.
+    Với shared_body, phần mẫu không có {cột} (vd: nội dung dài giống nhau)
+    được lưu 1 lần ở mail_bodies, thư chỉ giữ phần được cá nhân hóa.
+    
+    Args:
+        path: File CSV dữ liệu ('-' = stdin)
+        expires_at: Hạn tuyệt đối đã lưu (resume_campaign), xem send_mail_to_multiple_users
+        send_args: max_in_flight, pacer... của send_mail_to_multiple_users
+    
+    Returns:
+        int: Số user gửi thành công
+    """
+    try:
+        title_template, content_template = MailTemplate(title), MailTemplate(content)
+    except TemplateError as e:
+        print(f"❌ {e}")
+        return 0
+    
+    stats = RecipientStats()
+    rows = iter_recipient_rows(path, stats, required=required_columns(title_template, content_template))
+    try:
+        first = next(rows, None)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 0
+    if first is None:
+        print("❌ Không có người nhận hợp lệ!")
+        return 0
+    
+    mail_id_prefix = None
+    if campaign_id:
+        # Lưu mẫu + quà mặc định (không phải giá trị của dòng nào) để resume_campaign
+        with CampaignJournal() as journal:
+            mail_id_prefix = journal.start(campaign_id, generate_mail_id(), {
+                'title': title, 'content': content, 'mail_type': mail_type,
+                'coins': coins, 'diamonds': diamonds, 'xp': xp,
+                'expires_days': expires_days, 'shared_body': send_args.get('shared_body', False),
+                'source': {'file': os.path.abspath(path), 'template': True} if path != '-' else None,
+            })
+    
+    errors = []
+    defaults = {'coins': coins, 'diamonds': diamonds, 'xp': xp}
+    items = render_rows(itertools.chain([first], rows), title_template, content_template, defaults, errors)
+    if send_args.get('shared_body'):
+        static = {name: template.render({}) for name, template in
+                  (('title', title_template), ('content', content_template)) if not template.fields}
+        items = ((mssv, {key: value for key, value in fields.items() if key not in static}) for mssv, fields in items)
+        title, content = static.get('title', title), static.get('content', content)
+    print(f"\n✉ Thư cá nhân hóa: mẫu dùng cột {', '.join(sorted(title_template.fields | content_template.fields)) or '(không có)'}")
+    if any(defaults.values()):
+        print(f"   🎁 Quà mặc định: 💰 {coins:,} | 💎 {diamonds:,} | ⭐ {xp:,} (cột coins/diamonds/xp ghi đè)")
+    
+    success = send_mail_to_multiple_users(
+        db, items, mail_id_prefix, title, content, mail_type,
+        expires_days=expires_days, campaign_id=campaign_id, expires_at=expires_at, **send_args,
+    )
+    print(f"   📋 {stats.summary()}")
+    if errors:
+        print(f"   ⚠ Bỏ qua {len(errors):,} dòng lỗi:")
+        for mssv, message in errors[:10]:
+            print(f"     • {mssv}: {message}")
+        if len(errors) > 10:
+            print(f"     ... và {len(errors) - 10:,} dòng khác")
+    return success
+
+def resume_campaign(db, campaign_id: str, pacer=None):
+    """Tiếp tục chiến dịch bị gián đoạn với đúng tham số và nguồn người nhận cũ"""
+    with CampaignJournal() as journal:
+        campaign = journal.get(campaign_id)
+    if campaign is None:
+        print(f"❌ Không tìm thấy chiến dịch '{campaign_id}'!")
+        return 0
+    if campaign['finished_at']:
+        print(f"✅ Chiến dịch '{campaign_id}' đã hoàn tất lúc {campaign['finished_at']}")
+        return 0
+    
+    params = dict(campaign['params'])
+    source = params.pop('source', None) or {}
+    if source.get('template'):
+        return send_templated_mail(db, source['file'], campaign_id=campaign_id, pacer=pacer, **params)
+    if source.get('students'):
+        return send_mail_to_students(db, **source['students'], campaign_id=campaign_id, pacer=pacer, **params)
+    if source.get('file'):
+        return send_mail_from_file(db, source['file'], campaign_id=campaign_id, pacer=pacer, **params)
+    if source.get('mssv_list'):
+        return send_mail_to_multiple_users(db, source['mssv_list'], campaign_id=campaign_id, pacer=pacer, **params)
+    print(f"❌ Chiến dịch '{campaign_id}' không lưu nguồn người nhận, hãy gửi lại với cùng campaign_id")
+    return 0
+
+def schedule_campaign(
+    db,
+    campaign_id: str,
+    path: str = None,
+    mssv_list: list = None,
+    not_before=None,
+    deadline=None,
+    rate: float = None,
+    max_rate: float = None,
+    run_for: float = None,
+    **mail_args,
+):
+    """
+    Tạo chiến dịch gửi theo lịch rồi chạy lượt đầu (xem campaign_scheduler.py)
+    
+    Args:
+        path / mssv_list: Nguồn người nhận (file phải đọc lại được, không dùng stdin)
+        not_before: Chưa gửi trước thời điểm này (datetime / chuỗi ISO)
+        deadline: Rải đều số thư còn lại cho tới thời điểm này
+        rate: Tốc độ mục tiêu (thư/giây) khi không có deadline
+        max_rate: Trần tốc độ (thư/giây)
+        run_for: Mỗi lần chạy chỉ gửi trong N giây (cron chạy tiếp bằng run_scheduled_campaign)
+        mail_args: title, content, mail_type, coins, diamonds, xp, expires_days
+    
+    Returns:
+        int: Số user gửi thành công ở lượt chạy này
+    """
+    with CampaignJournal() as journal:
+        if journal.get(campaign_id) is not None:
+            print(f"❌ Chiến dịch '{campaign_id}' đã tồn tại, dùng run_scheduled_campaign để chạy tiếp")
+            return 0
+        
+        if path:
+            source = {'file': os.path.abspath(path)}
+            total = sum(1 for _ in iter_recipients(path))
+        else:
+            mssv_list = list(clean_recipients(mssv_list or []))
+            source = {'mssv_list': mssv_list}
+            total = len(mssv_list)
+        if not total:
+            print("❌ Không có người nhận hợp lệ!")
+            return 0
+        
+        journal.start(campaign_id, generate_mail_id(), {**mail_args, 'source': source})
+        schedule = {
+            'not_before': parse_time(not_before).isoformat(timespec='seconds') if not_before else None,
+            'deadline': parse_time(deadline).isoformat(timespec='seconds') if deadline else None,
+            'rate': rate,
+            'max_rate': max_rate,
+            'total': total,
+        }
+        journal.save_schedule(campaign_id, schedule)
+    
+    window = f"{schedule['not_before'] or 'ngay'} → {schedule['deadline'] or 'không giới hạn'}"
+    print(f"\n🗓 Đã lên lịch chiến dịch '{campaign_id}': {total:,} user, {window}"
+          + (f", {rate:g} thư/giây" if rate else ""))
+    return run_scheduled_campaign(db, campaign_id, run_for)
+
+def run_scheduled_campaign(db, campaign_id: str, run_for: float = None):
+    """
+    Chạy tiếp chiến dịch theo lịch (gọi lặp lại bằng cron cũng an toàn)
+    
+    Returns:
+        int: Số user gửi thành công ở lượt chạy này
+    """
+    with CampaignJournal() as journal:
+        campaign = journal.get(campaign_id)
+        schedule = journal.get_schedule(campaign_id)
+        if campaign is None or schedule is None:
+            print(f"❌ Không tìm thấy chiến dịch theo lịch '{campaign_id}'!")
+            return 0
+        if campaign['finished_at']:
+            print(f"✅ Chiến dịch '{campaign_id}' đã hoàn tất lúc {campaign['finished_at']}")
+            return 0
+        
+        pacer = CampaignPacer(journal, campaign_id, schedule, run_for)
+        if pacer.not_started():
+            print(f"⏰ Chiến dịch '{campaign_id}' chưa tới giờ gửi ({schedule['not_before']})")
+            return 0
+        return resume_campaign(db, campaign_id, pacer=pacer)
+
+def list_campaigns():
+    """Liệt kê các chiến dịch trong journal"""
+    with CampaignJournal() as journal:
+        campaigns = journal.list_campaigns()
+    
+    print(f"\n{'='*60}")
+    print("🗂 DANH SÁCH CHIẾN DỊCH")
+    print(f"{'='*60}")
+    for campaign in campaigns:
+        status = "✅" if campaign['finished_at'] else "⏸"
+        print(f"\n{status} {campaign['campaign_id']}")
+        print(f"   📌 {campaign['params'].get('title', 'N/A')}")
+        print(f"   📤 Đã gửi: {campaign['sent']:,} | 🕒 {campaign['created_at']}")
+    print(f"\n{'='*60}")
+    print(f"Tổng: {len(campaigns)} chiến dịch")
+    print(f"{'='*60}\n")
+
+# Các field cần để hiển thị danh sách thư (select => chỉ tải đúng các field này)
+MAIL_LIST_FIELDS = ['title', 'type', 'reward', 'sent_at', 'expires_at']
+
+def query_global_mails(db, mail_type: str = None, expires_after=None, expires_before=None):
+    """
+    Query thư global, có sắp xếp để phân trang bằng cursor
+    
+    Mặc định mới nhất trước (sent_at giảm dần). Lọc theo expires_at thì sắp xếp
+    theo expires_at. Lọc type kèm sắp xếp cần composite index tương ứng.
+    """
+    query = db.collection('mailbox').document('global').collection('mails')
+    if mail_type:
+        query = query.where(filter=firestore.FieldFilter('type', '==', mail_type))
+    if expires_after is not None:
+        query = query.where(filter=firestore.FieldFilter('expires_at', '>=', expires_after))
+    if expires_before is not None:
+        query = query.where(filter=firestore.FieldFilter('expires_at', '<', expires_before))
+    if expires_after is not None or expires_before is not None:
+        query = query.order_by('expires_at')
+    else:
+        query = query.order_by('sent_at', direction=firestore.Query.DESCENDING)
+    return query.order_by('__name__').select(MAIL_LIST_FIELDS)
+
+def list_global_mails(
+    db,
+    limit=20,
+    mail_type: str = None,
+    expires_after=None,
+    expires_before=None,
+    interactive: bool = True,
+):
+    """
+    Liệt kê thư global theo trang
+    
+    Args:
+        limit: Số thư mỗi trang
+        mail_type: Chỉ lấy 1 loại thư (system/reward/event/welcome/update)
+        expires_after, expires_before: Lọc theo khoảng expires_at (datetime)
+        interactive: Hỏi trước khi tải trang tiếp theo
+    """
+    query = query_global_mails(db, mail_type, expires_after, expires_before)
     
     print(f"\n{'='*60}")
     print("📋 DANH SÁCH THƯ GLOBAL")
     print(f"{'='*60}")
     
     count = 0
-    for doc in docs:
-        count += 1
-        data = doc.to_dict()
-        reward = data.get('reward', {})
+    for page_number, page in enumerate(iter_pages(query, limit), start=1):
+        for doc in page:
+            count += 1
+            data = doc.to_dict()
+            reward = data.get('reward', {})
+            expires = data.get('expires_at')
+            
+            print(f"\n📧 {doc.id}")
+            print(f"   📌 {data.get('title', 'N/A')}")
+            print(f"   📝 {data.get('type', 'system')}" + (f" | ⏰ {expires.strftime('%d/%m/%Y')}" if expires else ""))
+            if reward:
+                print(f"   💰 {reward.get('coins', 0):,} | 💎 {reward.get('diamonds', 0):,} | ⭐ {reward.get('xp', 0):,}")
         
-        print(f"\n📧 {doc.id}")
-        print(f"   📌 {data.get('title', 'N/A')}")
-        print(f"   📝 {data.get('type', 'system')}")
-        if reward:
-            print(f"   💰 {reward.get('coins', 0):,} | 💎 {reward.get('diamonds', 0):,} | ⭐ {reward.get('xp', 0):,}")
+        if len(page) < limit:
+            break
+        print(f"\n--- Trang {page_number} ---")
+        if interactive and input("Enter = trang tiếp, q = dừng: ").strip().lower() == 'q':
+            break
     
     print(f"\n{'='*60}")
     print(f"Tổng: {count} thư")
@@ -240,9 +992,53 @@ def delete_global_mail(db, mail_id: str):
         return False
     
     doc_ref.delete()
+    with LocalCache() as cache:
+        cache.delete('global_mails', mail_id)
     print(f"✅ Đã xóa mail '{mail_id}'")
     return True
 
+def sweep_expired_mails(db, grace_days: int = 0, dry_run: bool = False):
+    """
+    Xóa hàng loạt thư global và thư theo nhóm đã hết hạn (client không phải tải về rồi lọc nữa)
+    
+    Args:
+        grace_days: Chỉ xóa thư đã hết hạn quá N ngày
+        dry_run: Chỉ đếm, không xóa
+    """
+    print(f"\n🧹 {'Đếm' if dry_run else 'Dọn'} thư global đã hết hạn...")
+    mails_ref = db.collection('mailbox').document('global').collection('mails')
+    stats = sweep_expired(db, mails_ref, 'delete', 'global_mails', grace_days, dry_run)
+    # Thư theo nhóm cũng hết hạn theo expires_at (không có trong cache cục bộ)
+    audience = sweep_expired(db, _audience_mails_ref(db), 'delete', 'audience_mails', grace_days, dry_run)
+    for key in stats:
+        stats[key] += audience[key]
+    if dry_run:
+        print(f"   🔎 Có {stats['matched']:,} thư hết hạn (chưa xóa)")
+    else:
+        print(f"   ✅ Đã xóa {stats['processed']:,}/{stats['matched']:,} thư hết hạn")
+    if stats['failed']:
+        print(f"   ⚠ {stats['failed']:,} thư lỗi, chạy lại để dọn tiếp")
+    return stats
+
+def search_global_mails(db, title: str = None, min_coins: int = None, max_coins: int = None):
+    """Tìm thư global trong cache cục bộ (tự sync tăng dần nếu cache đã cũ)"""
+    with LocalCache() as cache:
+        if cache.ensure_fresh(db, 'global_mails'):
+            print("🔄 Đã cập nhật cache từ server")
+        results = cache.search('global_mails', title=title, min_coins=min_coins, max_coins=max_coins)
+    
+    print(f"\n{'='*60}")
+    print("🔎 KẾT QUẢ TÌM THƯ GLOBAL (cache cục bộ)")
+    print(f"{'='*60}")
+    for mail_id, data in results:
+        reward = data.get('reward') or {}
+        print(f"📧 {mail_id} | {data.get('title', 'N/A')} | {data.get('type', 'system')} | "
+              f"💰 {reward.get('coins', 0):,} | 💎 {reward.get('diamonds', 0):,} | ⭐ {reward.get('xp', 0):,}")
+    print(f"{'='*60}")
+    print(f"Tìm thấy: {len(results)} thư")
+    print(f"{'='*60}\n")
+    return results
+
 def _print_mail_info(mail_id, title, content, mail_type, coins, diamonds, xp, expires_days, target):
     """In thông tin thư"""
     print(f"{'='*50}")
@@ -274,6 +1070,13 @@ def interactive_menu():
         print("4. Xem danh sách thư Global")
         print("5. Xóa thư Global")
         print("6. Gửi thư nhanh (có quà)")
+        print("7. Tiếp tục chiến dịch bị gián đoạn")
+        print("8. Tìm thư Global (cache cục bộ)")
+        print("9. Dọn thư đã hết hạn")
+        print("10. Gửi thư THEO NHÓM (lưu 1 lần cho cả nhóm)")
+        print("11. Xóa thư theo nhóm")
+        print("12. Gửi thư cho SINH VIÊN đã dùng app (quét Firestore theo khóa / hoạt động)")
+        print("13. Gửi lại người nhận bị lỗi (file dead-letter)")
         print("0. Thoát")
         print("="*50)
         
@@ -333,13 +1136,18 @@ def interactive_menu():
             
         elif choice == "3":
             print("\n--- GỬI THƯ CHO NHIỀU USER ---")
-            mssv_input = input("Danh sách MSSV (cách nhau bởi dấu phẩy): ").strip()
+            mssv_input = input("Danh sách MSSV (cách nhau bởi dấu phẩy, hoặc @file.csv/@file.txt): ").strip()
             if not mssv_input:
                 print("❌ Danh sách MSSV không được để trống!")
                 continue
             
-            mssv_list = [m.strip() for m in mssv_input.split(',') if m.strip()]
-            print(f"📋 Sẽ gửi cho {len(mssv_list)} user: {mssv_list}")
+            recipient_file = mssv_input[1:].strip() if mssv_input.startswith('@') else None
+            if recipient_file:
+                print(f"📋 Sẽ gửi cho danh sách trong file: {recipient_file}")
+            else:
+                mssv_list = [m.strip() for m in mssv_input.split(',') if m.strip()]
+                preview = ', '.join(mssv_list[:5]) + (', ...' if len(mssv_list) > 5 else '')
+                print(f"📋 Sẽ gửi cho {len(mssv_list)} user: {preview}")
             
             title = input("Tiêu đề: ").strip() or "Thông báo"
             content = input("Nội dung: ").strip() or ""
@@ -356,13 +1164,28 @@ def interactive_menu():
             xp = int(input("XP: ").strip() or 0)
             expires_days = int(input("Hết hạn sau (ngày, mặc định 30): ").strip() or 30)
             
-            send_mail_to_multiple_users(
-                db, mssv_list, None, title, content, mail_type,
-                coins, diamonds, xp, expires_days
+            shared_body = input("Lưu nội dung dùng chung (mail_bodies, cho thư dài)? (y/N): ").lower() == 'y'
+            campaign_id = input("Mã chiến dịch (Enter = tự động): ").strip() or generate_mail_id()
+            print(f"🗂 Mã chiến dịch: {campaign_id} (dùng mục 7 để gửi tiếp nếu bị gián đoạn)")
+            
+            mail_args = dict(
+                title=title, content=content, mail_type=mail_type,
+                coins=coins, diamonds=diamonds, xp=xp, expires_days=expires_days,
+                campaign_id=campaign_id, shared_body=shared_body,
             )
+            if recipient_file:
+                send_mail_from_file(db, recipient_file, **mail_args)
+            else:
+                send_mail_to_multiple_users(db, mssv_list, **mail_args)
             
         elif choice == "4":
-            list_global_mails(db)
+            print("\nLọc theo loại (Enter = tất cả):")
+            for k, v in MAIL_TYPES.items():
+                print(f"  {k}. {v[1]}")
+            type_choice = input("Chọn loại: ").strip()
+            mail_type = MAIL_TYPES[type_choice][0] if type_choice in MAIL_TYPES else None
+            active_only = input("Chỉ thư còn hạn? (y/N): ").lower() == 'y'
+            list_global_mails(db, mail_type=mail_type, expires_after=datetime.now() if active_only else None)
             
         elif choice == "5":
             mail_id = input("Nhập Mail ID cần xóa: ").strip()
@@ -389,13 +1212,118 @@ def interactive_menu():
                     coins, diamonds, xp, 7
                 )
             elif sub_choice == "2":
-                mssv_input = input("MSSV (nhiều user cách nhau bởi dấu phẩy): ").strip()
+                mssv_input = input("MSSV (nhiều user cách nhau bởi dấu phẩy, hoặc @file): ").strip()
+                campaign_id = generate_mail_id()
+                print(f"🗂 Mã chiến dịch: {campaign_id} (dùng mục 7 để gửi tiếp nếu bị gián đoạn)")
+                mail_args = dict(
+                    title=title, content=content, mail_type="reward",
+                    coins=coins, diamonds=diamonds, xp=xp, expires_days=7,
+                    campaign_id=campaign_id,
+                )
+                if mssv_input.startswith('@'):
+                    send_mail_from_file(db, mssv_input[1:].strip(), **mail_args)
+                else:
+                    mssv_list = [m.strip() for m in mssv_input.split(',') if m.strip()]
+                    if mssv_list:
+                        send_mail_to_multiple_users(db, mssv_list, **mail_args)
+                    
+        elif choice == "7":
+            list_campaigns()
+            campaign_id = input("Mã chiến dịch cần tiếp tục: ").strip()
+            if campaign_id:
+                resume_campaign(db, campaign_id)
+                    
+        elif choice == "8":
+            title = input("Tiêu đề chứa (Enter = bỏ qua): ").strip() or None
+            min_coins = input("Coins từ (Enter = bỏ qua): ").strip()
+            max_coins = input("Coins đến (Enter = bỏ qua): ").strip()
+            search_global_mails(
+                db, title,
+                int(min_coins) if min_coins else None,
+                int(max_coins) if max_coins else None,
+            )
+                    
+        elif choice == "9":
+            grace = input("Chỉ dọn thư hết hạn quá N ngày (0): ").strip()
+            sweep_expired_mails(db, int(grace or 0), dry_run=True)
+            if input("Xác nhận xóa? (y/N): ").lower() == 'y':
+                sweep_expired_mails(db, int(grace or 0))
+            if input("Dọn cả thư riêng của từng user? (y/N): ").lower() == 'y':
+                claimed = input("Xóa cả thư đã nhận quà? (y/N): ").lower() == 'y'
+                compact_user_mail(db, int(grace or 0), claimed, dry_run=True)
+                if input("Xác nhận xóa? (y/N): ").lower() == 'y':
+                    compact_user_mail(db, int(grace or 0), claimed)
+                    
+        elif choice == "10":
+            print("\n--- GỬI THƯ THEO NHÓM ---")
+            prefix_input = input("Tiền tố MSSV (vd: 110121, cách nhau bởi dấu phẩy, Enter = bỏ qua): ").strip()
+            prefixes = [p.strip() for p in prefix_input.split(',') if p.strip()]
+            mssv_input = input("Danh sách MSSV (dấu phẩy hoặc @file, Enter = bỏ qua): ").strip()
+            if mssv_input.startswith('@'):
+                mssv_list = iter_recipients(mssv_input[1:].strip())
+            else:
                 mssv_list = [m.strip() for m in mssv_input.split(',') if m.strip()]
-                if mssv_list:
-                    send_mail_to_multiple_users(
-                        db, mssv_list, None, title, content, "reward",
-                        coins, diamonds, xp, 7
-                    )
+            if not prefixes and not mssv_input:
+                print("❌ Cần ít nhất 1 tiền tố hoặc danh sách MSSV!")
+                continue
+            
+            title = input("Tiêu đề: ").strip() or "Thông báo"
+            content = input("Nội dung: ").strip() or ""
+            print("\nLoại thư:")
+            for k, v in MAIL_TYPES.items():
+                print(f"  {k}. {v[1]}")
+            type_choice = input("Chọn loại (1-5): ").strip() or "1"
+            mail_type = MAIL_TYPES.get(type_choice, ('system', 'Hệ thống'))[0]
+            print("\n--- Phần thưởng (Enter = 0) ---")
+            coins = int(input("Coins: ").strip() or 0)
+            diamonds = int(input("Diamonds: ").strip() or 0)
+            xp = int(input("XP: ").strip() or 0)
+            expires_days = int(input("Hết hạn sau (ngày, mặc định 30): ").strip() or 30)
+            
+            send_audience_mail(
+                db, mssv_list, prefixes, None, title, content, mail_type,
+                coins, diamonds, xp, expires_days,
+            )
+                    
+        elif choice == "11":
+            mail_id = input("Mail ID cần xóa: ").strip()
+            if mail_id and input(f"Xác nhận xóa '{mail_id}'? (y/N): ").lower() == 'y':
+                delete_audience_mail(db, mail_id)
+                    
+        elif choice == "12":
+            print("\n--- GỬI THƯ CHO SINH VIÊN ĐÃ DÙNG APP ---")
+            prefix = input("Tiền tố MSSV / khóa (vd: 110122, Enter = tất cả): ").strip() or None
+            days = input("Chỉ sinh viên hoạt động trong N ngày gần đây (Enter = bỏ qua): ").strip()
+            active_since = datetime.now() - timedelta(days=int(days)) if days else None
+            
+            title = input("Tiêu đề: ").strip() or "Thông báo"
+            content = input("Nội dung: ").strip() or ""
+            print("\nLoại thư:")
+            for k, v in MAIL_TYPES.items():
+                print(f"  {k}. {v[1]}")
+            type_choice = input("Chọn loại (1-5): ").strip() or "1"
+            mail_type = MAIL_TYPES.get(type_choice, ('system', 'Hệ thống'))[0]
+            print("\n--- Phần thưởng (Enter = 0) ---")
+            coins = int(input("Coins: ").strip() or 0)
+            diamonds = int(input("Diamonds: ").strip() or 0)
+            xp = int(input("XP: ").strip() or 0)
+            expires_days = int(input("Hết hạn sau (ngày, mặc định 30): ").strip() or 30)
+            
+            campaign_id = input("Mã chiến dịch (Enter = tự động): ").strip() or generate_mail_id()
+            print(f"🗂 Mã chiến dịch: {campaign_id} (dùng mục 7 để gửi tiếp nếu bị gián đoạn)")
+            send_mail_to_students(
+                db, prefix, active_since,
+                title=title, content=content, mail_type=mail_type,
+                coins=coins, diamonds=diamonds, xp=xp, expires_days=expires_days,
+                campaign_id=campaign_id,
+            )
+                    
+        elif choice == "13":
+            path = input(f"File dead-letter (Enter = {DEAD_LETTER_PATH}): ").strip() or DEAD_LETTER_PATH
+            if os.path.isfile(path):
+                redrive_dead_letters(db, path)
+            else:
+                print(f"✅ Không có file {path} - không có ai cần gửi lại")
                     
         elif choice == "0":
             print("👋 Tạm biệt!")
@@ -404,7 +1332,8 @@ def interactive_menu():
 if __name__ == "__main__":
     print("🚀 Khởi động script quản lý hòm thư...")
     try:
-        interactive_menu()
+        with run_metrics(labels={'script': 'send_mail'}):
+            interactive_menu()
     except FileNotFoundError:
         print(f"\n❌ Không tìm thấy file '{SERVICE_ACCOUNT_PATH}'")
         print("📝 Hướng dẫn:")
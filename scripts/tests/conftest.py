@@ -0,0 +1,57 @@
+"""
+Test cho các script quản trị
+
+Chạy: python -m pytest scripts/tests  (cần: pip install pytest firebase-admin)
+
+Test đụng tới Firestore dùng fixture `db` (fake_firestore.FakeFirestore, trong
+bộ nhớ); cache cục bộ và journal luôn ghi vào thư mục tạm của từng test.
+"""
+
+import os
+import sys
+
+import pytest
+
+# Các script nằm phẳng trong scripts/ (chạy trực tiếp, không phải package)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db():
+    from fake_firestore import FakeFirestore
+    return FakeFirestore()
+
+
+@pytest.fixture(autouse=True)
+def local_files(tmp_path, monkeypatch):
+    """Không ghi cache.db / campaigns.db thật trong scripts/"""
+    import campaign_journal
+    import local_cache
+    monkeypatch.setattr(local_cache, 'CACHE_PATH', str(tmp_path / 'cache.db'))
+    monkeypatch.setattr(campaign_journal, 'JOURNAL_PATH', str(tmp_path / 'campaigns.db'))
+    return tmp_path
+
+
+@pytest.fixture
+def fail_writes(db, monkeypatch):
+    """
+    fail_writes(predicate, error=None): mọi commit có document mà
+    predicate(path) đúng đều lỗi (mặc định PERMISSION_DENIED, không thử lại).
+    Với BatchWrite chỉ thao tác khớp bị lỗi. Trả về list luật để xóa bớt.
+    """
+    from google.api_core import exceptions
+    rules = []
+    apply_writes = db._apply_writes
+
+    def failing_apply_writes(writes, fail=True):
+        for predicate, error in rules:
+            if any(predicate(ref.path) for _, ref, _, _ in writes):
+                raise error
+        return apply_writes(writes, fail)
+
+    monkeypatch.setattr(db, '_apply_writes', failing_apply_writes)
+
+    def add(predicate, error=None):
+        rules.append((predicate, error or exceptions.PermissionDenied("Fake PERMISSION_DENIED")))
+        return rules
+    return add
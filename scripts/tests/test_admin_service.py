@@ -0,0 +1,66 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import admin_service
+import send_mail
+
+
+def _mail(days=30):
+    return send_mail._build_mail_data("Xin chào", "Nội dung", 'system', 10, 0, 0, days)
+
+
+@pytest.fixture
+def coalescer(db):
+    # Chờ lâu để mọi thư gửi trong test rơi vào cùng 1 batch gộp
+    coalescer = admin_service.SendCoalescer(db, max_wait=0.3)
+    yield coalescer
+    coalescer.close()
+
+
+def test_coalesces_into_one_batch(db, coalescer):
+    futures = [coalescer.submit(mssv, f"m{n}", _mail(days))
+               for n, (mssv, days) in enumerate([('110122001', 30), ('110122001', 5), ('110122002', 30)])]
+    assert [future.result(timeout=5) for future in futures] == ['m0', 'm1', 'm2']
+    assert coalescer.batches == 1 and coalescer.mails == 3
+    index = db.collection('mailbox').document('index').collection('recipients')
+    # 2 thư cùng user => index lấy hạn sớm nhất
+    expected = int(_mail(5)['expires_at'].timestamp())
+    assert abs(index.document('110122001').get().to_dict()['min_expires_ts'] - expected) <= 1
+
+
+def test_failed_batch_falls_back_to_single_commits(db, coalescer, fail_writes):
+    fail_writes(lambda path: path.endswith('/110122002'))
+    futures = {mssv: coalescer.submit(mssv, f"m_{mssv}", _mail()) for mssv in ('110122001', '110122002', '110122003')}
+
+    assert futures['110122001'].result(timeout=5) == 'm_110122001'
+    assert futures['110122003'].result(timeout=5) == 'm_110122003'
+    with pytest.raises(Exception, match="PERMISSION_DENIED"):
+        futures['110122002'].result(timeout=5)
+    assert coalescer.mails == 2
+    assert send_mail._user_mail_ref(db, '110122003', 'm_110122003').get().exists
+    assert not send_mail._user_mail_ref(db, '110122002', 'm_110122002').get().exists
+
+
+def test_shared_body_stored_once_across_threads(db, coalescer, monkeypatch):
+    calls = []
+    store = send_mail.store_mail_body
+
+    def counting_store(*args):
+        calls.append(threading.current_thread().name)
+        time.sleep(0.05)  # Đủ lâu để các request khác cùng lúc thấy cache chưa có
+        return store(*args)
+
+    monkeypatch.setattr(send_mail, 'store_mail_body', counting_store)
+    service = admin_service.AdminService(db, coalescer)
+    body = {'title': "Thông báo dài", 'content': "x" * 1000, 'shared_body': True}
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(
+            lambda n: service.mail_user({**body, 'mssv': f"1101220{n:02d}"}), range(32)))
+
+    assert len(calls) == 1
+    assert len({result['mail_id'] for result in results}) == 32
+    mail = send_mail._user_mail_ref(db, '110122001', results[1]['mail_id']).get().to_dict()
+    assert 'content' not in mail and mail['body_ref']
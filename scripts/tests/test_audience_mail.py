@@ -0,0 +1,62 @@
+import pytest
+
+import send_mail
+
+
+def app_audience_keys(mssv):
+    """Giống MailboxService._audienceKeys bên app"""
+    return [f"mssv:{mssv}"] + [f"prefix:{mssv[:i]}" for i in range(1, len(mssv) + 1)]
+
+
+def app_query(db, mssv, limit=50):
+    """Giống MailboxService._fetchAudienceMails bên app"""
+    snapshots = (send_mail._audience_mails_ref(db)
+                 .where('audience', 'array_contains_any', app_audience_keys(mssv))
+                 .order_by('sent_at', direction='DESCENDING')
+                 .limit(limit)
+                 .stream())
+    return [snapshot.to_dict()['mail_id'] for snapshot in snapshots]
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(send_mail, 'AUDIENCE_CHUNK', 3)
+    monkeypatch.setattr(send_mail, 'AUDIENCE_DOCS_PER_BATCH', 2)
+
+
+def test_audience_split_into_documents(db, small_chunks):
+    mssvs = ['110122001', '110122002', '110122001', 'bad!', '110122003', '110122004', '110123005']
+    mail_id = send_mail.send_audience_mail(db, mssvs, prefixes=['1101'], title="K22")
+
+    docs = {snapshot.id: snapshot.to_dict() for snapshot in send_mail._audience_mails_ref(db).stream()}
+    assert sorted(docs) == [f"{mail_id}_p0", f"{mail_id}_p1"]
+    assert docs[f"{mail_id}_p0"]['audience'] == ['prefix:1101', 'mssv:110122001', 'mssv:110122002', 'mssv:110122003']
+    assert docs[f"{mail_id}_p1"]['audience'] == ['mssv:110122004', 'mssv:110123005']
+    assert {data['mail_id'] for data in docs.values()} == {mail_id}
+
+
+def test_app_query_finds_mail_by_mssv_or_prefix(db, small_chunks):
+    by_prefix = send_mail.send_audience_mail(db, prefixes=['110122'], title="K22")
+    by_mssv = send_mail.send_audience_mail(db, ['110123001', '110123002', '110123003', '110199009'], title="Riêng")
+
+    assert app_query(db, '110122777') == [by_prefix]
+    assert app_query(db, '110199009') == [by_mssv]  # Nằm ở document thứ 2
+    assert app_query(db, '220000001') == []
+
+
+def test_app_query_returns_newest_first(db):
+    ids = [send_mail.send_audience_mail(db, prefixes=['1101'], title=f"Thư {n}") for n in range(5)]
+    assert app_query(db, '110122001', limit=3) == ids[::-1][:3]
+
+
+def test_invalid_prefix_sends_nothing(db):
+    assert send_mail.send_audience_mail(db, prefixes=['11-01'], title="x") is None
+    assert send_mail.send_audience_mail(db, ['abc'], title="x") is None
+    assert db.document_count() == 0
+
+
+def test_delete_removes_every_part(db, small_chunks):
+    mail_id = send_mail.send_audience_mail(db, [f"11012200{n}" for n in range(7)], title="x")
+    assert db.document_count('mailbox/audience/') == 3
+    assert send_mail.delete_audience_mail(db, mail_id)
+    assert db.document_count('mailbox/audience/') == 0
@@ -0,0 +1,101 @@
+from types import SimpleNamespace
+
+import pytest
+
+import create_reward_code
+from bulk_write import ALREADY_EXISTS, FAILED_PRECONDITION, NOT_FOUND, OK, split_results
+from local_cache import LocalCache
+
+
+def test_split_results_by_status():
+    response = SimpleNamespace(status=[
+        SimpleNamespace(code=OK, message=''),
+        SimpleNamespace(code=NOT_FOUND, message='no doc'),
+        SimpleNamespace(code=FAILED_PRECONDITION, message='exists=false'),
+        SimpleNamespace(code=ALREADY_EXISTS, message='create'),
+        SimpleNamespace(code=7, message='denied'),
+        SimpleNamespace(code=14, message=''),
+    ])
+    ok, missing, failed = split_results(['a', 'b', 'c', 'd', 'e', 'f'], response)
+    assert ok == ['a']
+    assert missing == ['b', 'c', 'd']
+    assert failed == [('e', 'denied'), ('f', 'code 14')]
+
+
+@pytest.fixture
+def codes(db, monkeypatch):
+    monkeypatch.setattr(create_reward_code, 'MAX_BULK_WRITES', 2)
+    ids = ['OLD001', 'OLD002', 'OLD003', 'OLD004', 'OLD005']
+    with LocalCache() as cache:
+        for code in ids:
+            data = {'title': code, 'is_active': True}
+            db.collection('reward_codes').document(code).set(data)
+            cache.put('reward_codes', code, data)
+    return ids
+
+
+def test_deactivate_reports_missing_and_failed_per_code(db, codes, fail_writes, local_files):
+    fail_writes(lambda path: path == 'reward_codes/OLD003')
+    missing_path = local_files / 'missing.txt'
+    result = create_reward_code.deactivate_codes_bulk(
+        db, codes + ['OLD001', 'gone1', 'GONE2'], missing_path=str(missing_path))
+
+    assert sorted(result['done']) == ['OLD001', 'OLD002', 'OLD004', 'OLD005']
+    assert sorted(result['missing']) == ['GONE1', 'GONE2']
+    assert result['failed'] == ['OLD003']
+    assert missing_path.read_text(encoding='utf-8').split() == sorted(result['missing'])
+    # BatchWrite không tạo document cho mã không tồn tại
+    assert not db.collection('reward_codes').document('GONE1').get().exists
+    active = {code: db.collection('reward_codes').document(code).get().to_dict()['is_active'] for code in codes}
+    assert active == {'OLD001': False, 'OLD002': False, 'OLD003': True, 'OLD004': False, 'OLD005': False}
+    with LocalCache() as cache:
+        assert cache.get('reward_codes', 'OLD001')['is_active'] is False
+        assert cache.get('reward_codes', 'OLD003')['is_active'] is True
+
+
+def test_delete_with_exists_precondition(db, codes):
+    result = create_reward_code.delete_codes_bulk(db, codes[:3] + ['GONE1'])
+    assert sorted(result['done']) == codes[:3]
+    assert result['missing'] == ['GONE1']
+    assert db.document_count('reward_codes/') == 2
+    with LocalCache() as cache:
+        assert cache.get('reward_codes', 'OLD001') is None
+        assert cache.get('reward_codes', 'OLD004') is not None
+
+
+def test_bulk_create_regenerates_codes_taken_while_writing(db, codes, local_files, monkeypatch):
+    # Mã bị tạo song song sau bước kiểm tra get_all => create trả ALREADY_EXISTS
+    monkeypatch.setattr(create_reward_code, '_find_existing_codes', lambda db, codes: set())
+    generate = create_reward_code.generate_unique_codes
+    counts = []
+
+    def generate_with_taken(count, length=None, exclude=None, prefix=None):
+        counts.append(count)
+        fresh = generate(count - 2 if len(counts) == 1 else count, length, exclude, prefix)
+        return fresh | {'OLD001', 'OLD002'} if len(counts) == 1 else fresh
+
+    monkeypatch.setattr(create_reward_code, 'generate_unique_codes', generate_with_taken)
+    created = create_reward_code.create_reward_codes_bulk(
+        db, 5, coins=10, length=8, output_path=str(local_files / 'codes.txt'))
+
+    assert counts == [5, 2]
+    assert len(set(created)) == 5 and not set(created) & set(codes)
+    assert db.document_count('reward_codes/') == 10
+    # Mã có sẵn không bị ghi đè, các mã khác trong cùng lô vẫn được tạo
+    assert db.collection('reward_codes').document('OLD001').get().to_dict() == {'title': 'OLD001', 'is_active': True}
+    assert (local_files / 'codes.txt').read_text(encoding='utf-8').split() == created
+
+
+def test_purge_deletes_shards_of_deleted_codes_only(db, codes, fail_writes, monkeypatch):
+    from claim_shards import set_claim_shards
+    for code in ('OLD001', 'OLD002'):
+        db.collection('reward_codes').document(code).update({'max_claims': 10, 'current_claims': 0})
+        assert set_claim_shards(db, code, 3)
+    fail_writes(lambda path: path == 'reward_codes/OLD002')
+    # shard_count đọc từ document mã, không quét collection group
+    monkeypatch.setattr(db, 'collection_group', None)
+
+    result = create_reward_code.delete_codes_bulk(db, ['OLD001', 'OLD002', 'OLD003'])
+    assert sorted(result['done']) == ['OLD001', 'OLD003'] and result['failed'] == ['OLD002']
+    assert db.document_count('reward_codes/OLD001/') == 0
+    assert db.document_count('reward_codes/OLD002/claim_shards/') == 3
@@ -0,0 +1,89 @@
+import pytest
+
+import campaign_journal
+import send_mail
+from campaign_journal import CampaignJournal
+
+MSSVS = [f"1101220{n:02d}" for n in range(1, 11)]
+
+
+def test_start_keeps_first_prefix():
+    with CampaignJournal() as journal:
+        assert journal.start('c1', 'mail_1', {'title': 'A'}) == 'mail_1'
+        assert journal.start('c1', 'mail_2', {'title': 'B'}) == 'mail_1'
+        assert journal.get('c1')['params'] == {'title': 'A'}
+
+
+def test_iter_pending_skips_sent_across_chunks(monkeypatch):
+    monkeypatch.setattr(campaign_journal, 'LOOKUP_CHUNK', 3)
+    stats = {}
+    with CampaignJournal() as journal:
+        journal.mark_sent('c1', MSSVS[::2])
+        journal.mark_sent('other', MSSVS)
+        items = [(mssv, {'name': mssv}) for mssv in MSSVS]
+        pending = list(journal.iter_pending('c1', iter(items), stats, key=lambda item: item[0]))
+    assert pending == items[1::2]
+    assert stats == {'skipped': 5}
+
+
+def _user_mail_ids(db):
+    return sorted(path.split('/')[-1] for path in db._docs if path.startswith('mailbox/users/'))
+
+
+@pytest.fixture
+def small_batches(monkeypatch):
+    monkeypatch.setattr(send_mail, 'RECIPIENTS_PER_BATCH', 2)
+
+
+def test_resume_sends_only_failed_recipients(db, fail_writes, small_batches, local_files):
+    rules = fail_writes(lambda path: path.endswith('/110122005'))
+    sent = send_mail.send_mail_to_multiple_users(
+        db, MSSVS, title="Tết", coins=100, campaign_id='tet',
+        dead_letter_path=str(local_files / 'dead.ndjson'))
+    assert sent == 8
+    with CampaignJournal() as journal:
+        campaign = journal.get('tet')
+        assert campaign['sent'] == 8 and campaign['finished_at'] is None
+    prefix = campaign['mail_id_prefix']
+    assert len(_user_mail_ids(db)) == 8
+
+    rules.clear()
+    writes_before = db.rpc_counts['write']
+    assert send_mail.resume_campaign(db, 'tet') == 2
+    # Chỉ batch lỗi (2 user: thư + index) được ghi lại, cùng mail ID
+    assert db.rpc_counts['write'] - writes_before == 4
+    assert _user_mail_ids(db) == sorted(f"{prefix}_{mssv}" for mssv in MSSVS)
+    with CampaignJournal() as journal:
+        assert journal.get('tet')['finished_at'] is not None
+    assert send_mail.resume_campaign(db, 'tet') == 0
+
+
+def test_resume_and_redrive_keep_first_expiry(db, fail_writes, small_batches, local_files, monkeypatch):
+    from datetime import datetime
+    dead_path = str(local_files / 'dead.ndjson')
+    rules = fail_writes(lambda path: path.endswith('/110122005'))
+    send_mail.send_mail_to_multiple_users(
+        db, MSSVS, title="Tết", expires_days=7, campaign_id='tet', dead_letter_path=dead_path)
+    with CampaignJournal() as journal:
+        campaign = journal.get('tet')
+    expires_at = datetime.fromisoformat(campaign['params']['expires_at'])
+    mail = send_mail._user_mail_ref(db, '110122005', f"{campaign['mail_id_prefix']}_110122005")
+    assert send_mail._user_mail_ref(db, '110122001', f"{campaign['mail_id_prefix']}_110122001").get().to_dict()['expires_at'] == expires_at
+
+    # Gửi lại vài ngày sau: hạn không được tính lại từ expires_days
+    rules.clear()
+    monkeypatch.setattr(send_mail, 'mail_expires_at', lambda days: '2099-01-01T00:00:00')
+    assert send_mail.resume_campaign(db, 'tet') == 2
+    assert mail.get().to_dict()['expires_at'] == expires_at
+
+    mail.delete()
+    assert send_mail.redrive_dead_letters(db, dead_path) == 2
+    assert mail.get().to_dict()['expires_at'] == expires_at
+
+
+def test_setdefault_param_pins_first_value():
+    with CampaignJournal() as journal:
+        journal.start('c1', 'mail_1', {'title': 'A'})
+        assert journal.setdefault_param('c1', 'expires_at', '2025-01-01T00:00:00') == '2025-01-01T00:00:00'
+        assert journal.setdefault_param('c1', 'expires_at', '2030-01-01T00:00:00') == '2025-01-01T00:00:00'
+        assert journal.get('c1')['params'] == {'title': 'A', 'expires_at': '2025-01-01T00:00:00'}
@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import campaign_scheduler as s
+
+
+class FakeClock:
+    """clock / sleep giả: sleep chỉ cộng thời gian"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeJournal:
+    def __init__(self, sent=0):
+        self.sent = sent
+        self.saved = []
+
+    def sent_count(self, campaign_id):
+        return self.sent
+
+    def save_schedule(self, campaign_id, schedule):
+        self.saved.append(dict(schedule))
+
+
+def test_ramp_rate_steps_every_5_minutes():
+    assert s.ramp_rate(0) == 500
+    assert s.ramp_rate(s.RAMP_STEP_SECONDS - 1) == 500
+    assert s.ramp_rate(s.RAMP_STEP_SECONDS) == 750
+    assert s.ramp_rate(2 * s.RAMP_STEP_SECONDS) == pytest.approx(1125)
+
+
+def test_parse_time():
+    assert s.parse_time(None) is None
+    assert s.parse_time('2025-01-20 08:00') == datetime(2025, 1, 20, 8, 0)
+    now = datetime.now()
+    assert s.parse_time(now) is now
+
+
+def test_token_bucket_paces_to_rate():
+    clock = FakeClock()
+    bucket = s.TokenBucket(100, clock=clock, sleep=clock.sleep)
+    for _ in range(10):
+        assert bucket.acquire(50)
+    # 500 token ở 100 token/giây, bắt đầu từ 0 token
+    assert clock.now == pytest.approx(5.0)
+
+
+def test_token_bucket_burst_capped_at_one_second():
+    clock = FakeClock()
+    bucket = s.TokenBucket(100, clock=clock, sleep=clock.sleep)
+    clock.now = 60  # Nghỉ lâu không được tích quá 1 giây token
+    assert bucket.acquire(100)
+    assert clock.sleeps == []
+    assert bucket.acquire(100)
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+
+def test_token_bucket_deadline():
+    clock = FakeClock()
+    bucket = s.TokenBucket(10, clock=clock, sleep=clock.sleep)
+    assert not bucket.acquire(50, deadline=2.0)
+    assert clock.now == 0  # Không chờ khi chắc chắn quá hạn
+    assert bucket.acquire(20, deadline=2.0)
+
+
+def _pacer(schedule, run_for=None, sent=0):
+    clock = FakeClock()
+    pacer = s.CampaignPacer(FakeJournal(sent), 'c1', schedule, run_for=run_for, clock=clock, sleep=clock.sleep)
+    return pacer, clock
+
+
+def test_pacer_ramp_counts_ops_per_recipient():
+    pacer, _ = _pacer({})
+    assert pacer.current_rate() == pytest.approx(s.RAMP_START_RATE / s.OPS_PER_RECIPIENT)
+
+
+def test_pacer_rate_and_max_rate_limits():
+    assert _pacer({'rate': 50})[0].current_rate() == 50
+    assert _pacer({'rate': 50, 'max_rate': 20})[0].current_rate() == 20
+
+
+def test_pacer_spreads_over_deadline():
+    deadline = (datetime.now() + timedelta(seconds=2000)).isoformat()
+    pacer, _ = _pacer({'deadline': deadline, 'total': 1100}, sent=100)
+    assert pacer.current_rate() == pytest.approx(0.5, rel=0.01)
+    assert pacer.batch_size(500) == 1
+
+
+def test_pacer_resets_ramp_after_long_pause():
+    stale = (datetime.now() - timedelta(seconds=s.RAMP_RESET_SECONDS + 60)).isoformat()
+    recent = datetime.now().isoformat()
+    assert _pacer({'ramp_elapsed': 900, 'last_active_at': stale})[0].ramp_elapsed() == 0
+    assert _pacer({'ramp_elapsed': 900, 'last_active_at': recent})[0].ramp_elapsed() == 900
+
+
+def test_pacer_pauses_after_run_for():
+    pacer, clock = _pacer({'rate': 10}, run_for=5)
+    tasks = [(i, ['x'] * 10) for i in range(20)]
+    released = list(pacer.pace(tasks))
+    assert pacer.paused
+    assert len(released) == 5  # 10 thư/giây trong 5 giây
+    assert clock.now <= 5
+    assert pacer.journal.saved[-1]['ramp_elapsed'] == pytest.approx(clock.now, abs=0.1)
@@ -0,0 +1,43 @@
+"""Các test khác dựa vào fake mô phỏng đúng điều kiện ghi của Firestore"""
+
+import pytest
+from google.api_core import exceptions
+
+from bulk_write import NOT_FOUND, OK
+
+
+def test_create_conflicts_and_batch_is_atomic(db):
+    ref = db.collection('c').document('a')
+    ref.create({'n': 1})
+    with pytest.raises(exceptions.AlreadyExists):
+        ref.create({'n': 2})
+
+    batch = db.batch()
+    batch.set(db.collection('c').document('b'), {'n': 1})
+    batch.create(ref, {'n': 3})
+    with pytest.raises(exceptions.AlreadyExists):
+        batch.commit()
+    assert not db.collection('c').document('b').get().exists
+    assert ref.get().to_dict() == {'n': 1}
+
+
+def test_last_update_time_precondition(db):
+    ref = db.collection('c').document('a')
+    ref.set({'n': 1})
+    snapshot = ref.get()
+    ref.update({'n': 2})
+    with pytest.raises(exceptions.FailedPrecondition):
+        ref.update({'n': 3}, option=db.write_option(last_update_time=snapshot.update_time))
+    ref.update({'n': 4}, option=db.write_option(last_update_time=ref.get().update_time))
+    assert ref.get().to_dict() == {'n': 4}
+
+
+def test_bulk_batch_reports_status_per_write(db):
+    db.collection('c').document('a').set({'n': 1})
+    batch = db.bulk_batch()
+    option = db.write_option(exists=True)
+    batch.update(db.collection('c').document('a'), {'n': 2}, option=option)
+    batch.update(db.collection('c').document('missing'), {'n': 2}, option=option)
+    response = batch.commit()
+    assert [status.code for status in response.status] == [OK, NOT_FOUND]
+    assert db.collection('c').document('a').get().to_dict() == {'n': 2}
@@ -0,0 +1,71 @@
+import threading
+import time
+
+from fanout import fan_out
+
+
+def test_on_done_runs_in_main_thread_for_every_task(db):
+    collection = db.collection('c')
+    calls = []
+
+    def worker(n):
+        if n % 3 == 0:
+            raise ValueError(n)
+        batch = db.batch()
+        batch.set(collection.document(str(n)), {'n': n})
+        batch.commit()
+
+    result = fan_out(((n, n) for n in range(1, 10)), worker, max_in_flight=4,
+                     on_done=lambda key, payload, error: calls.append((key, error, threading.current_thread())))
+
+    assert sorted(key for key, _, _ in calls) == list(range(1, 10))
+    assert all(thread is threading.main_thread() for _, _, thread in calls)
+    assert sorted(result.succeeded) == [1, 2, 4, 5, 7, 8]
+    assert sorted(key for key, _ in result.failed) == [3, 6, 9]
+    # on_done thấy lỗi đúng của từng tác vụ, document chỉ có ở tác vụ thành công
+    assert {key: str(error) for key, error, _ in calls if error} == {3: '3', 6: '6', 9: '9'}
+    assert db.document_count('c/') == 6
+
+
+def test_pulls_tasks_lazily_up_to_max_in_flight():
+    pulled = []
+    in_flight = []
+
+    def tasks():
+        for n in range(20):
+            pulled.append(n)
+            yield n, n
+
+    def on_done(key, payload, error):
+        # Tác vụ đã lấy ra nhưng chưa xong không bao giờ vượt max_in_flight
+        in_flight.append(len(pulled) - len(in_flight))
+
+    result = fan_out(tasks(), lambda n: time.sleep(0.002), max_in_flight=3, on_done=on_done)
+    assert result.success_count == 20
+    assert max(in_flight) <= 3
+
+
+def test_aborts_when_error_rate_exceeded():
+    pulled = []
+
+    def tasks():
+        for n in range(1000):
+            pulled.append(n)
+            yield n, n
+
+    def worker(n):
+        raise RuntimeError("UNAVAILABLE")
+
+    result = fan_out(tasks(), worker, max_in_flight=2, max_error_rate=0.5, error_window=10)
+    assert result.aborted
+    # Dừng lấy tác vụ mới ngay khi vượt ngưỡng: chỉ cửa sổ lỗi + tác vụ đang chạy
+    assert len(pulled) <= 10 + 2
+    assert result.failed_count == len(pulled)
+    assert result.success_count == 0
+
+
+def test_does_not_abort_below_error_rate():
+    result = fan_out(((n, n) for n in range(40)), lambda n: 1 / (n % 4), max_in_flight=4)
+    assert not result.aborted
+    assert result.failed_count == 10
+    assert result.success_count == 30
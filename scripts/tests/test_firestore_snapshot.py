@@ -0,0 +1,124 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+from google.cloud.firestore_v1 import GeoPoint
+
+import firestore_snapshot as snap
+from fake_firestore import FakeFirestore
+
+WHEN = datetime(2025, 1, 20, 8, 30, 15, 123456, tzinfo=timezone.utc)
+
+
+def _round_trip(value, db):
+    return snap.decode_value(json.loads(json.dumps(snap.encode_value(value))), db)
+
+
+def test_encode_decode_keeps_types(db):
+    ref = db.document('reward_codes/ABC')
+    value = {
+        'when': WHEN,
+        'raw': b'\x00\xffdata',
+        'where': GeoPoint(9.93, 106.34),
+        'ref': ref,
+        'list': [WHEN, {'n': 1}, None, 'x'],
+        'nested': {'deep': {'ts': WHEN}},
+    }
+    decoded = _round_trip(value, db)
+    assert decoded['when'] == WHEN
+    assert decoded['raw'] == b'\x00\xffdata'
+    assert (decoded['where'].latitude, decoded['where'].longitude) == (9.93, 106.34)
+    assert decoded['ref'].path == 'reward_codes/ABC'
+    assert decoded['list'] == [WHEN, {'n': 1}, None, 'x']
+    assert decoded['nested'] == {'deep': {'ts': WHEN}}
+
+
+@pytest.mark.parametrize('value', [
+    {'$ts': '2025-01-20T08:00:00'},
+    {'$ref': 'not/a/ref'},
+    {'$map': {'a': 1}},
+    {'$bytes': 'AAAA', 'other': 1},
+    {'price': {'$': 100, '$usd': WHEN}},
+])
+def test_dollar_keys_are_escaped(db, value):
+    assert _round_trip(value, db) == value
+
+
+def _seed(db):
+    db.collection('reward_codes').document('TET25-AAAAA-AAAAA').set({'title': 'Tết', 'expires_at': WHEN, 'shard_count': 2})
+    for i in range(2):
+        db.document(f'reward_codes/TET25-AAAAA-AAAAA/claim_shards/{i}').set({'count': i, 'limit': 10})
+    db.document('reward_codes_claimed/110122001/codes/OLD1').set({'code': 'OLD1', 'claimed_at': WHEN})
+    db.document('mailbox/global/mails/m1').set({'title': 'Hi', 'meta': {'$ts': 'literal'}})
+    db.document('mailbox/users/110122001/m2_110122001').set({'title': 'Riêng', 'expires_at': WHEN})
+    db.document('mailbox/index/recipients/110122001').set({'mssv': '110122001', 'min_expires_ts': 1})
+    db.document('mail_bodies/abc').set({'title': 'Body', 'content': 'x'})
+
+
+@pytest.mark.parametrize('name', ['backup.ndjson', 'backup.ndjson.gz'])
+def test_export_import_round_trip(db, tmp_path, monkeypatch, name):
+    monkeypatch.setattr(snap, 'EXPORT_PAGE_SIZE', 2)
+    _seed(db)
+    path = str(tmp_path / name)
+    counts = snap.export_snapshot(db, path)
+    assert counts == {'reward_codes': 3, 'reward_codes_claimed': 1, 'mailbox': 3, 'mail_bodies': 1}
+
+    target = FakeFirestore()
+    stats = snap.import_snapshot(target, path)
+    assert stats == {'written': 8, 'failed': 0, 'skipped': 0}
+    assert target._docs == db._docs
+
+
+def test_import_selected_trees(db, tmp_path):
+    _seed(db)
+    path = str(tmp_path / 'backup.ndjson')
+    snap.export_snapshot(db, path)
+    target = FakeFirestore()
+    assert snap.import_snapshot(target, path, trees=['mail_bodies']) == {'written': 1, 'failed': 0, 'skipped': 7}
+    assert list(target._docs) == ['mail_bodies/abc']
+
+
+def _lines(path):
+    with open(path, encoding='utf-8') as f:
+        return f.readlines()
+
+
+def test_truncated_files_are_detected(db, tmp_path):
+    _seed(db)
+    path = tmp_path / 'backup.ndjson'
+    snap.export_snapshot(db, str(path))
+    lines = _lines(path)
+
+    # Mất footer: đọc được hết document nhưng end = None
+    path.write_text(''.join(lines[:-1]), encoding='utf-8')
+    info = {}
+    assert len(list(snap.read_snapshot(str(path), info))) == 8
+    assert info['end'] is None and info['header']['trees']
+
+    # Cắt giữa dòng: dòng dở bị bỏ, không làm hỏng phần đã đọc
+    path.write_text(''.join(lines[:4]) + lines[4][:10], encoding='utf-8')
+    info = {}
+    assert len(list(snap.read_snapshot(str(path), info))) == 3
+    assert info['end'] is None
+    target = FakeFirestore()
+    assert snap.import_snapshot(target, str(path))['written'] == 3
+
+    # Đầy đủ: end = số document theo cây
+    info = {}
+    path.write_text(''.join(lines), encoding='utf-8')
+    list(snap.read_snapshot(str(path), info))
+    assert info['end'] == {'reward_codes': 3, 'reward_codes_claimed': 1, 'mailbox': 3, 'mail_bodies': 1}
+
+
+def test_failed_export_leaves_no_file(db, tmp_path, monkeypatch):
+    _seed(db)
+
+    def broken(db, source):
+        yield from ()
+        raise RuntimeError("UNAVAILABLE")
+
+    monkeypatch.setattr(snap, '_source_documents', broken)
+    path = tmp_path / 'backup.ndjson.gz'
+    with pytest.raises(RuntimeError):
+        snap.export_snapshot(db, str(path))
+    assert not path.exists()
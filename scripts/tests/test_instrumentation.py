@@ -0,0 +1,40 @@
+import instrumentation
+from instrumentation import Metrics, instrument, run_metrics
+
+
+def _seed(db):
+    for n in range(3):
+        db.collection('reward_codes').document(f'CODE{n}').set({'title': 'Tết', 'current_claims': n})
+
+
+def test_sizes_skipped_without_metrics_output(db, monkeypatch):
+    monkeypatch.delenv('TVU_METRICS_BYTES', raising=False)
+    _seed(db)
+    calls = []
+    monkeypatch.setattr(instrumentation, 'estimate_size', lambda value: calls.append(value) or 1)
+    metrics = Metrics()
+    client = instrument(db, metrics)
+
+    assert len(list(client.collection('reward_codes').stream())) == 3
+    client.collection('reward_codes').document('CODE0').get()
+    client.collection('reward_codes').document('CODE9').set({'title': 'Mới'})
+    summary = metrics.summary()
+    assert calls == []
+    assert summary['reads'] == 4 and summary['writes'] == 1
+    assert summary['bytes_read'] == 0 and summary['bytes_measured'] is False
+
+
+def test_sizes_measured_when_exporting(db, local_files, monkeypatch):
+    monkeypatch.delenv('TVU_METRICS_BYTES', raising=False)
+    _seed(db)
+    metrics = Metrics()
+    client = instrument(db, metrics)
+    with run_metrics(json_path=str(local_files / 'metrics.json'), trace_memory=False, metrics=metrics):
+        list(client.collection('reward_codes').stream())
+        batch = client.batch()
+        batch.set(client.collection('reward_codes').document('CODE9'), {'title': 'Mới'})
+        batch.commit()
+        summary = metrics.summary()
+    assert summary['bytes_measured'] is True
+    assert summary['bytes_read'] > 0 and summary['bytes_written'] > 0
+    assert metrics.measure_bytes is False
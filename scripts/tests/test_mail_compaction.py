@@ -0,0 +1,104 @@
+import pytest
+
+import mail_compaction
+import send_mail
+from mail_compaction import compact_user_mail, rebuild_recipient_index, recipients_index
+
+
+def _send(db, mssv, days, mail_id):
+    return send_mail.send_user_mail(db, mssv, mail_id=mail_id, title=mail_id, expires_days=days)
+
+
+def _mail_ids(db, mssv):
+    return sorted(snapshot.id for snapshot in mail_compaction._user_mails(db, mssv).stream())
+
+
+def _index(db, mssv):
+    return recipients_index(db).document(mssv).get()
+
+
+def _expires_ts(db, mssv, mail_id):
+    snapshot = send_mail._user_mail_ref(db, mssv, mail_id).get()
+    return mail_compaction._expires_ts(snapshot)
+
+
+def test_compact_deletes_expired_and_resets_index(db):
+    _send(db, '110122001', -3, 'old')
+    _send(db, '110122001', 30, 'new')
+    _send(db, '110122002', -1, 'gone')
+    _send(db, '110122003', 10, 'fresh')
+
+    stats = compact_user_mail(db)
+    assert stats == {'users': 2, 'deleted': 2, 'kept': 1, 'failed': 0}
+    assert _mail_ids(db, '110122001') == ['new']
+    assert _mail_ids(db, '110122002') == []
+    assert _index(db, '110122001').to_dict()['min_expires_ts'] == _expires_ts(db, '110122001', 'new')
+    # Hòm thư trống => xóa field, không ghi None (Minimum lần gửi sau vẫn có hiệu lực)
+    assert 'min_expires_ts' not in _index(db, '110122002').to_dict()
+    _send(db, '110122002', 7, 'again')
+    assert _index(db, '110122002').to_dict()['min_expires_ts'] == _expires_ts(db, '110122002', 'again')
+
+
+def test_nothing_expired_leaves_index_untouched(db):
+    _send(db, '110122001', 10, 'a')
+    _send(db, '110122001', 30, 'b')
+    before = _index(db, '110122001')
+    writes = db.rpc_counts['write']
+
+    # claimed=True quét mọi user trong index, kể cả user không có thư hết hạn
+    assert compact_user_mail(db, claimed=True) == {'users': 1, 'deleted': 0, 'kept': 2, 'failed': 0}
+    after = _index(db, '110122001')
+    assert after.update_time == before.update_time
+    assert after.to_dict() == before.to_dict()
+    assert db.rpc_counts['write'] == writes
+
+
+def test_concurrent_send_is_not_overwritten(db, monkeypatch):
+    _send(db, '110122001', -3, 'expired')
+    _send(db, '110122001', 30, 'kept')
+    reset_index = mail_compaction._reset_index
+
+    def send_during_compaction(db_, mssv, snapshot, remaining):
+        # Thư mới (hạn sớm hơn thư còn lại) được gửi sau khi đã đọc hòm thư
+        _send(db, mssv, 2, 'racing')
+        return reset_index(db_, mssv, snapshot, remaining)
+
+    monkeypatch.setattr(mail_compaction, '_reset_index', send_during_compaction)
+    compact_user_mail(db)
+    monkeypatch.setattr(mail_compaction, '_reset_index', reset_index)
+
+    assert _mail_ids(db, '110122001') == ['kept', 'racing']
+    # Precondition update_time chặn việc ghi đè: index giữ giá trị cũ (<= thư mới)
+    stale = _index(db, '110122001').to_dict()['min_expires_ts']
+    assert stale <= _expires_ts(db, '110122001', 'racing')
+
+    # Lần chạy sau xét lại user này và tính đúng theo thư còn lại
+    assert compact_user_mail(db)['users'] == 1
+    assert _index(db, '110122001').to_dict()['min_expires_ts'] == _expires_ts(db, '110122001', 'racing')
+
+
+def test_claimed_and_dry_run(db):
+    _send(db, '110122001', 30, 'claimed')
+    _send(db, '110122001', 30, 'unread')
+    db.document('mailbox/claimed/110122001/claimed').set({'claimed_at': 1})
+    _send(db, '110122002', -1, 'expired')
+
+    assert compact_user_mail(db, claimed=True, dry_run=True)['deleted'] == 2
+    assert _mail_ids(db, '110122001') == ['claimed', 'unread']
+    assert compact_user_mail(db, claimed=True)['deleted'] == 2
+    assert _mail_ids(db, '110122001') == ['unread']
+    assert _mail_ids(db, '110122002') == []
+
+
+def test_rebuild_index_for_mail_sent_before_index(db):
+    for mssv, days in (('110122001', 5), ('110122001', 20), ('110122002', 9)):
+        db.document(f'mailbox/users/{mssv}/m{days}').set(send_mail._build_mail_data("t", "c", 'system', 0, 0, 0, days))
+    assert rebuild_recipient_index(db) == 2
+    assert _index(db, '110122001').to_dict() == {'mssv': '110122001', 'min_expires_ts': _expires_ts(db, '110122001', 'm5')}
+    assert _index(db, '110122002').to_dict()['min_expires_ts'] == _expires_ts(db, '110122002', 'm9')
+
+
+@pytest.mark.parametrize('grace_days, deleted', [(0, 1), (5, 0)])
+def test_grace_days(db, grace_days, deleted):
+    _send(db, '110122001', -2, 'old')
+    assert compact_user_mail(db, grace_days=grace_days)['deleted'] == deleted
@@ -0,0 +1,83 @@
+import pytest
+
+from mail_template import MailTemplate, TemplateError, render_rows, required_columns, row_reward
+
+
+def test_render_fields_and_format():
+    template = MailTemplate("Chúc mừng {Name} đạt GPA {gpa}, tặng {coins:,} xu {{quà}}")
+    assert template.fields == {'name', 'gpa', 'coins'}
+    assert template.render({'name': 'An', 'gpa': '3.6', 'coins': '12000'}) == \
+        "Chúc mừng An đạt GPA 3.6, tặng 12,000 xu {quà}"
+
+
+@pytest.mark.parametrize('spec, value, expected', [
+    ('>8', 'An', '      An'),
+    ('*^6', '007', '*007**'),  # Chuỗi số vẫn căn như chuỗi, không mất số 0 đầu
+    (',>6', 'An', ',,,,An'),
+    ('.2f', '3.456', '3.46'),
+    ('+', '5', '+5'),
+    ('0=6', '-12', '-00012'),
+    ('_', '1234567', '1_234_567'),
+])
+def test_format_spec_string_or_number(spec, value, expected):
+    assert MailTemplate(f"{{x:{spec}}}").render({'x': value}) == expected
+
+
+@pytest.mark.parametrize('text', ["{", "{name!r}", "{0}", "{}", "{a.b}", "{a[0]}"])
+def test_rejects_unsupported_syntax(text):
+    with pytest.raises(TemplateError):
+        MailTemplate(text)
+
+
+def test_render_missing_or_bad_value():
+    with pytest.raises(TemplateError, match="name"):
+        MailTemplate("Chào {name}").render({'name': ''})
+    with pytest.raises(TemplateError, match="gpa"):
+        MailTemplate("GPA {gpa:.1f}").render({'gpa': 'cao'})
+
+
+def test_required_columns_excludes_reward_columns():
+    title = MailTemplate("Chào {name}")
+    content = MailTemplate("Tặng {coins} xu, {xp} XP cho lớp {class_id}")
+    assert required_columns(title, content) == {'name', 'class_id'}
+
+
+def test_row_reward_overrides_defaults():
+    defaults = {'coins': 100, 'diamonds': 5}
+    assert row_reward({'coins': '250', 'xp': ''}, defaults) == {'coins': 250, 'diamonds': 5, 'xp': 0}
+    with pytest.raises(TemplateError):
+        row_reward({'coins': '1.5'}, defaults)
+    with pytest.raises(TemplateError):
+        row_reward({'xp': '-1'}, defaults)
+
+
+def test_render_rows_skips_bad_rows():
+    rows = [
+        {'mssv': '110122001', 'name': 'An', 'coins': '300'},
+        {'mssv': '110122002', 'name': ''},
+        {'mssv': '110122003', 'name': 'Bình', 'coins': 'x'},
+        {'mssv': '110122004', 'name': 'Chi'},
+    ]
+    errors = []
+    result = list(render_rows(rows, MailTemplate("Chào {name}"), MailTemplate("Tặng {coins:,} xu"), {}, errors))
+    assert result == [
+        ('110122001', {'title': "Chào An", 'content': "Tặng 300 xu",
+                       'reward': {'coins': 300, 'diamonds': 0, 'xp': 0}}),
+        ('110122004', {'title': "Chào Chi", 'content': "Tặng 0 xu", 'reward': None}),
+    ]
+    assert [mssv for mssv, _ in errors] == ['110122002', '110122003']
+
+
+def test_templated_shared_body_keeps_only_personal_parts(db, local_files):
+    import send_mail
+    path = local_files / 'rows.csv'
+    path.write_text("mssv,name\n110122001,An\n110122002,Bình\n", encoding='utf-8')
+    assert send_mail.send_templated_mail(
+        db, str(path), title="Chào {name}", content="Nội dung dài {{giống nhau}}", shared_body=True) == 2
+
+    mails = {mssv: db.collection('mailbox').document('users').collection(mssv).get()[0].to_dict()
+             for mssv in ('110122001', '110122002')}
+    assert mails['110122002']['title'] == "Chào Bình"
+    assert all('content' not in mail for mail in mails.values())
+    body = db.collection('mail_bodies').document(mails['110122001']['body_ref']).get().to_dict()
+    assert body['content'] == "Nội dung dài {giống nhau}"
@@ -0,0 +1,63 @@
+import random
+
+import pytest
+from google.api_core import exceptions
+
+import retry
+
+
+@pytest.mark.parametrize('error, expected', [
+    (exceptions.DeadlineExceeded('timeout'), True),
+    (exceptions.ServiceUnavailable('503'), True),
+    (exceptions.Aborted('contention'), True),
+    (exceptions.PermissionDenied('403'), False),
+    (exceptions.InvalidArgument('400'), False),
+    (exceptions.ResourceExhausted('quota'), False),
+    (exceptions.AlreadyExists('409'), False),
+    (ValueError('bug'), False),
+])
+def test_is_retryable(error, expected):
+    assert retry.is_retryable(error) is expected
+
+
+def test_backoff_delay_full_jitter_bounds():
+    rng = random.Random(1)
+    for attempt in range(1, 12):
+        cap = min(retry.BACKOFF_MAX, retry.BACKOFF_BASE * 2 ** (attempt - 1))
+        delays = [retry.backoff_delay(attempt, rng) for _ in range(200)]
+        assert all(0 <= delay <= cap for delay in delays)
+        assert max(delays) > cap / 2  # Rải trên cả khoảng, không dồn về 0
+
+
+def _flaky(errors, result='ok'):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return result
+    return fn, calls
+
+
+def test_with_retry_retries_transient_errors():
+    fn, calls = _flaky([exceptions.ServiceUnavailable('503'), exceptions.Aborted('409')])
+    retries, sleeps = [], []
+    assert retry.with_retry(fn, on_retry=lambda *a: retries.append(a[0]), sleep=sleeps.append) == 'ok'
+    assert len(calls) == 3
+    assert retries == [1, 2]
+    assert len(sleeps) == 2
+
+
+def test_with_retry_raises_permanent_error_immediately():
+    fn, calls = _flaky([exceptions.PermissionDenied('403')])
+    with pytest.raises(exceptions.PermissionDenied):
+        retry.with_retry(fn, sleep=lambda _: None)
+    assert len(calls) == 1
+
+
+def test_with_retry_gives_up_after_max_attempts():
+    fn, calls = _flaky([exceptions.DeadlineExceeded('timeout')] * 10)
+    with pytest.raises(exceptions.DeadlineExceeded):
+        retry.with_retry(fn, max_attempts=3, sleep=lambda _: None)
+    assert len(calls) == 3
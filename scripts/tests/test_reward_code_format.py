@@ -0,0 +1,71 @@
+import json
+import os
+
+import pytest
+
+import reward_code_format as f
+
+# Vector dùng chung với test/reward_code_format_test.dart (app) để 2 bên
+# chắc chắn cùng thuật toán
+VECTORS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'test', 'fixtures', 'reward_code_vectors.json')
+
+with open(VECTORS_PATH, encoding='utf-8') as file:
+    VECTORS = json.load(file)
+
+
+@pytest.mark.parametrize('vector', VECTORS['check_char'], ids=lambda v: v['payload'])
+def test_check_char_vectors(vector):
+    assert f.check_char(vector['payload']) == vector['check']
+    assert f.is_valid_body(vector['payload'] + vector['check'])
+
+
+@pytest.mark.parametrize('body', VECTORS['invalid_bodies'])
+def test_invalid_body_vectors(body):
+    assert not f.is_valid_body(body)
+
+
+@pytest.mark.parametrize('vector', VECTORS['normalize'], ids=lambda v: repr(v['input']))
+def test_normalize_vectors(vector):
+    assert f.normalize_code(vector['input']) == vector['expected']
+
+
+@pytest.mark.parametrize('payload', [v['payload'] for v in VECTORS['check_char']])
+def test_detects_every_single_char_typo(payload):
+    body = payload + f.check_char(payload)
+    for i, original in enumerate(body):
+        for ch in f.ALPHABET:
+            if ch != original:
+                assert not f.is_valid_body(body[:i] + ch + body[i + 1:])
+
+
+def test_detects_most_adjacent_swaps():
+    payload = VECTORS['check_char'][4]['payload']
+    body = payload + f.check_char(payload)
+    swaps = [body[:i] + body[i + 1] + body[i] + body[i + 2:] for i in range(len(body) - 1) if body[i] != body[i + 1]]
+    caught = sum(not f.is_valid_body(swapped) for swapped in swaps)
+    assert caught >= len(swaps) - 1
+
+
+def test_generate_code_is_valid():
+    for prefix in (None, 'TET25'):
+        code = f.generate_code(prefix)
+        assert f.normalize_code(code) == code
+        assert code.startswith('TET25-') == bool(prefix)
+
+
+def test_validate_prefix():
+    assert f.validate_prefix(' tet25 ') == 'TET25'
+    with pytest.raises(ValueError):
+        f.validate_prefix('TET-25')
+    with pytest.raises(ValueError):
+        f.validate_prefix('A' * (f.MAX_PREFIX_LENGTH + 1))
+
+
+def test_code_candidates():
+    # Mã kiểu cũ tình cờ qua ký tự kiểm tra: thử dạng chuẩn rồi ID nguyên văn
+    assert f.code_candidates('abcdefghjt') == ['ABCDE-FGHJT', 'ABCDEFGHJT']
+    assert f.code_candidates('TANSINHVIEN') == ['TANSINHVIEN']
+    # Sai ký tự kiểm tra => chỉ còn ID nguyên văn
+    assert f.code_candidates('5YB1Q-RE4RA') == ['5YB1Q-RE4RA']
+    assert f.code_candidates('  ') == []
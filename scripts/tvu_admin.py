@@ -0,0 +1,723 @@
+#!/usr/bin/env python3
+"""
+CLI không tương tác cho quản lý hòm thư và mã thưởng (dùng cho cron / shell)
+
+Sử dụng:
+    python tvu_admin.py mail send-global --title "..." --content "..." --coins 100
+    python tvu_admin.py mail send-users --file ds.csv --title "..." --campaign tet2025
+    cat ds.txt | python tvu_admin.py mail send-users --file - --title "..." --dry-run
+    python tvu_admin.py mail send-students --prefix 110122 --active-since 2025-01-01 --title "..." --campaign k22
+    python tvu_admin.py mail send-users --file ds.csv --title "..." --content "$(cat thong_bao.txt)" --shared-body
+    python tvu_admin.py mail send-template --file gpa.csv --title "Chúc mừng {name}" --content "GPA {gpa}, tặng {coins:,} xu"
+    python tvu_admin.py mail schedule --file k22.csv --campaign k22 --title "..." --deadline "2025-09-05 20:00" --run-for 10
+    */10 * * * * python tvu_admin.py mail schedule-run k22 --run-for 9
+    python tvu_admin.py mail redrive dead_letters.ndjson
+    python tvu_admin.py mail compact --grace-days 7 --claimed --dry-run
+    python tvu_admin.py mail send-audience --prefix 110122 --title "Chào tân sinh viên K22"
+    python tvu_admin.py mail list --type reward
+    python tvu_admin.py codes create --count 50000 --coins 1000 --prefix TET25 --output codes.txt
+    python tvu_admin.py codes list --expires-within 7
+    python tvu_admin.py codes sweep --grace-days 30 --dry-run
+    python tvu_admin.py codes report --top 20 --json report.json
+    python tvu_admin.py codes create --code TANSINHVIEN --max-claims 5000 --shards 20
+    python tvu_admin.py codes deactivate --file leaked.txt --missing-output missing.txt
+    python tvu_admin.py data export backup.ndjson.gz --trees reward_codes mailbox
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python tvu_admin.py data import backup.ndjson.gz
+    python tvu_admin.py service run --port 8787
+    python tvu_admin.py --metrics-json run.json --profile run.prof mail send-users --file ds.csv ...
+
+Module firebase_admin và Firestore client chỉ được tạo khi lệnh thật sự cần,
+nên --help, kiểm tra tham số và --dry-run chạy ngay lập tức.
+"""
+
+import argparse
+import itertools
+import os
+import sys
+
+MAIL_TYPE_CHOICES = ['system', 'reward', 'event', 'welcome', 'update']
+
+
+# ============ TIỆN ÍCH ============
+
+def _module(args):
+    """Import script tương ứng (firebase_admin vẫn chưa được import)"""
+    if args.group == 'mail':
+        import send_mail as module
+    else:
+        import create_reward_code as module
+    if args.service_account:
+        module.SERVICE_ACCOUNT_PATH = args.service_account
+    return module
+
+
+def _connect(args):
+    """Import script tương ứng và khởi tạo Firestore client"""
+    module = _module(args)
+    return module, module.init_firebase()
+
+
+def _add_reward_args(parser, coins=0, diamonds=0, xp=0):
+    parser.add_argument('--coins', type=int, default=coins, help=f"Coins thưởng (mặc định {coins})")
+    parser.add_argument('--diamonds', type=int, default=diamonds, help=f"Diamonds thưởng (mặc định {diamonds})")
+    parser.add_argument('--xp', type=int, default=xp, help=f"XP thưởng (mặc định {xp})")
+
+
+def _add_mail_args(parser):
+    parser.add_argument('--title', default="Thông báo", help="Tiêu đề thư")
+    parser.add_argument('--content', default="", help="Nội dung thư")
+    parser.add_argument('--type', dest='mail_type', choices=MAIL_TYPE_CHOICES, default='system',
+                        help="Loại thư")
+    _add_reward_args(parser)
+    parser.add_argument('--expires-days', type=int, default=30, help="Số ngày hết hạn (mặc định 30)")
+
+
+def _add_shared_body_arg(parser):
+    parser.add_argument('--shared-body', action='store_true',
+                        help="Lưu tiêu đề + nội dung 1 lần ở mail_bodies, mỗi thư chỉ giữ tham chiếu (thư dài, nhiều người nhận)")
+
+
+def _add_retire_args(parser):
+    parser.add_argument('codes', nargs='*', metavar='CODE', help="Mã cần xử lý")
+    parser.add_argument('--file', help="File danh sách mã, mỗi dòng 1 mã ('-' = stdin)")
+    parser.add_argument('--title-prefix', help="Mọi mã có tiêu đề bắt đầu bằng chuỗi này")
+    parser.add_argument('--missing-output', metavar='PATH', help="Ghi các mã không tồn tại ra file")
+    parser.add_argument('--dry-run', action='store_true', help="Chỉ liệt kê, không ghi")
+
+
+def _mail_args(args):
+    return dict(
+        title=args.title, content=args.content, mail_type=args.mail_type,
+        coins=args.coins, diamonds=args.diamonds, xp=args.xp,
+        expires_days=args.expires_days,
+    )
+
+
+def _datetime(value):
+    from datetime import datetime
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("định dạng 'YYYY-MM-DD HH:MM'")
+
+
+def _positive_float(value):
+    number = float(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError("phải lớn hơn 0")
+    return number
+
+
+def _positive_int(value):
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError("phải lớn hơn 0")
+    return number
+
+
+def _code_prefix(value):
+    from reward_code_format import validate_prefix
+    try:
+        return validate_prefix(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+# ============ LỆNH MAIL ============
+
+def cmd_mail_send_global(args):
+    if args.dry_run:
+        print(f"🧪 Dry run: thư global \"{args.title}\" ({args.mail_type}), "
+              f"💰 {args.coins:,} | 💎 {args.diamonds:,} | ⭐ {args.xp:,}, hết hạn {args.expires_days} ngày")
+        return 0
+    module, db = _connect(args)
+    mail_id = module.send_global_mail(db, args.mail_id, **_mail_args(args), idempotent=args.idempotent)
+    return 0 if mail_id else 1
+
+
+def cmd_mail_send_user(args):
+    from recipients import is_valid_mssv
+    if not is_valid_mssv(args.mssv):
+        print(f"❌ MSSV không hợp lệ: {args.mssv}")
+        return 2
+    if args.dry_run:
+        print(f"🧪 Dry run: thư \"{args.title}\" cho {args.mssv}")
+        return 0
+    module, db = _connect(args)
+    mail_id = module.send_user_mail(db, args.mssv, args.mail_id, **_mail_args(args), shared_body=args.shared_body)
+    print(f"✅ Đã gửi thư {mail_id} cho {args.mssv}")
+    return 0
+
+
+def cmd_mail_send_users(args):
+    from recipients import RecipientStats, clean_recipients, iter_recipients
+
+    if args.file and args.file != '-' and not os.path.isfile(args.file):
+        print(f"❌ Không tìm thấy file: {args.file}")
+        return 2
+    if args.dry_run:
+        stats = RecipientStats()
+        source = iter_recipients(args.file, stats) if args.file else clean_recipients(args.mssv.split(','), stats)
+        for _ in source:
+            pass
+        print(f"🧪 Dry run: thư \"{args.title}\"")
+        print(f"   📋 {stats.summary()}")
+        return 0
+
+    module, db = _connect(args)
+    mail_args = _mail_args(args)
+    mail_args.update(campaign_id=args.campaign, max_in_flight=args.max_in_flight, shared_body=args.shared_body)
+    if args.file:
+        success = module.send_mail_from_file(db, args.file, **mail_args)
+    else:
+        stats = RecipientStats()
+        mssv_list = list(clean_recipients(args.mssv.split(','), stats))
+        success = module.send_mail_to_multiple_users(db, mssv_list, **mail_args)
+    return 0 if success else 1
+
+
+def cmd_mail_send_students(args):
+    module, db = _connect(args)
+    resolve_args = dict(partitions=args.partitions, workers=args.workers)
+    if args.dry_run:
+        import recipient_resolver
+        stats = recipient_resolver.count_students(db, args.prefix, args.active_since, **resolve_args)
+        print(f"🧪 Dry run: thư \"{args.title}\"")
+        print(f"   🔎 {stats.summary()}")
+        return 0
+
+    mail_args = _mail_args(args)
+    mail_args.update(campaign_id=args.campaign, max_in_flight=args.max_in_flight, shared_body=args.shared_body)
+    success = module.send_mail_to_students(db, args.prefix, args.active_since, **resolve_args, **mail_args)
+    return 0 if success else 1
+
+
+def cmd_mail_send_template(args):
+    if args.file != '-' and not os.path.isfile(args.file):
+        print(f"❌ Không tìm thấy file: {args.file}")
+        return 2
+    if args.dry_run:
+        import mail_template
+        from recipients import RecipientStats, iter_recipient_rows
+        try:
+            title, content = mail_template.MailTemplate(args.title), mail_template.MailTemplate(args.content)
+            stats, errors = RecipientStats(), []
+            rows = iter_recipient_rows(args.file, stats, required=mail_template.required_columns(title, content))
+            defaults = {'coins': args.coins, 'diamonds': args.diamonds, 'xp': args.xp}
+            rendered = mail_template.render_rows(rows, title, content, defaults, errors)
+            print("🧪 Dry run: thư cá nhân hóa")
+            for index, (mssv, fields) in enumerate(rendered):
+                if index < args.preview:
+                    print(f"   • {mssv}: {fields['title']} | {fields['content'][:60]} | 🎁 {fields['reward']}")
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 2
+        print(f"   📋 {stats.summary()} | Dòng lỗi {len(errors):,}")
+        for mssv, message in errors[:10]:
+            print(f"     • {mssv}: {message}")
+        return 1 if errors else 0
+
+    module, db = _connect(args)
+    success = module.send_templated_mail(
+        db, args.file, **_mail_args(args),
+        campaign_id=args.campaign, max_in_flight=args.max_in_flight, shared_body=args.shared_body,
+    )
+    return 0 if success else 1
+
+
+def cmd_mail_send_audience(args):
+    from recipients import RecipientStats, clean_recipients, iter_recipients
+
+    if args.file and args.file != '-' and not os.path.isfile(args.file):
+        print(f"❌ Không tìm thấy file: {args.file}")
+        return 2
+    stats = RecipientStats()
+    if args.file:
+        mssv_list = iter_recipients(args.file, stats)
+    else:
+        mssv_list = clean_recipients(args.mssv.split(',') if args.mssv else [], stats)
+    if args.dry_run:
+        count = sum(1 for _ in mssv_list)
+        print(f"🧪 Dry run: thư theo nhóm \"{args.title}\" cho {count:,} MSSV"
+              + (f" + tiền tố {', '.join(args.prefix)}" if args.prefix else ""))
+        print(f"   📋 {stats.summary()}")
+        return 0
+
+    module, db = _connect(args)
+    mail_id = module.send_audience_mail(db, mssv_list, args.prefix, args.mail_id, **_mail_args(args))
+    return 0 if mail_id else 1
+
+
+def cmd_mail_list(args):
+    from datetime import datetime
+    module, db = _connect(args)
+    module.list_global_mails(
+        db, args.page_size, args.mail_type,
+        expires_after=datetime.now() if args.active else None,
+        interactive=False,
+    )
+    return 0
+
+
+def cmd_mail_delete(args):
+    module, db = _connect(args)
+    delete = module.delete_audience_mail if args.audience else module.delete_global_mail
+    return 0 if delete(db, args.mail_id) else 1
+
+
+def cmd_mail_sweep(args):
+    module, db = _connect(args)
+    stats = module.sweep_expired_mails(db, args.grace_days, args.dry_run)
+    return 1 if stats['failed'] else 0
+
+
+def cmd_mail_compact(args):
+    module, db = _connect(args)
+    import mail_compaction
+    if args.rebuild_index:
+        mail_compaction.rebuild_recipient_index(db, args.max_in_flight)
+    stats = mail_compaction.compact_user_mail(db, args.grace_days, args.claimed, args.dry_run, args.max_in_flight)
+    return 1 if stats['failed'] else 0
+
+
+def cmd_mail_campaigns(args):
+    import send_mail
+    send_mail.list_campaigns()
+    return 0
+
+
+def cmd_mail_resume(args):
+    module, db = _connect(args)
+    module.resume_campaign(db, args.campaign_id)
+    return 0
+
+
+def cmd_mail_redrive(args):
+    if args.path is None:
+        from dead_letter import DEAD_LETTER_PATH
+        args.path = DEAD_LETTER_PATH
+    # <path>.redrive còn sót = lần redrive trước bị ngắt, vẫn phải gửi lại
+    if not os.path.isfile(args.path) and not os.path.isfile(args.path + '.redrive'):
+        print(f"✅ Không có file dead-letter {args.path} - không có ai cần gửi lại")
+        return 0
+    module, db = _connect(args)
+    module.redrive_dead_letters(db, args.path, args.max_in_flight)
+    return 1 if os.path.isfile(args.path) else 0
+
+
+def cmd_mail_schedule(args):
+    if args.file == '-' or (args.file and not os.path.isfile(args.file)):
+        print(f"❌ Cần file danh sách đọc lại được (không dùng stdin): {args.file}")
+        return 2
+    module, db = _connect(args)
+    module.schedule_campaign(
+        db, args.campaign, args.file, args.mssv.split(',') if args.mssv else None,
+        args.start, args.deadline, args.rate, args.max_rate,
+        args.run_for * 60 if args.run_for else None, **_mail_args(args), shared_body=args.shared_body,
+    )
+    return 0
+
+
+def cmd_mail_schedule_run(args):
+    module, db = _connect(args)
+    module.run_scheduled_campaign(db, args.campaign_id, args.run_for * 60 if args.run_for else None)
+    return 0
+
+
+# ============ LỆNH CODES ============
+
+def cmd_codes_create(args):
+    if args.count and args.shards:
+        print("❌ --shards chỉ dùng khi tạo 1 mã")
+        return 2
+    if not args.count and (args.prefix or args.length):
+        print("❌ --prefix / --length chỉ dùng khi tạo hàng loạt (--count)")
+        return 2
+    if args.idempotent and not args.code:
+        print("❌ --idempotent cần --code (mã tự sinh khác nhau mỗi lần chạy)")
+        return 2
+    if args.count:
+        if args.dry_run:
+            import create_reward_code
+            codes = sorted(create_reward_code.generate_unique_codes(min(args.count, 10), args.length, prefix=args.prefix))
+            print(f"🧪 Dry run: {args.count:,} mã \"{args.title}\", "
+                  f"💰 {args.coins:,} | 💎 {args.diamonds:,} | ⭐ {args.xp:,}, {args.max_claims or '∞'} lượt/mã")
+            print(f"   Ví dụ: {', '.join(codes)}")
+            return 0
+        module, db = _connect(args)
+        created = module.create_reward_codes_bulk(
+            db, args.count, args.title, args.description,
+            args.coins, args.diamonds, args.xp,
+            args.expires_days, args.max_claims, args.length, args.output, args.prefix,
+        )
+        return 0 if len(created) == args.count else 1
+
+    if args.dry_run:
+        print(f"🧪 Dry run: mã {args.code or '(tự động)'} \"{args.title}\"")
+        return 0
+    module, db = _connect(args)
+    code = module.create_reward_code(
+        db, args.code, args.title, args.description,
+        args.coins, args.diamonds, args.xp,
+        args.expires_days, args.max_claims, args.shards, args.idempotent,
+    )
+    return 0 if code else 1
+
+
+def cmd_codes_list(args):
+    from datetime import datetime, timedelta
+    module, db = _connect(args)
+    now = datetime.now()
+    expires = dict(expires_after=now, expires_before=now + timedelta(days=args.expires_within)) \
+        if args.expires_within else {}
+    module.list_codes(db, args.all, args.page_size, interactive=False, **expires)
+    return 0
+
+
+def cmd_codes_search(args):
+    module, db = _connect(args)
+    module.search_codes(db, args.prefix, args.title, args.min_coins, args.max_coins, args.full_sync)
+    return 0
+
+
+def _retire_codes(args, purge):
+    """deactivate / delete: 1 mã => 1 RPC; nhiều mã / file / tiền tố tiêu đề => BatchWrite"""
+    if not (args.codes or args.file or args.title_prefix):
+        print("❌ Cần ít nhất 1 mã, --file hoặc --title-prefix")
+        return 2
+    if args.file and args.file != '-' and not os.path.exists(args.file):
+        print(f"❌ Không tìm thấy file: {args.file}")
+        return 2
+    if len(args.codes) == 1 and not (args.file or args.title_prefix or args.dry_run):
+        module, db = _connect(args)
+        retire = module.delete_code if purge else module.deactivate_code
+        return 0 if retire(db, args.codes[0]) else 1
+
+    # Dry run từ danh sách / file thì không cần kết nối
+    if args.dry_run and not args.title_prefix:
+        module, db = _module(args), None
+    else:
+        module, db = _connect(args)
+    sources = [args.codes]
+    if args.file:
+        sources.append(module.read_code_file(args.file))
+    if args.title_prefix:
+        sources.append(module.iter_codes_by_title_prefix(db, args.title_prefix))
+    codes = itertools.chain.from_iterable(sources)
+    retire = module.delete_codes_bulk if purge else module.deactivate_codes_bulk
+    result = retire(db, codes, args.dry_run, args.missing_output)
+    return 1 if result['failed'] or result['missing'] else 0
+
+
+def cmd_codes_deactivate(args):
+    return _retire_codes(args, purge=False)
+
+
+def cmd_codes_delete(args):
+    return _retire_codes(args, purge=True)
+
+
+def cmd_codes_shard(args):
+    import claim_shards
+    _, db = _connect(args)
+    return 0 if claim_shards.set_claim_shards(db, args.code, args.shards) else 1
+
+
+def cmd_codes_report(args):
+    import redemption_report
+    _, db = _connect(args)
+    if args.backfill:
+        redemption_report.backfill_claim_codes(db)
+    redemption_report.redemption_report(db, args.top, args.drift_check, args.json)
+    return 0
+
+
+def cmd_codes_sweep(args):
+    module, db = _connect(args)
+    stats = module.sweep_expired_codes(db, args.purge, args.grace_days, args.dry_run)
+    return 1 if stats['failed'] else 0
+
+
+# ============ LỆNH DATA ============
+
+def _connect_data(args):
+    """Firestore client; dùng emulator nếu có FIRESTORE_EMULATOR_HOST (nạp dữ liệu test tải)"""
+    import admin_service
+    import send_mail
+    if args.service_account:
+        send_mail.SERVICE_ACCOUNT_PATH = args.service_account
+    return admin_service.connect()
+
+
+def cmd_data_export(args):
+    import firestore_snapshot
+    db = _connect_data(args)
+    firestore_snapshot.export_snapshot(db, args.path, args.trees)
+    return 0
+
+
+def cmd_data_import(args):
+    import firestore_snapshot
+    if not os.path.isfile(args.path):
+        print(f"❌ Không tìm thấy file: {args.path}")
+        return 2
+    db = None if args.dry_run else _connect_data(args)
+    try:
+        stats = firestore_snapshot.import_snapshot(db, args.path, args.trees, args.dry_run, args.max_in_flight)
+    except ValueError as e:
+        print(f"\n❌ File snapshot không hợp lệ: {e}")
+        return 2
+    return 1 if stats['failed'] else 0
+
+
+# ============ LỆNH SERVICE ============
+
+def cmd_service_run(args):
+    import admin_service
+    import send_mail
+    if args.service_account:
+        send_mail.SERVICE_ACCOUNT_PATH = args.service_account
+    return admin_service.serve(args.host, args.port, args.unix)
+
+
+# ============ PARSER ============
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='tvu_admin', description="Quản lý hòm thư và mã thưởng TVU App")
+    parser.add_argument('--service-account', help="Đường dẫn file service account JSON")
+    parser.add_argument('--metrics-json', metavar='PATH', help="Ghi tóm tắt lời gọi Firestore ra file JSON")
+    parser.add_argument('--metrics-prom', metavar='PATH', help="Ghi textfile Prometheus (node_exporter)")
+    parser.add_argument('--profile', metavar='PATH', help="Chạy kèm cProfile, lưu kết quả vào PATH")
+    parser.add_argument('--tracemalloc', action='store_true', default=None, help="Theo dõi bộ nhớ (tracemalloc)")
+    groups = parser.add_subparsers(dest='group', required=True)
+
+    # ----- mail -----
+    mail = groups.add_parser('mail', help="Hòm thư").add_subparsers(dest='command', required=True)
+
+    p = mail.add_parser('send-global', help="Gửi thư cho tất cả user")
+    _add_mail_args(p)
+    p.add_argument('--mail-id', help="Mail ID (mặc định tự tạo)")
+    p.add_argument('--idempotent', action='store_true',
+                   help="Mail ID suy ra từ nội dung: chạy lại sau timeout không gửi trùng")
+    p.add_argument('--dry-run', action='store_true', help="Chỉ kiểm tra, không gửi")
+    p.set_defaults(func=cmd_mail_send_global)
+
+    p = mail.add_parser('send-user', help="Gửi thư cho 1 user")
+    p.add_argument('--mssv', required=True)
+    _add_mail_args(p)
+    _add_shared_body_arg(p)
+    p.add_argument('--mail-id', help="Mail ID (mặc định tự tạo)")
+    p.add_argument('--dry-run', action='store_true', help="Chỉ kiểm tra, không gửi")
+    p.set_defaults(func=cmd_mail_send_user)
+
+    p = mail.add_parser('send-users', help="Gửi thư cho nhiều user")
+    source = p.add_mutually_exclusive_group(required=True)
+    source.add_argument('--file', help="File CSV/text danh sách MSSV ('-' = stdin)")
+    source.add_argument('--mssv', help="Danh sách MSSV cách nhau bởi dấu phẩy")
+    _add_mail_args(p)
+    _add_shared_body_arg(p)
+    p.add_argument('--campaign', help="Mã chiến dịch (ghi journal để gửi tiếp khi bị gián đoạn)")
+    p.add_argument('--max-in-flight', type=_positive_int, default=8, help="Số batch gửi song song")
+    p.add_argument('--dry-run', action='store_true', help="Chỉ đọc và kiểm tra danh sách, không gửi")
+    p.set_defaults(func=cmd_mail_send_users)
+
+    p = mail.add_parser('send-students', help="Gửi thư cho sinh viên đã dùng app (quét students song song)")
+    p.add_argument('--prefix', help="Chỉ MSSV bắt đầu bằng (VD: 110122 = khóa K22)")
+    p.add_argument('--active-since', type=_datetime, help="Chỉ sinh viên hoạt động từ 'YYYY-MM-DD HH:MM'")
+    _add_mail_args(p)
+    _add_shared_body_arg(p)
+    p.add_argument('--campaign', help="Mã chiến dịch (ghi journal để gửi tiếp khi bị gián đoạn)")
+    p.add_argument('--max-in-flight', type=_positive_int, default=8, help="Số batch gửi song song")
+    p.add_argument('--partitions', type=_positive_int, default=32, help="Số partition tối đa khi quét")
+    p.add_argument('--workers', type=_positive_int, default=8, help="Số partition quét song song")
+    p.add_argument('--dry-run', action='store_true', help="Chỉ quét và đếm người nhận, không gửi")
+    p.set_defaults(func=cmd_mail_send_students)
+
+    p = mail.add_parser('send-template', help="Gửi thư cá nhân hóa từ file CSV (mẫu {cột})")
+    p.add_argument('--file', required=True, help="File CSV có header, bắt buộc cột mssv ('-' = stdin)")
+    _add_mail_args(p)
+    _add_shared_body_arg(p)
+    p.add_argument('--campaign', help="Mã chiến dịch (ghi journal để gửi tiếp khi bị gián đoạn)")
+    p.add_argument('--max-in-flight', type=_positive_int, default=8, help="Số batch gửi song song")
+    p.add_argument('--preview', type=int, default=5, help="Số thư in thử khi --dry-run")
+    p.add_argument('--dry-run', action='store_true', help="Chỉ ghép thử và kiểm tra dữ liệu, không gửi")
+    p.set_defaults(func=cmd_mail_send_template)
+
+    p = mail.add_parser('schedule', help="Gửi thư cho nhiều user theo lịch, giãn tốc độ (ramp 500/50/5)")
+    p.add_argument('--campaign', required=True, help="Mã chiến dịch")
+    source = p.add_mutually_exclusive_group(required=True)
+    source.add_argument('--file', help="File CSV/text danh sách MSSV")
+    source.add_argument('--mssv', help="Danh sách MSSV cách nhau bởi dấu phẩy")
+    _add_mail_args(p)
+    _add_shared_body_arg(p)
+    p.add_argument('--start', type=_datetime, help="Chưa gửi trước thời điểm này ('YYYY-MM-DD HH:MM')")
+    pace = p.add_mutually_exclusive_group()
+    pace.add_argument('--deadline', type=_datetime, help="Rải đều cho tới thời điểm này")
+    pace.add_argument('--rate', type=_positive_float, help="Tốc độ mục tiêu (thư/giây)")
+    p.add_argument('--max-rate', type=_positive_float, help="Trần tốc độ (thư/giây)")
+    p.add_argument('--run-for', type=_positive_float, help="Chỉ gửi N phút lần này (cron chạy tiếp bằng schedule-run)")
+    p.set_defaults(func=cmd_mail_schedule)
+
+    p = mail.add_parser('schedule-run', help="Chạy tiếp chiến dịch theo lịch (dùng cho cron)")
+    p.add_argument('campaign_id')
+    p.add_argument('--run-for', type=_positive_float, help="Chỉ gửi N phút lần này")
+    p.set_defaults(func=cmd_mail_schedule_run)
+
+    p = mail.add_parser('send-audience', help="Gửi thư theo nhóm (lưu 1 lần, không sao chép cho từng user)")
+    p.add_argument('--prefix', nargs='+', help="Tiền tố MSSV (vd: khóa / khoa)")
+    p.add_argument('--file', help="File CSV/text danh sách MSSV ('-' = stdin)")
+    p.add_argument('--mssv', help="Danh sách MSSV cách nhau bởi dấu phẩy")
+    _add_mail_args(p)
+    p.add_argument('--mail-id', help="Mail ID (mặc định tự tạo)")
+    p.add_argument('--dry-run', action='store_true', help="Chỉ kiểm tra, không gửi")
+    p.set_defaults(func=cmd_mail_send_audience)
+
+    p = mail.add_parser('list', help="Liệt kê thư global")
+    p.add_argument('--type', dest='mail_type', choices=MAIL_TYPE_CHOICES)
+    p.add_argument('--active', action='store_true', help="Chỉ thư còn hạn")
+    p.add_argument('--page-size', type=_positive_int, default=50)
+    p.set_defaults(func=cmd_mail_list)
+
+    p = mail.add_parser('delete', help="Xóa thư global")
+    p.add_argument('mail_id')
+    p.add_argument('--audience', action='store_true', help="Xóa thư theo nhóm thay vì thư global")
+    p.set_defaults(func=cmd_mail_delete)
+
+    p = mail.add_parser('sweep', help="Xóa hàng loạt thư global đã hết hạn")
+    p.add_argument('--grace-days', type=int, default=0, help="Chỉ xóa thư hết hạn quá N ngày")
+    p.add_argument('--dry-run', action='store_true', help="Chỉ đếm, không xóa")
+    p.set_defaults(func=cmd_mail_sweep)
+
+    p = mail.add_parser('compact', help="Xóa thư riêng đã hết hạn / đã nhận quà của từng user (theo index người nhận)")
+    p.add_argument('--grace-days', type=int, default=0, help="Chỉ xóa thư hết hạn quá N ngày")
+    p.add_argument('--claimed', action='store_true', help="Xóa cả thư đã nhận quà (quét toàn bộ index)")
+    p.add_argument('--dry-run', action='store_true', help="Chỉ đếm, không xóa")
+    p.add_argument('--rebuild-index', action='store_true', help="Tạo lại index từ mailbox/users trước (thư gửi trước khi có index)")
+    p.add_argument('--max-in-flight', type=_positive_int, default=8, help="Số user dọn song song")
+    p.set_defaults(func=cmd_mail_compact)
+
+    p = mail.add_parser('campaigns', help="Liệt kê chiến dịch trong journal")
+    p.set_defaults(func=cmd_mail_campaigns)
+
+    p = mail.add_parser('resume', help="Tiếp tục chiến dịch bị gián đoạn")
+    p.add_argument('campaign_id')
+    p.set_defaults(func=cmd_mail_resume)
+
+    p = mail.add_parser('redrive', help="Gửi lại người nhận trong file dead-letter (gửi lỗi sau khi đã thử lại)")
+    p.add_argument('path', nargs='?', help="File dead-letter (mặc định scripts/dead_letters.ndjson)")
+    p.add_argument('--max-in-flight', type=_positive_int, default=8, help="Số batch gửi song song")
+    p.set_defaults(func=cmd_mail_redrive)
+
+    # ----- codes -----
+    codes = groups.add_parser('codes', help="Mã thưởng").add_subparsers(dest='command', required=True)
+
+    p = codes.add_parser('create', help="Tạo 1 mã hoặc hàng loạt (--count)")
+    target = p.add_mutually_exclusive_group()
+    target.add_argument('--code', help="Mã cụ thể (mặc định tự tạo)")
+    target.add_argument('--count', type=_positive_int, help="Tạo hàng loạt N mã")
+    p.add_argument('--title', default="Mã thưởng")
+    p.add_argument('--description', default="Nhập mã để nhận quà")
+    _add_reward_args(p)
+    p.add_argument('--expires-days', type=int, help="Số ngày hết hạn (mặc định không hết hạn)")
+    p.add_argument('--max-claims', type=int, help="Giới hạn lượt (mặc định: 1 khi --count, 0 = không giới hạn)")
+    p.add_argument('--shards', type=int, default=0, help="Chia bộ đếm lượt nhận thành N shard (mã hot)")
+    p.add_argument('--prefix', type=_code_prefix, help="Tiền tố đợt / chiến dịch khi tạo hàng loạt (VD: TET25)")
+    p.add_argument('--length', type=_positive_int,
+                   help="Tạo mã kiểu cũ A-Z0-9 dài N ký tự (mặc định: mã XXXXX-XXXXX có ký tự kiểm tra)")
+    p.add_argument('--output', help="File lưu danh sách mã khi tạo hàng loạt")
+    p.add_argument('--idempotent', action='store_true',
+                   help="Mã đã có với cùng nội dung => coi như thành công (an toàn khi chạy lại)")
+    p.add_argument('--dry-run', action='store_true', help="Chỉ kiểm tra, không tạo")
+    p.set_defaults(func=cmd_codes_create)
+
+    p = codes.add_parser('list', help="Liệt kê mã")
+    p.add_argument('--all', action='store_true', help="Hiện cả mã đã vô hiệu")
+    p.add_argument('--expires-within', type=_positive_int, help="Chỉ mã hết hạn trong N ngày tới")
+    p.add_argument('--page-size', type=_positive_int, default=50)
+    p.set_defaults(func=cmd_codes_list)
+
+    p = codes.add_parser('search', help="Tìm mã trong cache cục bộ")
+    p.add_argument('--prefix')
+    p.add_argument('--title')
+    p.add_argument('--min-coins', type=int)
+    p.add_argument('--max-coins', type=int)
+    p.add_argument('--full-sync', action='store_true', help="Sync lại toàn bộ trước khi tìm")
+    p.set_defaults(func=cmd_codes_search)
+
+    p = codes.add_parser('deactivate', help="Vô hiệu hóa 1 hoặc nhiều mã")
+    _add_retire_args(p)
+    p.set_defaults(func=cmd_codes_deactivate)
+
+    p = codes.add_parser('delete', help="Xóa 1 hoặc nhiều mã")
+    _add_retire_args(p)
+    p.set_defaults(func=cmd_codes_delete)
+
+    p = codes.add_parser('shard', help="Chia shard (hoặc tăng số shard) bộ đếm lượt nhận của mã hot")
+    p.add_argument('code')
+    p.add_argument('shards', type=_positive_int, help="Số shard mới (không được giảm)")
+    p.set_defaults(func=cmd_codes_shard)
+
+    p = codes.add_parser('report', help="Báo cáo lượt nhận / quà đã phát (aggregation query)")
+    p.add_argument('--top', type=_positive_int, default=10, help="Số mã nhiều lượt nhận nhất")
+    p.add_argument('--drift-check', type=int, default=50, help="Số mã top kiểm tra lệch current_claims (0 = bỏ qua)")
+    p.add_argument('--json', metavar='PATH', help="Lưu báo cáo ra file JSON")
+    p.add_argument('--backfill', action='store_true', help="Ghi field 'code' cho lượt nhận cũ trước khi báo cáo")
+    p.set_defaults(func=cmd_codes_report)
+
+    p = codes.add_parser('sweep', help="Vô hiệu hóa (hoặc xóa) hàng loạt mã đã hết hạn")
+    p.add_argument('--purge', action='store_true', help="Xóa hẳn thay vì vô hiệu hóa")
+    p.add_argument('--grace-days', type=int, default=0, help="Chỉ dọn mã hết hạn quá N ngày")
+    p.add_argument('--dry-run', action='store_true', help="Chỉ đếm, không ghi")
+    p.set_defaults(func=cmd_codes_sweep)
+
+    # ----- data -----
+    data = groups.add_parser('data', help="Sao lưu / khôi phục dữ liệu").add_subparsers(dest='command', required=True)
+    tree_choices = ['reward_codes', 'reward_codes_claimed', 'mailbox']
+
+    p = data.add_parser('export', help="Export ra NDJSON (.gz / .zst) hoặc .parquet, đọc theo trang")
+    p.add_argument('path', help="File snapshot (VD: backup.ndjson.gz)")
+    p.add_argument('--trees', nargs='+', choices=tree_choices, help="Chỉ export các cây này (mặc định tất cả)")
+    p.set_defaults(func=cmd_data_export)
+
+    p = data.add_parser('import', help="Ghi lại snapshot (giữ nguyên document ID và kiểu thời gian)")
+    p.add_argument('path', help="File snapshot")
+    p.add_argument('--trees', nargs='+', choices=tree_choices, help="Chỉ import các cây này (mặc định tất cả)")
+    p.add_argument('--max-in-flight', type=_positive_int, default=8, help="Số batch ghi song song")
+    p.add_argument('--dry-run', action='store_true', help="Chỉ đọc và đếm, không ghi")
+    p.set_defaults(func=cmd_data_import)
+
+    # ----- service -----
+    service = groups.add_parser('service', help="Service quản trị (HTTP cục bộ)").add_subparsers(dest='command', required=True)
+
+    p = service.add_parser('run', help="Chạy service giữ Firestore client, nhận lệnh qua HTTP")
+    p.add_argument('--host', default='127.0.0.1', help="Địa chỉ nghe (mặc định 127.0.0.1)")
+    p.add_argument('--port', type=int, default=8787, help="Cổng (mặc định 8787)")
+    p.add_argument('--unix', metavar='PATH', help="Nghe trên Unix socket thay vì TCP")
+    p.set_defaults(func=cmd_service_run)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if getattr(args, 'max_claims', False) is None:
+        args.max_claims = 1 if args.count else 0
+    from instrumentation import run_metrics
+    try:
+        with run_metrics(args.metrics_json, args.metrics_prom, args.profile, args.tracemalloc,
+                         labels={'command': f"{args.group} {args.command}"}):
+            return args.func(args)
+    except ModuleNotFoundError as e:
+        package = e.name.split('.')[0] if e.name.startswith(('zstandard', 'pyarrow')) else 'firebase-admin'
+        print(f"❌ Thiếu thư viện '{e.name}' - chạy: pip install {package}")
+        return 2
+    except FileNotFoundError as e:
+        print(f"❌ Không tìm thấy file: {e.filename}")
+        return 2
+    except KeyboardInterrupt:
+        print("\n⏹ Đã dừng")
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
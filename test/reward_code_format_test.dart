@@ -0,0 +1,38 @@
+import 'dart:convert';
+import 'dart:io';
+
+import 'package:flutter_test/flutter_test.dart';
+import 'package:tvu_app/features/gamification/modules/reward_code/utils/reward_code_format.dart';
+
+/// Vector dùng chung với scripts/tests/test_reward_code_format.py (script tạo mã)
+/// để app và script chắc chắn cùng thuật toán ký tự kiểm tra
+void main() {
+  final vectors = jsonDecode(
+    File('test/fixtures/reward_code_vectors.json').readAsStringSync(),
+  ) as Map<String, dynamic>;
+
+  group('RewardCodeFormat', () {
+    test('ký tự kiểm tra khớp với script Python', () {
+      for (final vector in vectors['check_char'] as List) {
+        final body = '${vector['payload']}${vector['check']}';
+        expect(RewardCodeFormat.isValidBody(body), isTrue, reason: body);
+      }
+    });
+
+    test('từ chối thân mã sai', () {
+      for (final body in vectors['invalid_bodies'] as List) {
+        expect(RewardCodeFormat.isValidBody(body as String), isFalse, reason: body);
+      }
+    });
+
+    test('normalize khớp với normalize_code bên Python', () {
+      for (final vector in vectors['normalize'] as List) {
+        expect(
+          RewardCodeFormat.normalize(vector['input'] as String),
+          vector['expected'],
+          reason: vector['input'] as String,
+        );
+      }
+    });
+  });
+}